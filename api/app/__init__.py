@@ -1,22 +1,37 @@
 import os
-from typing import Optional, Sequence, Union
+from typing import Any, Dict, List, Optional, Sequence, Union
 
-from elasticsearch import Elasticsearch
-from fastapi import Request
+from elasticsearch import AsyncElasticsearch
+from fastapi import HTTPException, Request, Response
 from pydantic import BaseModel, Field
 
 from src.concept import Concept
 from src.document import Document
+from src.search.cache import QueryCache
 
 default_page_size = 10
-elasticsearch_instance = Elasticsearch(
+# the maximum number of items which can be fetched by id in one request
+max_batch_size = 100
+# searches are awaited, so each worker can have as many requests in flight to each
+# elasticsearch node as there are connections in the pool
+elasticsearch_instance = AsyncElasticsearch(
     hosts=[os.getenv("ELASTICSEARCH_URL", "localhost:9200")],
     timeout=30,
     max_retries=10,
     retry_on_timeout=True,
+    connections_per_node=int(os.getenv("ELASTICSEARCH_CONNECTIONS_PER_NODE", 32)),
 )
 
 
+def query_cache() -> QueryCache:
+    """Create a cache for a search engine's results, configured from the environment"""
+    return QueryCache(
+        max_size=int(os.getenv("QUERY_CACHE_SIZE", 1024)),
+        max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        ttl=float(os.getenv("QUERY_CACHE_TTL", 300)),
+    )
+
+
 class APIResponse(BaseModel):
     totalResults: int = Field(
         ...,
@@ -31,11 +46,73 @@ class APIResponse(BaseModel):
     previousPage: Optional[str] = Field(
         None, description="The URL for the previous page of results"
     )
-    results: Sequence[Union[Document, Concept]] = Field(
-        ..., description="The results for the current page"
+    results: Sequence[Union[Dict[str, Any], Document, Concept]] = Field(
+        ...,
+        description=(
+            "The results for the current page. If only some fields were requested, "
+            "each result contains only those fields"
+        ),
     )
 
 
+def json_response(model: BaseModel) -> Response:
+    """
+    Serialise a model straight to a json response.
+
+    FastAPI would otherwise dump the model to a dict, validate it against the route's
+    response_model, and then serialise it. The search engines build their results
+    from data which was validated before it was indexed, so that round trip is
+    skipped. Routes should still declare a response_model for the API docs.
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+
+def parse_list(values: Optional[str]) -> List[str]:
+    """
+    Split a comma-separated query parameter into its values.
+
+    :param Optional[str] values: The values, eg "68t56e7d, vfbhyncy"
+    :return List[str]: The values, with surrounding whitespace stripped and empty
+    values dropped
+    """
+    if not values:
+        return []
+    return [value.strip() for value in values.split(",") if value.strip()]
+
+
+def parse_fields(fields: str) -> Optional[List[str]]:
+    """
+    Split a comma-separated list of the fields to include in each result.
+
+    :param str fields: The fields, eg "id,title", or "*" for every field
+    :raises HTTPException: If no fields are given
+    :return Optional[List[str]]: The fields, or None for every field
+    """
+    if fields.strip() == "*":
+        return None
+    parsed_fields = parse_list(fields)
+    if not parsed_fields:
+        raise HTTPException(status_code=400, detail="At least one field is required")
+    return parsed_fields
+
+
+def parse_batch_ids(ids: str) -> List[str]:
+    """
+    Split a comma-separated list of ids for a batch request.
+
+    :param str ids: The ids, eg "68t56e7d,vfbhyncy"
+    :raises HTTPException: If there are more than max_batch_size ids
+    :return List[str]: The ids
+    """
+    parsed_ids = parse_list(ids)
+    if len(parsed_ids) > max_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Can't fetch more than {max_batch_size} items at once",
+        )
+    return parsed_ids
+
+
 def get_base_url(request: Request) -> str:
     return request.url.scheme + "://" + request.url.netloc + request.url.path
 
@@ -50,6 +127,16 @@ def get_next_page_url(base_url: str, page: int, page_size: int, **kwargs) -> str
     return base_url + "?" + "&".join(f"{k}={v}" for k, v in kwargs.items() if v)
 
 
+def get_cursor_page_url(base_url: str, cursor: str, page_size: int, **kwargs) -> str:
+    kwargs["cursor"] = cursor
+    if page_size != default_page_size:
+        kwargs["pageSize"] = page_size
+    for key, value in list(kwargs.items()):
+        if isinstance(value, list):
+            kwargs[key] = ",".join(value)
+    return base_url + "?" + "&".join(f"{k}={v}" for k, v in kwargs.items() if v)
+
+
 def get_previous_page_url(base_url: str, page: int, page_size: int, **kwargs) -> str:
     kwargs["page"] = page - 1
     if page_size != default_page_size:
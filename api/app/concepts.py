@@ -1,8 +1,10 @@
-from elasticsearch import NotFoundError
-from fastapi import APIRouter, HTTPException, Query, Request
+import os
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 
 from src.concept import Concept
-from src.search.core import ConceptSearchEngine
+from src.search.core import AsyncConceptSearchEngine
+from src.search.registry import ConceptRegistry
 
 from . import (
     APIResponse,
@@ -10,42 +12,78 @@ from . import (
     get_base_url,
     get_next_page_url,
     get_previous_page_url,
+    json_response,
+    max_batch_size,
+    parse_batch_ids,
 )
 
 router = APIRouter(prefix="/concepts")
 
-search_engine = ConceptSearchEngine(
+search_engine = AsyncConceptSearchEngine(
     elasticsearch=elasticsearch_instance, index_name="concepts"
 )
 
+# concepts are served from memory. They're loaded from the processed concept files if
+# CONCEPTS_DIR is set, and otherwise from a snapshot of the concepts index. The app
+# keeps the registry up to date in the background (see main.lifespan)
+registry = (
+    ConceptRegistry(directory=os.environ["CONCEPTS_DIR"])
+    if os.getenv("CONCEPTS_DIR")
+    else ConceptRegistry(search_engine=search_engine)
+)
+
 
-@router.get("/")
+@router.get("/", response_model=APIResponse)
 async def get_concepts(
     request: Request,
     page: int = Query(1, ge=1, description="The page number to return"),
     pageSize: int = Query(
         10, ge=1, le=100, description="The number of items to return"
     ),
-    query: str = Query(None, description="Search terms for full-text search"),
-) -> APIResponse:
+    query: str = Query(
+        None,
+        description=(
+            "Search terms, matched against the start of the words in each concept's "
+            "labels and description"
+        ),
+    ),
+) -> Response:
     base_url = get_base_url(request)
     next_page = get_next_page_url(base_url, page, pageSize, query=query)
     previous_page = get_previous_page_url(base_url, page, pageSize, query=query)
-    search_response = search_engine.search(query, page, pageSize)
+    search_response = registry.search(query, page, pageSize)
 
-    return APIResponse(
-        totalResults=search_response.total,
-        nextPage=next_page if search_response.total > page * pageSize else None,
-        previousPage=previous_page if page > 1 else None,
-        results=search_response.results,
+    return json_response(
+        APIResponse(
+            totalResults=search_response.total,
+            nextPage=next_page if search_response.total > page * pageSize else None,
+            previousPage=previous_page if page > 1 else None,
+            results=search_response.results,
+        )
     )
 
 
-@router.get("/{identifier}")
-async def get_concept(identifier: str) -> Concept:
+# declared before /{identifier}, which would otherwise treat "batch" as an id
+@router.get("/batch", response_model=APIResponse)
+async def get_concepts_batch(
+    ids: str = Query(
+        ...,
+        description=(
+            "The IDs of the concepts to fetch, as a comma-separated list of up to "
+            f"{max_batch_size}. IDs which don't exist are skipped."
+        ),
+        example="68t56e7d,vfbhyncy",
+    ),
+) -> Response:
+    concepts = registry.get_items(parse_batch_ids(ids))
+    return json_response(APIResponse(totalResults=len(concepts), results=concepts))
+
+
+@router.get("/{identifier}", response_model=Concept)
+async def get_concept(identifier: str) -> Response:
     try:
-        return search_engine.get_item(identifier)
-    except NotFoundError as e:
+        return json_response(registry.get_item(identifier))
+    except KeyError as e:
         raise HTTPException(
             status_code=404, detail=f"Concept {identifier} not found"
         ) from e
@@ -1,28 +1,71 @@
-from typing import Optional
+import json
+from typing import AsyncIterator, Optional
 
 from elasticsearch import NotFoundError
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from src.document import Document
-from src.search.core import DocumentSearchEngine
+from src.search.core import AsyncDocumentSearchEngine, document_fields
 
 from . import (
     APIResponse,
     default_page_size,
     elasticsearch_instance,
     get_base_url,
+    get_cursor_page_url,
     get_next_page_url,
     get_previous_page_url,
+    json_response,
+    max_batch_size,
+    parse_batch_ids,
+    parse_fields,
+    parse_list,
+    query_cache,
 )
 
 router = APIRouter(prefix="/documents")
 
-search_engine = DocumentSearchEngine(
-    elasticsearch=elasticsearch_instance, index_name="documents"
+search_engine = AsyncDocumentSearchEngine(
+    elasticsearch=elasticsearch_instance, index_name="documents", cache=query_cache()
 )
 
+# full documents include the whole text and every span, so search results only
+# include a few lightweight fields unless more are requested
+default_fields = "id,title,summary,concepts"
 
-@router.get("/")
+# parameters which are shared by the search and export routes
+concepts_description = (
+    "Filter documents by the IDs of the concepts that they mention. If multiple "
+    "concept IDs are provided, documents may contain any of the concepts, ie. the "
+    "filter is treated as an OR operation. Concept IDs should be provided as a "
+    "comma-separated list."
+)
+concepts_examples = {
+    "filter_by_a_single_concept": {
+        "summary": "Filter by a single concept",
+        "value": "68t56e7d",
+    },
+    "filter_by_multiple_concepts": {
+        "summary": "Filter by multiple concepts",
+        "value": "68t56e7d,vfbhyncy",
+    },
+}
+fields_description = (
+    "The fields to include in each result, as a comma-separated list. Use * to return "
+    "full documents, including their text and spans. Available fields are: "
+    f"{', '.join(document_fields)}"
+)
+fields_examples = {
+    "default_fields": {
+        "summary": "Lightweight fields for search listings",
+        "value": default_fields,
+    },
+    "full_documents": {"summary": "Full documents", "value": "*"},
+}
+
+
+@router.get("/", response_model=APIResponse)
 async def get_documents(
     request: Request,
     page: int = Query(default=1, ge=1, description="The page number to return"),
@@ -36,49 +79,153 @@ async def get_documents(
         None, description="Search terms for full-text search", example="covid-19"
     ),
     concepts: Optional[str] = Query(
+        default=None,
+        description=concepts_description,
+        openapi_examples=concepts_examples,
+    ),
+    fields: str = Query(
+        default=default_fields,
+        description=fields_description,
+        openapi_examples=fields_examples,
+    ),
+    cursor: Optional[str] = Query(
         default=None,
         description=(
-            "Filter documents by the IDs of the concepts that they mention. If "
-            "multiple concept IDs are provided, documents may contain any of the "
-            "concepts, ie. the filter is treated as an OR operation. Concept IDs "
-            "should be provided as a comma-separated list."
+            "Page through the results with a cursor, rather than by page number. "
+            "Every page costs the same to fetch with a cursor, however deep it is, so "
+            "use one to page through large result sets. Use * to fetch the first "
+            "page, then follow nextPage, which carries the cursor for the page after "
+            "it. Cursors expire if they're not used for a minute. page is ignored "
+            "when a cursor is set."
         ),
         openapi_examples={
-            "filter_by_a_single_concept": {
-                "summary": "Filter by a single concept",
-                "value": "68t56e7d",
-            },
-            "filter_by_multiple_concepts": {
-                "summary": "Filter by multiple concepts",
-                "value": "68t56e7d,vfbhyncy",
+            "start_paging_with_a_cursor": {
+                "summary": "Start paging with a cursor",
+                "value": "*",
             },
         },
     ),
-) -> APIResponse:
-    parsed_concepts = concepts.split(",") if concepts else []
+) -> Response:
+    parsed_concepts = parse_list(concepts)
+    parsed_fields = parse_fields(fields)
+    # only include fields in the page links if they aren't the default
+    linked_fields = None if fields == default_fields else fields
+    try:
+        search_response = await search_engine.search(
+            search_terms=query,
+            page=page,
+            page_size=pageSize,
+            concepts=parsed_concepts,
+            fields=parsed_fields,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
     base_url = get_base_url(request)
-    next_page = get_next_page_url(
-        base_url, page, pageSize, query=query, concepts=concepts
-    )
-    previous_page = get_previous_page_url(
-        base_url, page, pageSize, query=query, concepts=concepts
-    )
-    search_response = search_engine.search(
-        search_terms=query, page=page, page_size=pageSize, concepts=parsed_concepts
-    )
+    links = {"query": query, "concepts": concepts, "fields": linked_fields}
+    if cursor is not None:
+        # cursors only go forwards
+        next_page = (
+            get_cursor_page_url(
+                base_url, search_response.next_cursor, pageSize, **links
+            )
+            if search_response.next_cursor
+            else None
+        )
+        previous_page = None
+    else:
+        next_page = (
+            get_next_page_url(base_url, page, pageSize, **links)
+            if search_response.total > page * pageSize
+            else None
+        )
+        previous_page = (
+            get_previous_page_url(base_url, page, pageSize, **links)
+            if page > 1
+            else None
+        )
 
-    return APIResponse(
-        totalResults=search_response.total,
-        nextPage=next_page if search_response.total > page * pageSize else None,
-        previousPage=previous_page if page > 1 else None,
-        results=search_response.results,
+    return json_response(
+        APIResponse(
+            totalResults=search_response.total,
+            nextPage=next_page,
+            previousPage=previous_page,
+            results=search_response.results,
+        )
     )
 
 
-@router.get("/{identifier}")
-async def get_document(identifier: str) -> Document:
+# declared before /{identifier}, which would otherwise treat "batch" as an id
+@router.get("/batch", response_model=APIResponse)
+async def get_documents_batch(
+    ids: str = Query(
+        ...,
+        description=(
+            "The IDs of the documents to fetch, as a comma-separated list of up to "
+            f"{max_batch_size}. IDs which don't exist are skipped."
+        ),
+        example="2sgknw32,gg7h2j2s",
+    ),
+    fields: str = Query(
+        default=default_fields,
+        description=fields_description,
+        openapi_examples=fields_examples,
+    ),
+) -> Response:
+    try:
+        documents = await search_engine.get_items(
+            parse_batch_ids(ids), fields=parse_fields(fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return json_response(APIResponse(totalResults=len(documents), results=documents))
+
+
+# declared before /{identifier}, which would otherwise treat "export" as an id
+@router.get("/export", response_class=StreamingResponse)
+async def export_documents(
+    query: str = Query(
+        None, description="Search terms for full-text search", example="covid-19"
+    ),
+    concepts: Optional[str] = Query(
+        default=None,
+        description=concepts_description,
+        openapi_examples=concepts_examples,
+    ),
+    fields: str = Query(
+        default=default_fields,
+        description=fields_description,
+        openapi_examples=fields_examples,
+    ),
+) -> StreamingResponse:
+    """
+    Stream every document which matches a search as newline-delimited json, rather
+    than paging through them.
+    """
+    try:
+        documents = search_engine.export(
+            search_terms=query,
+            concepts=parse_list(concepts),
+            fields=parse_fields(fields),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    async def lines() -> AsyncIterator[str]:
+        async for document in documents:
+            if isinstance(document, Document):
+                yield document.model_dump_json() + "\n"
+            else:
+                yield json.dumps(document) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/{identifier}", response_model=Document)
+async def get_document(identifier: str) -> Response:
     try:
-        return search_engine.get_item(identifier)
+        return json_response(await search_engine.get_item(identifier))
     except NotFoundError as e:
         raise HTTPException(
             status_code=404, detail=f"Document {identifier} not found"
@@ -1,12 +1,35 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import Dict
+
 from fastapi import FastAPI, HTTPException
 
+from src.search.cache import CacheStats
+
 from . import concepts, documents, elasticsearch_instance
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for search_engine in [concepts.search_engine, documents.search_engine]:
+        await search_engine.ensure_index()
+    await concepts.registry.refresh(force=True)
+    # reloading happens off the request path, so concept requests never wait for
+    # (or fail because of) the registry's source
+    watcher = asyncio.create_task(concepts.registry.watch())
+    yield
+    watcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await watcher
+    await elasticsearch_instance.close()
+
+
 app = FastAPI(
     title="Employment Appeal Tribunals API",
     version="0.1.0",
     description="API for querying employment appeal tribunal decisions",
     docs_url="/",
+    lifespan=lifespan,
 )
 
 
@@ -16,13 +39,13 @@ app.include_router(documents.router)
 
 @app.get("/health-check")
 async def health_check() -> dict:
-    if not elasticsearch_instance.ping():
+    if not await elasticsearch_instance.ping():
         raise HTTPException(status_code=503, detail="Service unavailable")
 
     missing_indices = [
         index
         for index in ["concepts", "documents"]
-        if not elasticsearch_instance.indices.exists(index=index)
+        if not await elasticsearch_instance.indices.exists(index=index)
     ]
 
     if missing_indices:
@@ -31,3 +54,12 @@ async def health_check() -> dict:
         raise HTTPException(status_code=503, detail="Service unavailable")
 
     return {"status": "ok"}
+
+
+@app.get("/cache-stats")
+async def cache_stats() -> Dict[str, CacheStats]:
+    """
+    Hit and miss counts for each search engine's cache of recent results. Concepts
+    are served from memory, so they aren't cached
+    """
+    return {"documents": documents.search_engine.cache.stats()}
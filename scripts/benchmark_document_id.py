@@ -0,0 +1,52 @@
+"""
+Benchmark reading Document.id on large documents.
+
+Compares reading the cached id against hashing the document from scratch on every
+read, which is what Document.id used to do. Uses a synthetic decision-sized document,
+with a few sizes to show how the cost of hashing grows with the length of the text.
+"""
+
+import timeit
+
+from rich import box, table
+from rich.console import Console
+
+from src.document import Document
+from src.identifiers import pretty_hash
+
+console = Console()
+
+n_reads = 1000
+results = table.Table(box=box.ROUNDED)
+results.add_column("Text length", justify="right")
+results.add_column(f"Uncached ({n_reads} reads)", justify="right")
+results.add_column(f"Cached ({n_reads} reads)", justify="right")
+results.add_column("Speedup", justify="right")
+
+for n_characters in [10_000, 100_000, 1_000_000]:
+    text = ("The claimant was unfairly dismissed. " * n_characters)[:n_characters]
+    document = Document(title="benchmark", text=text, parse_sentences=False)
+
+    def uncached():
+        return pretty_hash(
+            {
+                "title": document.title,
+                "text": document.text,
+                "n_pages": len(document.page_spans),
+            }
+        )
+
+    def cached():
+        return document.id
+
+    assert uncached() == cached()
+    uncached_time = timeit.timeit(uncached, number=n_reads)
+    cached_time = timeit.timeit(cached, number=n_reads)
+    results.add_row(
+        f"{n_characters:,}",
+        f"{uncached_time * 1000:.1f}ms",
+        f"{cached_time * 1000:.1f}ms",
+        f"{uncached_time / cached_time:.0f}x",
+    )
+
+console.print(results)
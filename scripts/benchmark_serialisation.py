@@ -0,0 +1,84 @@
+"""
+Benchmark loading and saving documents.
+
+Compares the old way of loading documents (json.load, then validating the dict with
+Document(**data)) against parsing and validating the bytes in one pass with pydantic,
+against the trusted path which skips validation entirely, and against scanning the
+same documents from a columnar corpus (see src.corpus). Also compares saving documents
+with and without indentation. Uses a sample of the processed decisions in
+data/processed/documents, so run it after classify_documents.py.
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import typer
+from rich import box, table
+from rich.console import Console
+
+from src.corpus import Corpus
+from src.document import Document
+
+console = Console()
+documents_dir = Path("data/processed/documents")
+
+
+def old_load(file: Path) -> Document:
+    with open(file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return Document(**data)
+
+
+def main(
+    n_documents: int = typer.Option(200, help="The number of documents to sample"),
+):
+    files = sorted(documents_dir.glob("*.json"))[:n_documents]
+    if not files:
+        console.print(f"❌ No documents found in {documents_dir}", style="red")
+        raise typer.Exit(1)
+    documents = [Document.load(file) for file in files]
+    n_bytes = sum(file.stat().st_size for file in files)
+    console.print(
+        f"📄 Sampled {len(files)} documents ({n_bytes / 1e6:.1f}MB)", style="green"
+    )
+
+    def throughput(function, items) -> str:
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        return f"{len(items) / (time.perf_counter() - start):,.0f} docs/s"
+
+    results = table.Table(box=box.ROUNDED)
+    results.add_column("Operation")
+    results.add_column("Throughput", justify="right")
+    results.add_column("Size on disk", justify="right")
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for name, indent in [("indented", 2), ("compact", None)]:
+            paths = [
+                Path(temporary_directory) / f"{i}_{name}.json"
+                for i in range(len(documents))
+            ]
+            speed = throughput(
+                lambda item: item[0].save(item[1], indent=indent),
+                list(zip(documents, paths)),
+            )
+            size = sum(path.stat().st_size for path in paths)
+            results.add_row(f"save ({name})", speed, f"{size / 1e6:.1f}MB")
+
+    results.add_row("load (json.load + Document(**data))", throughput(old_load, files))
+    results.add_row("load (model_validate_json)", throughput(Document.load, files))
+    results.add_row(
+        "load (trusted)",
+        throughput(lambda file: Document.load(file, trusted=True), files),
+    )
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        corpus = Corpus.write(documents, Path(temporary_directory) / "corpus")
+        results.add_row("load (corpus)", throughput(corpus.load, range(len(corpus))))
+    console.print(results)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,51 @@
+"""
+Build a columnar corpus from the processed documents.
+
+Reads every document in data/processed/documents and writes them all to a single
+memory-mapped corpus in data/processed/corpus (see src.corpus.Corpus). Loading
+documents from the corpus is much faster than parsing thousands of individual json
+files, so scripts which read the whole set of documents use the corpus instead.
+Documents which haven't already been split into sentences are split in batches (using
+--workers processes) on the way in, so every document in the corpus has its sentences.
+
+Re-run this script whenever the processed documents change, eg after classifying
+documents or generating summaries.
+"""
+
+from pathlib import Path
+
+import typer
+from rich.console import Console
+from rich.progress import track
+
+from src.corpus import Corpus
+from src.document import iter_documents, segment_sentences
+
+console = Console()
+
+data_dir = Path("data/processed")
+documents_dir = data_dir / "documents"
+corpus_dir = data_dir / "corpus"
+
+
+def main(
+    workers: int = typer.Option(
+        1, help="The number of processes to split documents into sentences with"
+    ),
+):
+    n_documents = len(list(documents_dir.glob("*.json")))
+    documents = track(
+        segment_sentences(
+            iter_documents(documents_dir, trusted=True), n_process=workers
+        ),
+        total=n_documents,
+        description="📚 Writing documents to the corpus",
+        console=console,
+        transient=True,
+    )
+    corpus = Corpus.write(documents, corpus_dir)
+    console.print(f"✅ Wrote {len(corpus)} documents to {corpus_dir}", style="green")
+
+
+if __name__ == "__main__":
+    typer.run(main)
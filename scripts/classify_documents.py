@@ -4,70 +4,167 @@ Use a set of Classifiers to find concepts in documents.
 The pre-trained classifiers are loaded from data/models and the documents are loaded
 from data/raw/text. After classification, the documents with concepts are saved in
 data/processed/documents and the concepts are saved in data/processed/concepts.
+Sentence embeddings are cached in data/embeddings, so re-running the script after
+adding a concept doesn't mean re-embedding the whole corpus.
+
+Documents are classified in parallel by a pool of worker processes. Each worker loads
+the classifiers once and is sent documents in chunks, so that their sentences can be
+split in batches. Classified documents are saved as soon as they're returned. A
+document which fails to load or classify is logged and skipped, and a summary of any
+failures is shown at the end of the run.
 
 This script assumes that documents have been parsed using the parse_pdfs.py script, and
 that classifiers have been created/trained using the train_classifiers.py script.
 """
 
+import os
+from multiprocessing import Pool
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
+import typer
 from rich.console import Console
 from rich.progress import track
 
-from src.classifiers import Classifier
-from src.document import Document
+from src.classifiers import (
+    Classifier,
+    MultiConceptEmbeddingClassifier,
+    combine_classifiers,
+)
+from src.document import Document, segment_sentences
+from src.logging import get_logger
 
+logger = get_logger(__name__)
 console = Console()
 data_dir = Path("./data")
-
 model_dir = data_dir / "models"
-model_paths = list(model_dir.glob("*.pkl"))
-classifiers = [
-    Classifier.load(file)
-    for file in track(
-        model_paths, description="Loading classifiers", console=console, transient=True
-    )
-]
-console.print(f"🤖 Loaded {len(classifiers)} classifiers", style="green")
-
+embeddings_dir = data_dir / "embeddings"
 raw_text_dir = data_dir / "raw" / "text"
-document_paths = list(raw_text_dir.glob("*.json"))[:250]
-documents = [
-    Document.load_raw(file, parse_sentences=True)
-    for file in track(
-        document_paths, description="Loading documents", console=console, transient=True
-    )
-]
-console.print(f"📄 Loaded {len(documents)} documents", style="green")
-
-n_documents_with_concepts = 0
-n_concepts_found = 0
-for document in track(
-    documents,
-    description="Searching for concepts in documents",
-    console=console,
-    transient=True,
-):
+documents_dir = data_dir / "processed" / "documents"
+
+# set in each worker process by load_classifiers
+classifiers: List[Classifier] = []
+
+
+def load_classifiers(model_paths: List[Path], n_threads: int):
+    """
+    Load the classifiers into a worker process, combining them where possible.
+
+    :param List[Path] model_paths: The paths of the pickled classifiers
+    :param int n_threads: The number of threads each worker should use for inference
+    """
+    global classifiers
+    classifiers = combine_classifiers([Classifier.load(path) for path in model_paths])
     for classifier in classifiers:
-        spans = classifier.predict(document)
-        document.concept_spans.extend(spans)
-    if document.concept_spans:
-        n_documents_with_concepts += 1
-        n_concepts_found += len(document.concept_spans)
-
-console.print(
-    f"🔍 Found {n_concepts_found} concepts in {n_documents_with_concepts} documents",
-    style="green",
-)
+        if isinstance(classifier, MultiConceptEmbeddingClassifier):
+            classifier.encoder.n_threads = n_threads
+            # sentence embeddings are kept between runs, so only new sentences need
+            # to be embedded
+            classifier.encoder.use_store(embeddings_dir)
 
-documents_dir = data_dir / "processed" / "documents"
-documents_dir.mkdir(parents=True, exist_ok=True)
-for file in documents_dir.glob("*"):
-    file.unlink()
-for document in track(
-    documents,
-    description="Saving documents with concepts",
-    console=console,
-    transient=True,
+
+def classify_documents(
+    files: List[Path],
+) -> Tuple[List[Document], Dict[Path, str]]:
+    """
+    Find concepts in a chunk of documents, in a worker process.
+
+    Failures are caught for each document, so that one bad document doesn't lose the
+    rest of its chunk or stop the run.
+
+    :param List[Path] files: The raw text files of the documents
+    :return Tuple[List[Document], Dict[Path, str]]: The classified documents, and a
+    description of the error for each file which couldn't be classified
+    """
+    documents, failures = {}, {}
+    for file in files:
+        try:
+            documents[file] = Document.load_raw(file)
+        except Exception as e:
+            failures[file] = f"{type(e).__name__}: {e}"
+    try:
+        list(segment_sentences(documents.values()))
+    except Exception:
+        # documents which weren't segmented will segment themselves when their
+        # sentences are first needed, so their failures are caught individually below
+        logger.exception("Failed to segment a chunk of documents in one batch")
+
+    classified_documents = []
+    for file, document in documents.items():
+        try:
+            for classifier in classifiers:
+                spans = classifier.predict(document)
+                document.concept_spans.extend(spans)
+        except Exception as e:
+            failures[file] = f"{type(e).__name__}: {e}"
+        else:
+            classified_documents.append(document)
+    for file, error in failures.items():
+        logger.error(f"Failed to classify {file.stem}: {error}")
+    return classified_documents, failures
+
+
+def main(
+    workers: int = typer.Option(
+        os.cpu_count() or 1, help="The number of worker processes to classify with"
+    ),
+    limit: Optional[int] = typer.Option(
+        None, help="Only classify the first N documents"
+    ),
+    chunk_size: int = typer.Option(
+        16, help="The number of documents to send to a worker at a time"
+    ),
 ):
-    document.save(documents_dir / f"{document.id}.json")
+    model_paths = list(model_dir.glob("*.pkl"))
+    console.print(f"🤖 Found {len(model_paths)} classifiers", style="green")
+
+    document_paths = sorted(raw_text_dir.glob("*.json"))[:limit]
+    console.print(f"📄 Found {len(document_paths)} documents", style="green")
+
+    documents_dir.mkdir(parents=True, exist_ok=True)
+    for file in documents_dir.glob("*"):
+        file.unlink()
+
+    chunks = [
+        document_paths[i : i + chunk_size]
+        for i in range(0, len(document_paths), chunk_size)
+    ]
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    n_documents_with_concepts = 0
+    n_concepts_found = 0
+    n_saved = 0
+    failures = {}
+    with Pool(
+        processes=workers,
+        initializer=load_classifiers,
+        initargs=(model_paths, n_threads),
+    ) as pool:
+        for documents, chunk_failures in track(
+            pool.imap_unordered(classify_documents, chunks),
+            total=len(chunks),
+            description="Searching for concepts in documents",
+            console=console,
+            transient=True,
+        ):
+            failures.update(chunk_failures)
+            for document in documents:
+                document.save(documents_dir / f"{document.id}.json")
+                n_saved += 1
+                if document.concept_spans:
+                    n_documents_with_concepts += 1
+                    n_concepts_found += len(document.concept_spans)
+
+    console.print(
+        f"🔍 Found {n_concepts_found} concepts in {n_documents_with_concepts} "
+        "documents",
+        style="green",
+    )
+    console.print(f"💾 Saved {n_saved} documents to {documents_dir}")
+    if failures:
+        console.print(f"❌ Failed to classify {len(failures)} documents", style="red")
+        for file, error in failures.items():
+            console.print(f"  {file.name}: {error}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
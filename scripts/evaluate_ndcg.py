@@ -2,9 +2,9 @@ import json
 from pathlib import Path
 
 from elasticsearch import Elasticsearch
-from rich import box, console, progress, table
+from rich import box, console, table
 
-from src.document import Document
+from src.document import iter_documents
 from src.evaluation.ndcg import NDCG
 from src.search.core import DocumentSearchEngine
 
@@ -12,24 +12,20 @@ console = console.Console()
 
 data_dir = Path("data/processed")
 document_dir = data_dir / "documents"
-document_files = list(document_dir.glob("*.json"))
-documents = [
-    Document.load(file, parse_sentences=False)
-    for file in progress.track(
-        document_files, description="Loading documents", transient=True
-    )
-]
-console.print(f"📄 Loaded {len(documents)} documents")
 
 # create an elasticsearch instance for the search engine
 es = Elasticsearch(hosts=[{"host": "localhost", "port": 9200, "scheme": "http"}])
 
-# create a search engine instance and populate it with documents
+# create a search engine instance and populate it with documents if it's empty
 index_name = "documents"
 search_engine = DocumentSearchEngine(elasticsearch=es, index_name="documents")
-console.print(f"🚚 Indexing documents in '{index_name}'")
-if not search_engine.elasticsearch.indices.exists(index=index_name):
-    search_engine.add_documents(documents=documents, progress_bar=True)
+if es.count(index=index_name)["count"] == 0:
+    console.print(f"🚚 Indexing documents in '{index_name}'")
+    response = search_engine.insert_items(
+        iter_documents(document_dir, parse_sentences=False), progress_bar=True
+    )
+    es.indices.refresh(index=index_name)
+    console.print(f"📄 Indexed {response.n_succeeded} documents")
 
 # load the relevance judgements
 with open("data/eval/relevance/judgements.json", "r") as f:
@@ -13,7 +13,7 @@ from dotenv import load_dotenv
 from rich.console import Console
 from rich.progress import track
 
-from src.document import Document
+from src.document import iter_documents
 
 console = Console()
 
@@ -21,12 +21,8 @@ load_dotenv()
 
 data_dir = Path("data")
 documents_dir = data_dir / "processed" / "documents"
-file_paths = list(documents_dir.glob("*.json"))
-documents = [
-    Document.load(file, parse_sentences=False)
-    for file in track(file_paths, description="📄 Loading documents...", transient=True)
-]
-console.print(f"📄 Loaded {len(documents)} documents", style="green")
+n_documents = len(list(documents_dir.glob("*.json")))
+console.print(f"📄 Found {n_documents} documents", style="green")
 
 client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
@@ -39,7 +35,7 @@ def generate_summary(text: str) -> str:
             temperature=0,
             system="Provide a one-paragraph blurb/description/summary for a document.",
             messages=[
-                {"role": "user", "content": [{"type": "text", "text": document.text}]},
+                {"role": "user", "content": [{"type": "text", "text": text}]},
                 {
                     "role": "assistant",
                     "content": [
@@ -55,8 +51,10 @@ def generate_summary(text: str) -> str:
         return generate_summary(text)
 
 
+n_summarized = 0
 for document in track(
-    documents,
+    iter_documents(documents_dir, parse_sentences=False),
+    total=n_documents,
     description="🤓 Reading documents and writing summaries...",
     transient=True,
 ):
@@ -64,8 +62,9 @@ for document in track(
         continue
     document.summary = generate_summary(document.text)
     document.save(documents_dir / f"{document.id}.json")
+    n_summarized += 1
 
 console.print(
-    f"🤓 Summarized {len(documents)} documents and saved them to {documents_dir}",
+    f"🤓 Summarized {n_summarized} documents and saved them to {documents_dir}",
     style="green",
 )
@@ -1,64 +1,28 @@
 """
 Index concepts into elasticsearch.
 
-This script reads the raw text files from the data/processed/concepts directory, and
-indexes them into an index called "concepts" in a locally running elasticsearch cluster.
+This script reads the processed concepts from the data/processed/concepts directory, and
+indexes them into an index called "concepts" in a locally running elasticsearch cluster,
+using the settings and mappings defined by the ConceptSearchEngine.
+
+By default, the index is synced incrementally: only new or changed concepts are sent to
+elasticsearch, and concepts which no longer exist are deleted from the index. Running
+with --rebuild bulk-loads every concept into a fresh index instead, and switches
+"concepts" over to it as an alias once the load is complete, so the API can keep serving
+searches while the index is rebuilt.
 """
 
 from pathlib import Path
 
+import typer
 from elasticsearch import Elasticsearch
 from rich.console import Console
-from rich.progress import track
 
 from src.concept import Concept
+from src.search.core import ConceptSearchEngine, ReindexError
 
 console = Console()
 
-settings = {
-    "analysis": {
-        "analyzer": {
-            "english_analyzer": {
-                "type": "custom",
-                "tokenizer": "standard",
-                "filter": [
-                    "lowercase",
-                    "english_token_filter",
-                    "english_possessive_token_filter",
-                    "shingle_token_filter",
-                    "asciifolding_token_filter",
-                ],
-            },
-        },
-        "filter": {
-            "asciifolding_token_filter": {
-                "type": "asciifolding",
-                "preserve_original": True,
-            },
-            "shingle_token_filter": {
-                "type": "shingle",
-                "max_shingle_size": 4,
-                "min_shingle_size": 2,
-            },
-            "english_token_filter": {"type": "stemmer", "name": "english"},
-            "english_possessive_token_filter": {
-                "type": "stemmer",
-                "name": "possessive_english",
-            },
-        },
-        "normalizer": {
-            "lowercase_normalizer": {"type": "custom", "filter": ["lowercase"]}
-        },
-    }
-}
-mappings = {
-    "properties": {
-        "preferred_label": {"type": "text", "analyzer": "english_analyzer"},
-        "alternative_labels": {"type": "text", "analyzer": "english_analyzer"},
-        "description": {"type": "text", "analyzer": "english_analyzer"},
-    }
-}
-
 es = Elasticsearch(
     hosts=[{"host": "localhost", "port": 9200}],
     timeout=30,
@@ -68,25 +32,47 @@ es = Elasticsearch(
 
 index_name = "concepts"
 
-if es.indices.exists(index=index_name):
-    es.indices.delete(index=index_name)
-    console.print(f"🚽 deleted existing index: {index_name}", style="yellow")
-
-es.indices.create(index=index_name, settings=settings, mappings=mappings, ignore=400)
-console.print(f"✅ created index: {index_name}", style="green")
+search_engine = ConceptSearchEngine(elasticsearch=es, index_name=index_name)
 
 data_dir = Path("data/processed/concepts")
-files = list(data_dir.glob("*.json"))
 
-for file in track(
-    files, description="Indexing concepts", console=console, transient=True
+
+def main(
+    rebuild: bool = typer.Option(
+        False,
+        help=(
+            "Rebuild the index from scratch, rather than only sending new or changed "
+            "concepts"
+        ),
+    ),
 ):
-    concept = Concept.load(file)
-    es.index(
-        index=index_name,
-        id=concept.id,
-        document=concept.model_dump(),
-    )
+    files = list(data_dir.glob("*.json"))
+    concepts = (Concept.load(file) for file in files)
+
+    if rebuild:
+        try:
+            response = search_engine.reindex(concepts, progress_bar=True)
+        except ReindexError as e:
+            console.print(f"❌ {e}. {index_name} has not been changed", style="red")
+            raise typer.Exit(1)
+        console.print(
+            f"✅ indexed {response.n_succeeded} concepts into a new index behind "
+            f"{index_name}",
+            style="green",
+        )
+    else:
+        response = search_engine.sync(concepts, progress_bar=True)
+        console.print(
+            f"✅ synced {index_name}: {response.n_indexed} new or changed, "
+            f"{response.n_deleted} deleted, {response.n_unchanged} unchanged",
+            style="green",
+        )
+
+    if response.errors:
+        console.print(
+            f"❌ failed to index {len(response.errors)} concepts", style="red"
+        )
 
 
-console.print(f"✅ indexed {len(files)} concepts", style="green")
+if __name__ == "__main__":
+    typer.run(main)
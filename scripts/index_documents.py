@@ -1,67 +1,32 @@
 """
 Index full documents into elasticsearch.
 
-This script reads the raw text files from the data/raw/text directory, indexes them into
-an index called "documents" in a locally running elasticsearch cluster.
-The documents are indexed with "title" and "text" fields. Both fields are analyzed using
-a custom analyzer that tokenizes the text, removes stopwords, stems/lemmatizes words,
-and creates shingles (n-grams).
+This script reads the processed documents from the corpus in data/processed/corpus
+(built from data/processed/documents by the build_corpus.py script), and indexes them
+into an index called "documents" in a locally running elasticsearch cluster, using the
+settings and mappings defined by the DocumentSearchEngine.
+The documents' "title", "text" and "summary" fields are analyzed using a custom analyzer
+that tokenizes the text, removes stopwords, stems/lemmatizes words, and creates
+shingles (n-grams).
+
+By default, the index is synced incrementally: only new or changed documents are sent
+to elasticsearch, and documents which no longer exist are deleted from the index.
+Running with --rebuild bulk-loads every document into a fresh index instead, and
+switches "documents" over to it as an alias once the load is complete, so the API can
+keep serving searches while the index is rebuilt.
 """
 
 from pathlib import Path
 
+import typer
 from elasticsearch import Elasticsearch
 from rich.console import Console
-from rich.progress import track
 
-from src.document import Document
+from src.corpus import Corpus
+from src.search.core import DocumentSearchEngine, ReindexError
 
 console = Console()
 
-settings = {
-    "analysis": {
-        "analyzer": {
-            "english_analyzer": {
-                "type": "custom",
-                "tokenizer": "standard",
-                "filter": [
-                    "lowercase",
-                    "english_token_filter",
-                    "english_possessive_token_filter",
-                    "shingle_token_filter",
-                    "asciifolding_token_filter",
-                ],
-            },
-        },
-        "filter": {
-            "asciifolding_token_filter": {
-                "type": "asciifolding",
-                "preserve_original": True,
-            },
-            "shingle_token_filter": {
-                "type": "shingle",
-                "max_shingle_size": 4,
-                "min_shingle_size": 2,
-            },
-            "english_token_filter": {"type": "stemmer", "name": "english"},
-            "english_possessive_token_filter": {
-                "type": "stemmer",
-                "name": "possessive_english",
-            },
-        },
-        "normalizer": {
-            "lowercase_normalizer": {"type": "custom", "filter": ["lowercase"]}
-        },
-    }
-}
-mappings = {
-    "properties": {
-        "title": {"type": "text", "analyzer": "english_analyzer"},
-        "text": {"type": "text", "analyzer": "english_analyzer"},
-        "concepts": {"type": "keyword"},
-    }
-}
-
 es = Elasticsearch(
     hosts=[{"host": "localhost", "port": 9200}],
     timeout=30,
@@ -71,25 +36,46 @@ es = Elasticsearch(
 
 index_name = "documents"
 
-if es.indices.exists(index=index_name):
-    es.indices.delete(index=index_name)
-    console.print(f"🚽 deleted existing index: {index_name}", style="yellow")
+search_engine = DocumentSearchEngine(elasticsearch=es, index_name=index_name)
 
-es.indices.create(index=index_name, settings=settings, mappings=mappings, ignore=400)
-console.print(f"✅ created index: {index_name}", style="green")
+corpus_dir = Path("data/processed/corpus")
 
-data_dir = Path("data/processed/documents")
-files = list(data_dir.glob("*.json"))
 
-for file in track(
-    files, description="Indexing documents", console=console, transient=True
+def main(
+    rebuild: bool = typer.Option(
+        False,
+        help=(
+            "Rebuild the index from scratch, rather than only sending new or changed "
+            "documents"
+        ),
+    ),
 ):
-    document = Document.load(file)
-    es.index(
-        index=index_name,
-        id=document.id,
-        document=document.model_dump(),
-    )
+    documents = Corpus(corpus_dir)
+
+    if rebuild:
+        try:
+            response = search_engine.reindex(documents, progress_bar=True)
+        except ReindexError as e:
+            console.print(f"❌ {e}. {index_name} has not been changed", style="red")
+            raise typer.Exit(1)
+        console.print(
+            f"✅ indexed {response.n_succeeded} documents into a new index behind "
+            f"{index_name}",
+            style="green",
+        )
+    else:
+        response = search_engine.sync(documents, progress_bar=True)
+        console.print(
+            f"✅ synced {index_name}: {response.n_indexed} new or changed, "
+            f"{response.n_deleted} deleted, {response.n_unchanged} unchanged",
+            style="green",
+        )
+
+    if response.errors:
+        console.print(
+            f"❌ failed to index {len(response.errors)} documents", style="red"
+        )
 
 
-console.print(f"✅ indexed {len(files)} documents", style="green")
+if __name__ == "__main__":
+    typer.run(main)
@@ -2,9 +2,12 @@
 Index sentences into elasticsearch.
 
 
-This script reads the raw text files from the data/raw/text directory, splits them into
-sentences, and indexes each sentence as a separate document into an index called
-"sentences" in a locally running elasticsearch cluster.
+This script reads the sentences of the processed documents from the corpus in
+data/processed/corpus (built by the build_corpus.py script), and indexes each sentence
+as a separate document into an index called "sentences" in a locally running
+elasticsearch cluster. Sentences are sent to elasticsearch in bulk requests. Each
+sentence is sliced straight out of the corpus' memory-mapped text, so full documents
+are never loaded.
 
 The indexed sentences have a structure like:
 {
@@ -22,15 +25,24 @@ The ID of each sentence is a combination of the document ID and the sentence num
 "document.title" and "sentence.text" fields are analyzed using a custom analyzer that
 tokenizes the text, removes stopwords, stems/lemmatizes words, and creates shingles
 (n-grams).
+
+By default, the index is synced incrementally: only new or changed sentences are sent
+to elasticsearch, and sentences which no longer exist are deleted from the index. Each
+sentence is fingerprinted with its document's fingerprint (which is stored in the
+corpus), so the sentences of unchanged documents aren't read at all. Run with --rebuild
+to delete and recreate the index from scratch.
 """
 
+from functools import partial
 from pathlib import Path
 
+import typer
 from elasticsearch import Elasticsearch
 from rich.console import Console
 from rich.progress import track
 
-from src.document import Document
+from src.corpus import Corpus, DocumentView
+from src.search.core import sync_index
 
 console = Console()
 
@@ -84,6 +96,7 @@ mappings = {
                 "text": {"type": "text", "analyzer": "english_analyzer"},
             },
         },
+        "fingerprint": {"type": "keyword"},
     }
 }
 
@@ -96,32 +109,70 @@ es = Elasticsearch(
 
 index_name = "sentences"
 
-if es.indices.exists(index=index_name):
-    es.indices.delete(index=index_name)
-    console.print(f"🚽 deleted existing index: {index_name}", style="yellow")
+corpus_dir = Path("data/processed/corpus")
+
 
-es.indices.create(index=index_name, settings=settings, mappings=mappings, ignore=400)
-console.print(f"✅ created index: {index_name}", style="green")
+def sentence_source(document: DocumentView, sentence_number: int) -> dict:
+    return {
+        "document": {"title": document.title, "id": document.id},
+        "sentence": {
+            "number": sentence_number,
+            "text": document.sentences[sentence_number],
+        },
+    }
 
-data_dir = Path("data/processed/documents")
-files = list(data_dir.glob("*.json"))
 
-for file in track(
-    files, description="Indexing documents", console=console, transient=True
+def generate_items(corpus: Corpus):
+    for document in track(
+        corpus.views(),
+        total=len(corpus),
+        description="Indexing documents",
+        console=console,
+        transient=True,
+    ):
+        # a sentence's source is made up of its document's title, id and text, which
+        # are all covered by the document's fingerprint
+        for sentence_number in range(len(document.sentences)):
+            yield (
+                f"{document.id}_{sentence_number}",
+                document.fingerprint,
+                partial(sentence_source, document, sentence_number),
+            )
+
+
+def main(
+    rebuild: bool = typer.Option(
+        False, help="Delete and recreate the index, rather than syncing it"
+    ),
 ):
-    document = Document.load(file)
-    for sentence_number, sentence in enumerate(document.sentences):
-        es.index(
-            index=index_name,
-            id=f"{document.id}_{sentence_number}",
-            document={
-                "document": {"title": document.title, "id": document.id},
-                "sentence": {"number": sentence_number, "text": sentence},
-            },
+    if rebuild and es.indices.exists(index=index_name):
+        es.indices.delete(index=index_name)
+        console.print(f"🚽 deleted existing index: {index_name}", style="yellow")
+
+    if not es.indices.exists(index=index_name):
+        es.indices.create(index=index_name, settings=settings, mappings=mappings)
+        console.print(f"✅ created index: {index_name}", style="green")
+
+    corpus = Corpus(corpus_dir)
+    response = sync_index(es, index_name, generate_items(corpus))
+    console.print(
+        f"✅ synced {index_name}: {response.n_indexed} new or changed, "
+        f"{response.n_deleted} deleted, {response.n_unchanged} unchanged",
+        style="green",
+    )
+    if response.errors:
+        console.print(
+            f"❌ failed to index {len(response.errors)} sentences", style="red"
         )
 
-total_sentences = es.count(index=index_name).get("count", 0)
-console.print(
-    f"✅ indexed {len(files)} documents with {total_sentences} individual sentences",
-    style="green",
-)
+    es.indices.refresh(index=index_name)
+    total_sentences = es.count(index=index_name).get("count", 0)
+    console.print(
+        f"✅ indexed {len(corpus)} documents with {total_sentences} individual "
+        "sentences",
+        style="green",
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -4,12 +4,20 @@ Extract text from PDFs
 Transforms the text of every PDF in the data/raw folder into a json file containing a
 list of strings, one for each page of the PDF. The json files are saved in the
 data/processed folder.
+
+PDFs are parsed in parallel across a pool of worker processes. PDFs whose json output
+already exists and is newer than the PDF itself are skipped. A PDF which fails to parse
+is logged and skipped, and a summary of any failures is shown at the end of the run.
 """
 
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
 import pdfplumber
+import typer
 
 from src.logging import get_logger
 
@@ -20,12 +28,86 @@ raw_pdf_dir = data_dir / "raw" / "pdfs"
 raw_text_dir = data_dir / "raw" / "text"
 raw_text_dir.mkdir(parents=True, exist_ok=True)
 
-for pdf_path in raw_pdf_dir.glob("*.pdf"):
-    logger.info(f"Processing {pdf_path.stem}")
-    with pdfplumber.open(pdf_path) as pdf:
-        text = [page.extract_text() for page in pdf.pages]
 
-    output_path = raw_text_dir / f"{pdf_path.stem}.json"
-    with open(output_path, "w") as f:
-        json.dump(text, f)
-        logger.info(f"Saved {output_path}")
+def is_up_to_date(pdf_path: Path, output_path: Path) -> bool:
+    return (
+        output_path.exists() and output_path.stat().st_mtime >= pdf_path.stat().st_mtime
+    )
+
+
+def parse_pdf(pdf_path: Path, output_path: Path) -> Optional[str]:
+    """
+    Extract the text from a PDF and save it as a json list of pages.
+
+    :param Path pdf_path: The PDF to parse
+    :param Path output_path: Where to save the extracted text
+    :return Optional[str]: A description of the error if the PDF couldn't be parsed
+    """
+    # errors are caught here, in the worker, so that one bad PDF can't stop the rest
+    # of the run
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            text = [page.extract_text() for page in pdf.pages]
+
+        # write to a temporary file first, so that an interrupted run can't leave
+        # behind a partial file which looks up to date
+        temporary_path = output_path.with_suffix(".json.tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(text, f)
+        temporary_path.replace(output_path)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def main(
+    workers: int = typer.Option(
+        os.cpu_count() or 1, help="The number of PDFs to parse in parallel"
+    ),
+    force: bool = typer.Option(
+        False, help="Re-parse PDFs even if their output is up to date"
+    ),
+):
+    pdf_paths = sorted(raw_pdf_dir.glob("*.pdf"))
+    jobs = {pdf_path: raw_text_dir / f"{pdf_path.stem}.json" for pdf_path in pdf_paths}
+    if not force:
+        jobs = {
+            pdf_path: output_path
+            for pdf_path, output_path in jobs.items()
+            if not is_up_to_date(pdf_path, output_path)
+        }
+    n_skipped = len(pdf_paths) - len(jobs)
+    logger.info(
+        f"Parsing {len(jobs)} PDFs with {workers} workers "
+        f"(skipping {n_skipped} which are up to date)"
+    )
+
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(parse_pdf, pdf_path, output_path): pdf_path
+            for pdf_path, output_path in jobs.items()
+        }
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                error = future.result()
+            except Exception as e:
+                # eg the worker process died while parsing the file
+                error = f"{type(e).__name__}: {e}"
+            if error:
+                failures[pdf_path] = error
+                logger.error(f"Failed to parse {pdf_path.stem}: {error}")
+            else:
+                logger.info(f"Saved {jobs[pdf_path]}")
+
+    logger.info(
+        f"Parsed {len(jobs) - len(failures)} PDFs, skipped {n_skipped}, "
+        f"failed {len(failures)}"
+    )
+    for pdf_path, error in failures.items():
+        logger.warning(f"  {pdf_path.name}: {error}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -6,7 +6,9 @@ If argilla objects already exist for a concept, they are not overwritten, but ar
 supplemented with new candidate texts using active learning.
 
 The raw concepts are loaded from ./data/raw/concepts.json, and pre-processed documents
-(with some naive concepts identified) are loaded from ./data/processes/documents.
+(with some naive concepts identified) are read from the corpus in
+./data/processed/corpus. Only the sentences which contain concepts are read out of
+the corpus' text.
 """
 
 import json
@@ -18,7 +20,7 @@ from rich.console import Console
 from rich.progress import track
 
 from src.concept import Concept
-from src.document import Document
+from src.corpus import Corpus
 
 # disable all logs from imported modules
 logging.disable(logging.CRITICAL)
@@ -37,31 +39,28 @@ concepts = [
 ]
 console.print(f"🧠 Loaded {len(concepts_data)} concepts", style="green")
 
-documents_dir = data_dir / "processed" / "documents"
-file_paths = list(documents_dir.glob("*.json"))
-documents = [
-    Document.load(file)
-    for file in track(file_paths, description="📄 Loading documents...", transient=True)
-]
-console.print(f"📄 Loaded {len(documents)} documents", style="green")
+corpus = Corpus(data_dir / "processed" / "corpus")
+console.print(f"📄 Found {len(corpus)} documents", style="green")
 
-# find passages which contain each concept
+# find passages which contain each concept, without loading the full documents
 concept_passages = {concept.id: [] for concept in concepts}
 for document in track(
-    documents, description="Extracting concept passages", transient=True
+    corpus.views(),
+    total=len(corpus),
+    description="Extracting concept passages",
+    transient=True,
 ):
     if not document.concept_spans:
         continue
+    sentences = document.sentences
     concept_span_iterable = iter(document.concept_spans)
     concept_span = next(concept_span_iterable)
-    for sentence_span in document.sentence_spans:
+    for sentence_index, sentence_span in enumerate(document.sentence_spans):
         if (
             sentence_span.start_index <= concept_span.start_index
             and sentence_span.end_index >= concept_span.end_index
         ):
-            sentence = document.text[
-                sentence_span.start_index : sentence_span.end_index
-            ]
+            sentence = sentences[sentence_index]
             concept_passages[concept_span.identifier].append(sentence)
             try:
                 concept_span = next(concept_span_iterable)
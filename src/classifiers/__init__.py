@@ -1,7 +1,12 @@
+from typing import List
+
 from src.classifiers.classifier import Classifier
 from src.classifiers.elasticsearch import ElasticsearchClassifier
-from src.classifiers.embedding import EmbeddingClassifier
-from src.classifiers.regex import RegexClassifier
+from src.classifiers.embedding import (
+    EmbeddingClassifier,
+    MultiConceptEmbeddingClassifier,
+)
+from src.classifiers.regex import MultiConceptRegexClassifier, RegexClassifier
 from src.classifiers.setfit import SetFitClassifier
 from src.classifiers.spancat import SpanCatClassifier
 from src.concept import Concept
@@ -10,6 +15,8 @@ __all__ = [
     "Classifier",
     "ElasticsearchClassifier",
     "EmbeddingClassifier",
+    "MultiConceptEmbeddingClassifier",
+    "MultiConceptRegexClassifier",
     "RegexClassifier",
     "SetFitClassifier",
     "SpanCatClassifier",
@@ -40,3 +47,38 @@ class ClassifierFactory:
             model = RegexClassifier(concept)
 
         return model
+
+
+def combine_classifiers(classifiers: List[Classifier]) -> List[Classifier]:
+    """
+    Combine single-concept classifiers into multi-concept classifiers where possible.
+
+    RegexClassifiers are merged into one MultiConceptRegexClassifier, and
+    EmbeddingClassifiers are merged into one MultiConceptEmbeddingClassifier per
+    model, so that each document only needs to be scanned/embedded once. Other
+    classifiers are returned unchanged.
+
+    :param List[Classifier] classifiers: The classifiers to combine
+    :return List[Classifier]: An equivalent list of classifiers
+    """
+    regex_classifiers = []
+    embedding_classifiers = {}
+    combined = []
+    for classifier in classifiers:
+        if isinstance(classifier, RegexClassifier):
+            regex_classifiers.append(classifier)
+        elif isinstance(classifier, EmbeddingClassifier):
+            model_name = classifier.encoder.model_name
+            embedding_classifiers.setdefault(model_name, []).append(classifier)
+        else:
+            combined.append(classifier)
+
+    if regex_classifiers:
+        combined.append(
+            MultiConceptRegexClassifier(
+                [classifier.concept for classifier in regex_classifiers]
+            )
+        )
+    for group in embedding_classifiers.values():
+        combined.append(MultiConceptEmbeddingClassifier.from_classifiers(group))
+    return combined
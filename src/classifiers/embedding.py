@@ -1,15 +1,28 @@
-from typing import List
+from typing import List, Optional
 
 import torch
-from sklearn.metrics.pairwise import cosine_similarity
-from transformers import AutoModel, AutoTokenizer
 
 from src.classifiers.classifier import Classifier
 from src.concept import Concept
 from src.document import Document
+from src.embeddings import SentenceEncoder
 from src.span import Span
 
 
+def embed_concept(encoder: SentenceEncoder, concept: Concept) -> torch.Tensor:
+    """
+    Embed a concept as the mean of the embeddings for all of its labels.
+
+    :param SentenceEncoder encoder: The encoder used to embed the labels
+    :param Concept concept: The concept to embed
+    :return torch.Tensor: A (1, dimensions) L2-normalised embedding
+    """
+    label_embeddings = encoder.encode(concept.all_labels, normalize=False)
+    return torch.nn.functional.normalize(
+        label_embeddings.mean(dim=0, keepdim=True), dim=1
+    )
+
+
 class EmbeddingClassifier(Classifier):
     """Uses embeddings to find spans of text which match the given concept."""
 
@@ -17,26 +30,164 @@ class EmbeddingClassifier(Classifier):
         self,
         concept: Concept,
         model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        batch_size: int = 32,
+        n_threads: Optional[int] = None,
     ):
+        """
+        :param Concept concept: The concept to classify
+        :param str model_name: The name of the transformer model used to embed text
+        :param int batch_size: The number of sentences to embed in each forward pass
+        :param Optional[int] n_threads: The number of threads torch should use for
+        inference, defaults to torch's own default
+        """
         super().__init__(concept)
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+        self.encoder = SentenceEncoder(model_name, batch_size, n_threads)
+        self.concept_embedding = embed_concept(self.encoder, concept)
 
-        # take the mean of the embeddings for all of the concept's labels
-        label_embeddings = [self.embed(label) for label in concept.all_labels]
-        self.concept_embedding = torch.stack(label_embeddings).mean(dim=0)
+    def __setstate__(self, state: dict):
+        # classifiers pickled before the encoder was shared hold their own tokenizer
+        # and model. Swap them for a shared encoder of the same model. The oldest of
+        # them saved their concept embedding without normalising it (and still attached
+        # to the autograd graph), so normalise it to keep the threshold a cosine
+        # similarity
+        if "encoder" not in state:
+            model = state.pop("model")
+            state.pop("tokenizer", None)
+            state["encoder"] = SentenceEncoder(
+                model.name_or_path,
+                state.pop("batch_size", 32),
+                state.pop("n_threads", None),
+            )
+            state["concept_embedding"] = torch.nn.functional.normalize(
+                state["concept_embedding"].detach().reshape(1, -1), dim=1
+            )
+        self.__dict__.update(state)
 
-    def embed(self, text: str):
-        inputs = self.tokenizer(text, return_tensors="pt")
-        outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1)
+    def embed(self, texts: List[str], normalize: bool = True) -> torch.Tensor:
+        return self.encoder.encode(texts, normalize=normalize)
 
     def predict(self, document: Document, threshold=0.8) -> List[Span]:
+        """
+        Find sentences in the document which are similar to the concept.
+
+        :param Document document: The document to classify
+        :param float threshold: The minimum cosine similarity for a sentence to match
+        :return List[Span]: A list of spans in the document
+        """
+        sentence_spans = document.sentence_spans
+        if not sentence_spans:
+            return []
+
+        sentence_embeddings = self.embed(document.sentences)
+        # the embeddings are normalised, so a matrix product gives cosine similarity
+        similarities = (sentence_embeddings @ self.concept_embedding.T).squeeze(1)
+        return [
+            Span(
+                start_index=span.start_index,
+                end_index=span.end_index,
+                identifier=self.concept.id,
+                type="concept",
+            )
+            for span, similarity in zip(sentence_spans, similarities.tolist())
+            if similarity > threshold
+        ]
+
+
+class MultiConceptEmbeddingClassifier(Classifier):
+    """
+    Uses embeddings to find spans of text which match any of a set of concepts.
+
+    A single copy of the model is used for every concept. Each sentence in a document
+    is embedded once, and compared to every concept with a single matrix product.
+    """
+
+    def __init__(
+        self,
+        concepts: List[Concept],
+        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        batch_size: int = 32,
+        n_threads: Optional[int] = None,
+        concept_embeddings: Optional[torch.Tensor] = None,
+    ):
+        """
+        :param List[Concept] concepts: The concepts to classify
+        :param str model_name: The name of the transformer model used to embed text
+        :param int batch_size: The number of sentences to embed in each forward pass
+        :param Optional[int] n_threads: The number of threads torch should use for
+        inference, defaults to torch's own default
+        :param Optional[torch.Tensor] concept_embeddings: Pre-computed, normalised
+        embeddings for the concepts, one row per concept. Computed if not provided.
+        """
+        self.concepts = concepts
+        self.encoder = SentenceEncoder(model_name, batch_size, n_threads)
+        if concept_embeddings is None:
+            concept_embeddings = torch.cat(
+                [embed_concept(self.encoder, concept) for concept in concepts]
+            )
+        self.concept_embeddings = concept_embeddings
+
+    @classmethod
+    def from_classifiers(
+        cls, classifiers: List[EmbeddingClassifier]
+    ) -> "MultiConceptEmbeddingClassifier":
+        """
+        Combine a set of EmbeddingClassifiers which share a model into one classifier.
+
+        :param List[EmbeddingClassifier] classifiers: The classifiers to combine
+        :raises ValueError: If the classifiers use different models
+        :return MultiConceptEmbeddingClassifier: The combined classifier
+        """
+        model_names = {classifier.encoder.model_name for classifier in classifiers}
+        if len(model_names) != 1:
+            raise ValueError(
+                f"Classifiers must all use the same model (got {model_names})"
+            )
+        encoder = classifiers[0].encoder
+        return cls(
+            concepts=[classifier.concept for classifier in classifiers],
+            model_name=encoder.model_name,
+            batch_size=encoder.batch_size,
+            n_threads=encoder.n_threads,
+            concept_embeddings=torch.cat(
+                [classifier.concept_embedding for classifier in classifiers]
+            ),
+        )
+
+    def __repr__(self):
+        concept_labels = ",".join(
+            [concept.preferred_label for concept in self.concepts]
+        )
+        return f"{self.__class__.__name__}({concept_labels})"
+
+    def predict(self, document: Document, threshold=0.8) -> List[Span]:
+        """
+        Find sentences in the document which are similar to any of the concepts.
+
+        :param Document document: The document to classify
+        :param float threshold: The minimum cosine similarity for a sentence to match
+        :return List[Span]: A list of spans in the document, ordered by position
+        """
+        sentence_spans = document.sentence_spans
+        if not sentence_spans or not self.concepts:
+            return []
+
+        sentence_embeddings = self.encoder.encode(document.sentences)
+        similarities = sentence_embeddings @ self.concept_embeddings.T
+        sentence_indices, concept_indices = torch.nonzero(
+            similarities > threshold, as_tuple=True
+        )
+
         spans = []
-        for span in document.sentence_spans:
-            text = document.text[span.start_index : span.end_index]
-            span_embedding = self.embed(text)
-            similarity = cosine_similarity(span_embedding, self.concept_embedding)
-            if similarity > threshold:
-                spans.append(span)
+        for sentence_index, concept_index in zip(
+            sentence_indices.tolist(), concept_indices.tolist()
+        ):
+            sentence_span = sentence_spans[sentence_index]
+            spans.append(
+                Span(
+                    start_index=sentence_span.start_index,
+                    end_index=sentence_span.end_index,
+                    identifier=self.concepts[concept_index].id,
+                    type="concept",
+                )
+            )
         return spans
@@ -1,10 +1,13 @@
 import re
-from typing import List
+from typing import Dict, List
 
 from src.classifiers.classifier import Classifier
+from src.concept import Concept
 from src.document import Document
 from src.span import Span
 
+word_boundary = re.compile(r"\b")
+
 
 class RegexClassifier(Classifier):
     """Classifier that uses regular expressions to find spans of text."""
@@ -29,3 +32,122 @@ class RegexClassifier(Classifier):
                     )
                 )
         return spans
+
+
+class MultiConceptRegexClassifier(Classifier):
+    """
+    Classifier which finds the labels of many concepts in a single pass over the text.
+
+    The labels of every concept are compiled into one trie-shaped regular expression,
+    so the cost of classifying a document grows with the length of its text rather
+    than with the number of labels. Matches are reported for every concept which uses
+    the matched label, including labels which overlap with or are prefixes of others,
+    so the output is the same as running a RegexClassifier for each concept, except
+    that a concept's labels which only differ in case produce one span, not several.
+    Like a RegexClassifier, a label's matches never overlap each other: in "aa aa
+    aa", the label "aa aa" only matches once.
+    """
+
+    def __init__(self, concepts: List[Concept]):
+        self.concepts = concepts
+
+        self.label_to_concept_ids: Dict[str, List[str]] = {}
+        for concept in concepts:
+            for label in concept.all_labels:
+                label = label.lower()
+                if not label:
+                    continue
+                concept_ids = self.label_to_concept_ids.setdefault(label, [])
+                if concept.id not in concept_ids:
+                    concept_ids.append(concept.id)
+
+        labels = list(self.label_to_concept_ids)
+        # the pattern only reports the longest label starting at each position, so
+        # keep track of the shorter labels which could also match there
+        self.label_prefixes: Dict[str, List[str]] = {
+            label: [
+                other for other in labels if other != label and label.startswith(other)
+            ]
+            for label in labels
+        }
+        # a zero-width lookahead allows overlapping matches to be found
+        self.pattern = re.compile(r"(?=\b({})\b)".format(build_trie_pattern(labels)))
+
+    def __repr__(self):
+        concept_labels = ",".join(
+            [concept.preferred_label for concept in self.concepts]
+        )
+        return f"{self.__class__.__name__}({concept_labels})"
+
+    def predict(self, document: Document) -> List[Span]:
+        """
+        Predict spans for all concepts in a document in a single pass.
+
+        :param Document document: The document to classify
+        :return List[Span]: A list of spans in the document, ordered by position
+        """
+        spans = []
+        if not self.label_to_concept_ids:
+            return spans
+
+        text = document.text.lower()
+        # the end of each label's last match, so that a label's matches don't overlap
+        label_ends: Dict[str, int] = {}
+        for match in self.pattern.finditer(text):
+            start_index = match.start()
+            label = match.group(1)
+            matched_labels = [label] + [
+                prefix
+                for prefix in self.label_prefixes[label]
+                if word_boundary.match(text, start_index + len(prefix))
+            ]
+            for matched_label in matched_labels:
+                if start_index < label_ends.get(matched_label, 0):
+                    continue
+                label_ends[matched_label] = start_index + len(matched_label)
+                for concept_id in self.label_to_concept_ids[matched_label]:
+                    spans.append(
+                        Span(
+                            start_index=start_index,
+                            end_index=start_index + len(matched_label),
+                            identifier=concept_id,
+                            type="concept",
+                        )
+                    )
+        return spans
+
+
+def build_trie_pattern(labels: List[str]) -> str:
+    """
+    Build a regular expression which matches any of the given labels.
+
+    The labels are arranged in a trie before being compiled, so that labels which
+    share a prefix share a branch of the pattern, eg ["unfair", "unfair dismissal",
+    "union"] becomes "un(?:fair(?:\\ dismissal)?|ion)". Optional branches are greedy,
+    so the longest matching label is preferred.
+
+    :param List[str] labels: The labels to match
+    :return str: A regular expression pattern
+    """
+    trie: dict = {}
+    for label in labels:
+        node = trie
+        for character in label:
+            node = node.setdefault(character, {})
+        node[""] = {}
+    return _trie_node_pattern(trie)
+
+
+def _trie_node_pattern(node: dict) -> str:
+    is_end_of_label = "" in node
+    branches = [
+        re.escape(character) + _trie_node_pattern(child)
+        for character, child in sorted(node.items())
+        if character
+    ]
+    if not branches:
+        return ""
+    if len(branches) == 1 and not is_end_of_label:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if is_end_of_label else pattern
@@ -1,15 +1,15 @@
-import json
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Union
 
 from pydantic import BaseModel, Field, computed_field
+from pydantic_core import from_json
 
 from src.identifiers import pretty_hash
 
 
 class Concept(BaseModel):
     preferred_label: str = Field(..., description="The preferred label for the concept")
-    description: str = Field(
+    description: Optional[str] = Field(
         None,
         description=(
             "An optional description of the concept with enough detail to disambiguate "
@@ -37,14 +37,27 @@ class Concept(BaseModel):
         return cls(**data)
 
     @classmethod
-    def load(cls, file_path: Union[str, Path]):
-        with open(file_path) as f:
-            data = json.load(f)
-        return cls.from_dict(data)
+    def from_trusted(cls, data: dict):
+        """
+        Build a concept from data which was produced by serialising a Concept, without
+        validating it again
+        """
+        return cls.model_construct(
+            preferred_label=data["preferred_label"],
+            description=data.get("description"),
+            alternative_labels=data.get("alternative_labels", []),
+        )
 
-    def save(self, file_path: Union[str, Path]):
+    @classmethod
+    def load(cls, file_path: Union[str, Path], trusted: bool = False):
+        data = Path(file_path).read_bytes()
+        if trusted:
+            return cls.from_trusted(from_json(data))
+        return cls.model_validate_json(data)
+
+    def save(self, file_path: Union[str, Path], indent: Optional[int] = None):
         with open(file_path, "w", encoding="utf-8") as f:
-            f.write(self.model_dump_json(indent=2))
+            f.write(self.model_dump_json(indent=indent))
 
     @computed_field(return_type=str)
     @property
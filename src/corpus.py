@@ -0,0 +1,443 @@
+import json
+import shutil
+from array import array
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.document import Document
+from src.span import SpanList
+
+span_fields = ("page_spans", "concept_spans", "sentence_spans")
+
+# the columns stored for each field of spans, and their dtypes on disk. The dtypes
+# match the arrays which back a SpanList, so columns can be copied in without
+# converting them.
+span_columns = {
+    "start_indices": np.int64,
+    "end_indices": np.int64,
+    "type_codes": np.int8,
+    "identifier_codes": np.int32,
+}
+# the UTF-8 byte offsets of each span in its document's text, so that the text of a
+# span can be sliced straight out of the memory-mapped text file
+byte_columns = {"start_bytes": np.int64, "end_bytes": np.int64}
+
+
+def _map(path: Path, dtype) -> np.ndarray:
+    """Memory-maps a flat binary file as a read-only numpy array"""
+    if path.stat().st_size == 0:
+        # mmap can't map an empty file
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def _byte_offsets(text: str, encoded_text: bytes) -> Optional[np.ndarray]:
+    """
+    Finds the byte offset in a UTF-8 encoded text of every character index in the text
+
+    :param str text: The text
+    :param bytes encoded_text: The text, encoded as UTF-8
+    :return Optional[np.ndarray]: An array of len(text) + 1 byte offsets, or None if
+    every character is encoded as a single byte (ie byte offsets are the same as
+    character indices)
+    """
+    if len(encoded_text) == len(text):
+        return None
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    n_bytes = (
+        1
+        + (code_points >= 0x80).astype(np.int64)
+        + (code_points >= 0x800)
+        + (code_points >= 0x10000)
+    )
+    return np.concatenate([[0], np.cumsum(n_bytes)])
+
+
+class TextSlices(Sequence[str]):
+    """
+    A read-only sequence of slices of a corpus' memory-mapped text
+
+    Each slice is only decoded into a string when it's accessed, so a document's
+    sentences or pages can be passed around without copying any of its text.
+    """
+
+    def __init__(
+        self,
+        text_bytes: Union[np.ndarray, memoryview],
+        start_bytes: np.ndarray,
+        end_bytes: np.ndarray,
+    ):
+        """
+        :param Union[np.ndarray, memoryview] text_bytes: The memory-mapped text to
+        slice
+        :param np.ndarray start_bytes: The byte offset of the start of each slice
+        :param np.ndarray end_bytes: The byte offset of the end of each slice
+        """
+        # slicing a memoryview is much quicker than slicing the numpy array itself
+        self.buffer = memoryview(text_bytes)
+        self.start_bytes = start_bytes
+        self.end_bytes = end_bytes
+
+    def __len__(self) -> int:
+        return len(self.start_bytes)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[str, "TextSlices"]:
+        if isinstance(key, slice):
+            return TextSlices(self.buffer, self.start_bytes[key], self.end_bytes[key])
+        start, end = self.start_bytes[key], self.end_bytes[key]
+        return str(self.buffer[start:end], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in zip(self.start_bytes.tolist(), self.end_bytes.tolist()):
+            yield str(self.buffer[start:end], "utf-8")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(n={len(self)})"
+
+
+class Corpus:
+    """
+    A read-only collection of documents, stored in a compact columnar format
+
+    Rather than one json file per document, a corpus keeps the text of every document
+    in a single UTF-8 file, each field of spans in flat arrays of indices, and the
+    titles, summaries and ids in one small json file. All of the large files are
+    memory-mapped, so opening a corpus is cheap, any document can be loaded by its id
+    without reading the others, and a full scan doesn't parse any json.
+
+    The directory layout is:
+
+        documents.json              ids, fingerprints, titles, summaries and concept
+                                    identifiers
+        text.bin                    every document's text, concatenated
+        text_offsets.bin            the byte offset of each document's text
+        <field>/offsets.bin         the position of each document's first span
+        <field>/<column>.bin        one flat array for each span column
+
+    Corpora are pickled by reference to their directory, so they can be sent to
+    worker processes cheaply. Every process maps the same files, so the operating
+    system's page cache holds a single copy of the text, however many processes read
+    from it.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """
+        :param Union[str, Path] directory: The directory the corpus was written to
+        :raises FileNotFoundError: If there is no corpus in the directory
+        """
+        self.directory = Path(directory)
+        metadata_path = self.directory / "documents.json"
+        if not metadata_path.exists():
+            raise FileNotFoundError(f"No corpus found in {self.directory}")
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        self.ids: List[str] = metadata["ids"]
+        self.titles: List[str] = metadata["titles"]
+        self.summaries: List[Optional[str]] = metadata["summaries"]
+        self.identifier_vocabulary: List[str] = metadata["identifiers"]
+        # corpora written before fingerprints were stored don't have them
+        self.fingerprints: Optional[List[str]] = metadata.get("fingerprints")
+        self.index: Dict[str, int] = {
+            identifier: i for i, identifier in enumerate(self.ids)
+        }
+
+        self.text_bytes = _map(self.directory / "text.bin", np.uint8)
+        self.text_offsets = _map(self.directory / "text_offsets.bin", np.int64)
+        self.spans = {
+            field: {
+                column: _map(self.directory / field / f"{column}.bin", dtype)
+                for column, dtype in {
+                    "offsets": np.int64,
+                    **span_columns,
+                    **byte_columns,
+                }.items()
+            }
+            for field in span_fields
+        }
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.directory}, n={len(self)})"
+
+    def __getstate__(self) -> dict:
+        return {"directory": self.directory}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, identifier: str) -> bool:
+        return identifier in self.index
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self.load(i)
+
+    def __getitem__(self, identifier: str) -> Document:
+        """
+        Load a document by its id
+
+        :param str identifier: The id of the document
+        :raises KeyError: If the document isn't in the corpus
+        :return Document: The document
+        """
+        return self.load(self.index[identifier])
+
+    def view(self, identifier: str) -> "DocumentView":
+        """
+        Get a view of a document by its id, without loading it
+
+        :param str identifier: The id of the document
+        :raises KeyError: If the document isn't in the corpus
+        :return DocumentView: A view of the document
+        """
+        return DocumentView(self, self.index[identifier])
+
+    def views(self) -> Iterator["DocumentView"]:
+        for i in range(len(self)):
+            yield DocumentView(self, i)
+
+    def get_text(self, i: int) -> str:
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return self.text_bytes[start:end].tobytes().decode("utf-8")
+
+    def get_spans(self, i: int, field: str) -> SpanList:
+        columns = self.spans[field]
+        start, end = columns["offsets"][i], columns["offsets"][i + 1]
+        return SpanList.from_columns(
+            *(columns[column][start:end] for column in span_columns),
+            identifier_vocabulary=self.identifier_vocabulary,
+        )
+
+    def get_span_texts(self, i: int, field: str) -> TextSlices:
+        columns = self.spans[field]
+        start, end = columns["offsets"][i], columns["offsets"][i + 1]
+        # span byte offsets are relative to the start of the document's text
+        text_start, text_end = self.text_offsets[i], self.text_offsets[i + 1]
+        return TextSlices(
+            self.text_bytes[text_start:text_end],
+            columns["start_bytes"][start:end],
+            columns["end_bytes"][start:end],
+        )
+
+    def get_fingerprint(self, i: int) -> str:
+        """
+        Get the fingerprint of the document at a given position in the corpus
+
+        Fingerprints are computed when the corpus is written, so the document only
+        needs to be loaded if the corpus was written without them.
+
+        :param int i: The position of the document
+        :return str: The document's fingerprint
+        """
+        if self.fingerprints is None:
+            return self.load(i).fingerprint
+        return self.fingerprints[i]
+
+    def load(self, i: int) -> Document:
+        """
+        Load the document at a given position in the corpus
+
+        :param int i: The position of the document
+        :return Document: The document
+        """
+        spans = {field: self.get_spans(i, field) for field in span_fields}
+        document = Document(
+            title=self.titles[i],
+            text=self.get_text(i),
+            summary=self.summaries[i],
+            **spans,
+        )
+        # the id was computed when the corpus was written, so there's no need to hash
+        # the text again
+        document._id_cache = (
+            document.title,
+            document.text,
+            len(document.page_spans),
+            self.ids[i],
+        )
+        return document
+
+    @classmethod
+    def write(
+        cls, documents: Iterable[Document], directory: Union[str, Path]
+    ) -> "Corpus":
+        """
+        Write a set of documents to a new corpus, replacing any existing corpus in the
+        directory
+
+        Documents are written one at a time, so the whole set never needs to be held
+        in memory. The corpus is written to a temporary directory first, so readers
+        never see a partially written corpus.
+
+        :param Iterable[Document] documents: The documents to write
+        :param Union[str, Path] directory: The directory to write the corpus to
+        :return Corpus: The written corpus
+        """
+        directory = Path(directory)
+        temporary_directory = directory.with_name(f"{directory.name}.tmp")
+        if temporary_directory.exists():
+            shutil.rmtree(temporary_directory)
+        temporary_directory.mkdir(parents=True)
+
+        ids, fingerprints, titles, summaries = [], [], [], []
+        identifier_vocabulary: List[str] = []
+        identifier_lookup: Dict[str, int] = {}
+        text_offsets = array("q", [0])
+        span_offsets = {field: array("q", [0]) for field in span_fields}
+
+        files = {"text": open(temporary_directory / "text.bin", "wb")}
+        for field in span_fields:
+            (temporary_directory / field).mkdir()
+            for column in {**span_columns, **byte_columns}:
+                path = temporary_directory / field / f"{column}.bin"
+                files[(field, column)] = open(path, "wb")
+
+        try:
+            for document in documents:
+                ids.append(document.id)
+                fingerprints.append(document.fingerprint)
+                titles.append(document.title)
+                summaries.append(document.summary)
+
+                text = document.text.encode("utf-8")
+                files["text"].write(text)
+                text_offsets.append(text_offsets[-1] + len(text))
+                byte_offsets = _byte_offsets(document.text, text)
+
+                for field in span_fields:
+                    spans: SpanList = getattr(document, field)
+                    # swap each document's identifier codes for the corpus-wide ones
+                    vocabulary_codes = []
+                    for identifier in spans.identifier_vocabulary:
+                        if identifier not in identifier_lookup:
+                            identifier_lookup[identifier] = len(identifier_vocabulary)
+                            identifier_vocabulary.append(identifier)
+                        vocabulary_codes.append(identifier_lookup[identifier])
+                    identifier_codes = np.array(spans.identifier_codes, np.int32)
+                    has_identifier = identifier_codes >= 0
+                    identifier_codes[has_identifier] = np.asarray(
+                        vocabulary_codes, np.int32
+                    )[identifier_codes[has_identifier]]
+
+                    files[(field, "start_indices")].write(spans.start_indices)
+                    files[(field, "end_indices")].write(spans.end_indices)
+                    files[(field, "type_codes")].write(spans.type_codes)
+                    files[(field, "identifier_codes")].write(identifier_codes)
+                    if byte_offsets is None:
+                        files[(field, "start_bytes")].write(spans.start_indices)
+                        files[(field, "end_bytes")].write(spans.end_indices)
+                    else:
+                        for column, indices in (
+                            ("start_bytes", spans.start_indices),
+                            ("end_bytes", spans.end_indices),
+                        ):
+                            files[(field, column)].write(
+                                byte_offsets[np.asarray(indices, dtype=np.int64)]
+                            )
+                    span_offsets[field].append(span_offsets[field][-1] + len(spans))
+        finally:
+            for file in files.values():
+                file.close()
+
+        with open(temporary_directory / "text_offsets.bin", "wb") as f:
+            f.write(text_offsets)
+        for field in span_fields:
+            with open(temporary_directory / field / "offsets.bin", "wb") as f:
+                f.write(span_offsets[field])
+        # documents.json is written last, so a corpus without it is incomplete
+        with open(temporary_directory / "documents.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ids": ids,
+                    "fingerprints": fingerprints,
+                    "titles": titles,
+                    "summaries": summaries,
+                    "identifiers": identifier_vocabulary,
+                },
+                f,
+            )
+
+        if directory.exists():
+            shutil.rmtree(directory)
+        temporary_directory.rename(directory)
+        return cls(directory)
+
+
+class DocumentView:
+    """
+    A read-only view of a document in a corpus
+
+    Creating a view doesn't read anything from the corpus. The text, pages and
+    sentences of the document are sliced out of the corpus' memory-mapped text as
+    they're used, so only the parts which are needed are decoded, and the text isn't
+    held in memory by the view. Views have the same read-only properties as a
+    Document, and can be converted to a full Document with to_document.
+    """
+
+    def __init__(self, corpus: Corpus, i: int):
+        """
+        :param Corpus corpus: The corpus containing the document
+        :param int i: The position of the document in the corpus
+        """
+        self.corpus = corpus
+        self.i = i
+
+    def __repr__(self) -> str:
+        return (
+            f"DocumentView(id={self.id}, title={self.title}, "
+            f"n_pages={len(self.page_spans)})"
+        )
+
+    @property
+    def id(self) -> str:
+        return self.corpus.ids[self.i]
+
+    @property
+    def fingerprint(self) -> str:
+        return self.corpus.get_fingerprint(self.i)
+
+    @property
+    def title(self) -> str:
+        return self.corpus.titles[self.i]
+
+    @property
+    def summary(self) -> Optional[str]:
+        return self.corpus.summaries[self.i]
+
+    @property
+    def text(self) -> str:
+        """The complete text of the document, decoded afresh on every access"""
+        return self.corpus.get_text(self.i)
+
+    @cached_property
+    def page_spans(self) -> SpanList:
+        return self.corpus.get_spans(self.i, "page_spans")
+
+    @cached_property
+    def concept_spans(self) -> SpanList:
+        return self.corpus.get_spans(self.i, "concept_spans")
+
+    @cached_property
+    def sentence_spans(self) -> SpanList:
+        return self.corpus.get_spans(self.i, "sentence_spans")
+
+    @property
+    def pages(self) -> TextSlices:
+        return self.corpus.get_span_texts(self.i, "page_spans")
+
+    @property
+    def sentences(self) -> TextSlices:
+        return self.corpus.get_span_texts(self.i, "sentence_spans")
+
+    @property
+    def concepts(self) -> List[str]:
+        return self.concept_spans.identifiers
+
+    def to_document(self) -> Document:
+        return self.corpus.load(self.i)
@@ -1,19 +1,39 @@
+import hashlib
 import json
 import warnings
+from collections import deque
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
 
 import spacy
-from pydantic import BaseModel, Field, computed_field, model_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+    ValidatorFunctionWrapHandler,
+    computed_field,
+    model_validator,
+)
+from pydantic_core import from_json
 from typing_extensions import Self
 
 from src.identifiers import pretty_hash
-from src.span import Span
+from src.span import SpanList
 
 nlp = spacy.blank("en")
 nlp.add_pipe("sentencizer")
 
 
+def _spans_from_sentences(doc: spacy.tokens.Doc) -> SpanList:
+    sentences = list(doc.sents)
+    return SpanList.from_arrays(
+        [sent.start_char for sent in sentences],
+        [sent.end_char for sent in sentences],
+        type="sentence",
+    )
+
+
 class Document(BaseModel):
     """Base class for a document"""
 
@@ -23,24 +43,42 @@ class Document(BaseModel):
         default=None,
         description="An LLM-generated summary of the document",
     )
-    page_spans: List[Span] = Field(
-        default=[], description="A list of spans representing the pages of the document"
+    page_spans: SpanList = Field(
+        default_factory=SpanList,
+        description="A list of spans representing the pages of the document",
     )
-    concept_spans: List[Span] = Field(
-        default=[],
+    concept_spans: SpanList = Field(
+        default_factory=SpanList,
         description=(
             "A list of spans representing appearances of concepts within the document"
         ),
     )
-    sentence_spans: List[Span] = Field(
-        default=[],
-        description="A list of spans representing the sentences within the document",
-    )
+
+    # sentence spans are only computed when they're first needed (see sentence_spans)
+    _sentence_spans: Optional[SpanList] = PrivateAttr(default=None)
+    _parse_sentences: bool = PrivateAttr(default=True)
+    # (title, text, n_pages, id) from the last time the id was computed
+    _id_cache: Optional[Tuple[str, str, int, str]] = PrivateAttr(default=None)
 
     def __init__(self, parse_sentences: bool = True, **data):
         super().__init__(**data)
-        if len(self.sentence_spans) == 0 and parse_sentences:
-            self.sentence_spans = self._get_sentence_spans()
+        self._parse_sentences = parse_sentences
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def extract_sentence_spans(
+        cls, data: Any, handler: ValidatorFunctionWrapHandler
+    ) -> Self:
+        """Keeps any sentence spans passed in, rather than re-computing them later"""
+        sentence_spans = None
+        if isinstance(data, dict) and data.get("sentence_spans"):
+            data = dict(data)
+            sentence_spans = SpanList.coerce(data.pop("sentence_spans"))
+        document = handler(data)
+        if sentence_spans is not None:
+            sentence_spans.validate_bounds(len(document.text))
+            document._sentence_spans = sentence_spans
+        return document
 
     @classmethod
     def load_raw(cls, file: Union[str, Path], parse_sentences: bool = True):
@@ -48,6 +86,7 @@ class Document(BaseModel):
 
         :param Union[str, Path] file: The path to the json file
         :param bool parse_sentences: Whether to split the document text into sentences
+        when they're first accessed
         :raises ValueError: If the file is not a json file
         :return Document: The loaded document
         """
@@ -60,13 +99,14 @@ class Document(BaseModel):
 
         title = file.stem
         text = "".join(data)
-        page_spans = []
+        start_indices = []
+        end_indices = []
         index = 0
         for page in data:
-            page_spans.append(
-                Span(start_index=index, end_index=index + len(page), type="page")
-            )
+            start_indices.append(index)
             index += len(page)
+            end_indices.append(index)
+        page_spans = SpanList.from_arrays(start_indices, end_indices, type="page")
 
         return cls(
             title=title,
@@ -76,11 +116,22 @@ class Document(BaseModel):
         )
 
     @classmethod
-    def load(cls, file: Union[str, Path], parse_sentences: bool = True):
+    def load(
+        cls,
+        file: Union[str, Path],
+        parse_sentences: bool = True,
+        trusted: bool = False,
+    ):
         """Loads a document from a json file with pre-structured document data
 
+        The file is parsed and validated in one pass by pydantic, without building an
+        intermediate dict.
+
         :param Union[str, Path] file: The path to the json file
         :param bool parse_sentences: Whether to split the document text into sentences
+        when they're first accessed
+        :param bool trusted: Whether the file was written by Document.save, in which
+        case it's loaded without being validated (see Document.from_trusted)
         :raises ValueError: If the file is not a json file
         :return Document: The loaded document
         """
@@ -88,47 +139,111 @@ class Document(BaseModel):
         if file.suffix != ".json":
             raise ValueError(f"File must be a json file: {file}")
 
-        with open(file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = file.read_bytes()
+        if trusted:
+            # documents contain thousands of small span dicts with the same few keys,
+            # which pydantic's parser handles fastest without its string cache
+            data = from_json(data, cache_strings=False)
+            return cls.from_trusted(data, parse_sentences=parse_sentences)
 
-        return cls(**data, parse_sentences=parse_sentences)
+        document = cls.model_validate_json(data)
+        document._parse_sentences = parse_sentences
+        return document
 
-    def save(self, file: Union[str, Path]):
+    @classmethod
+    def from_trusted(cls, data: dict, parse_sentences: bool = True):
+        """Builds a document from data which has already been validated
+
+        Only use this for data which was produced by serialising a Document, eg a
+        saved file or an elasticsearch hit. None of the model's validation is run,
+        and the id included in the data is used rather than hashing the text again.
+        Spans are still checked in bulk as they're loaded.
+
+        :param dict data: The serialised document
+        :param bool parse_sentences: Whether to split the document text into sentences
+        when they're first accessed, if the data doesn't include any sentence spans
+        :return Document: The document
+        """
+        document = cls.model_construct(
+            title=data["title"],
+            text=data["text"],
+            summary=data.get("summary"),
+            page_spans=SpanList.coerce(data.get("page_spans", [])),
+            concept_spans=SpanList.coerce(data.get("concept_spans", [])),
+        )
+        document._parse_sentences = parse_sentences
+        if data.get("sentence_spans"):
+            document._sentence_spans = SpanList.coerce(data["sentence_spans"])
+        if "id" in data:
+            document._id_cache = (
+                document.title,
+                document.text,
+                len(document.page_spans),
+                data["id"],
+            )
+        return document
+
+    def save(self, file: Union[str, Path], indent: Optional[int] = None):
         """Saves the document to a file
 
         :param Union[str, Path] file: The path to save the document to
-        :param str format: The format to save the document in, defaults to "json"
-        :raises NotImplementedError: If the format is not supported
+        :param Optional[int] indent: The number of spaces to indent the json by. By
+        default, the json is written as compactly as possible.
         """
         file = Path(file)
         if file.suffix != ".json":
             warnings.warn("File does not have .json extension")
         with open(file, "w", encoding="utf-8") as f:
-            f.write(self.model_dump_json(indent=2))
+            f.write(self.model_dump_json(indent=indent))
 
-    def _get_sentence_spans(self):
+    def _get_sentence_spans(self) -> SpanList:
         """Get the spans of the sentences in the document
 
-        :return list[Span]: The spans of the sentences
+        :return SpanList: The spans of the sentences
         """
-        doc = nlp(self.text)
-        sentence_spans = []
-        for sent in doc.sents:
-            sentence_spans.append(
-                Span(
-                    start_index=sent.start_char,
-                    end_index=sent.end_char,
-                    type="sentence",
-                )
-            )
-        return sentence_spans
+        return _spans_from_sentences(nlp(self.text))
 
     @computed_field(return_type=str)
     @property
     def id(self):
-        return pretty_hash(
-            {"title": self.title, "text": self.text, "n_pages": len(self.page_spans)}
+        """A hash of the document's title, text and number of pages
+
+        Hashing the full text is expensive, so the id is cached and only recomputed
+        when the title, text or number of pages have changed since it was last read.
+        """
+        n_pages = len(self.page_spans)
+        if self._id_cache is not None:
+            title, text, cached_n_pages, identifier = self._id_cache
+            # strings are immutable, so an identity check is enough to tell whether
+            # the text has been replaced, without comparing its contents
+            if title == self.title and text is self.text and cached_n_pages == n_pages:
+                return identifier
+
+        identifier = pretty_hash(
+            {"title": self.title, "text": self.text, "n_pages": n_pages}
         )
+        self._id_cache = (self.title, self.text, n_pages, identifier)
+        return identifier
+
+    @property
+    def fingerprint(self) -> str:
+        """A hash of the document's full contents, for detecting changes to it
+
+        Unlike the id, the fingerprint changes when the document's summary or spans do
+        (eg when new concepts are found in it). The title and text are covered by the
+        id, which is cached, so the text isn't hashed again. The spans are hashed from
+        the arrays which back them, without building a Span for each one.
+        """
+        digest = hashlib.sha256(json.dumps([self.id, self.summary]).encode())
+        for spans in (self.page_spans, self.concept_spans, self.sentence_spans):
+            digest.update(len(spans).to_bytes(8, "little"))
+            digest.update(spans.start_indices)
+            digest.update(spans.end_indices)
+            digest.update(spans.type_codes)
+            # identifier codes depend on the order in which identifiers were first
+            # seen, so hash the identifiers themselves
+            digest.update(json.dumps(spans.identifiers).encode())
+        return digest.hexdigest()
 
     @property
     def pages(self):
@@ -136,6 +251,28 @@ class Document(BaseModel):
             self.text[span.start_index : span.end_index] for span in self.page_spans
         ]
 
+    @computed_field(return_type=SpanList)
+    @property
+    def sentence_spans(self):
+        """A list of spans representing the sentences within the document
+
+        Splitting the text into sentences is expensive, so it's done on first access
+        and the result is kept. Documents created with parse_sentences=False have no
+        sentence spans unless they're set explicitly.
+        """
+        if self._sentence_spans is None:
+            if self._parse_sentences:
+                self._sentence_spans = self._get_sentence_spans()
+            else:
+                self._sentence_spans = SpanList()
+        return self._sentence_spans
+
+    @sentence_spans.setter
+    def sentence_spans(self, spans: Union[SpanList, List]):
+        spans = SpanList.coerce(spans)
+        spans.validate_bounds(len(self.text))
+        self._sentence_spans = spans
+
     @property
     def sentences(self):
         return [
@@ -145,7 +282,7 @@ class Document(BaseModel):
     @computed_field(return_type=List[str])
     @property
     def concepts(self):
-        return [span.identifier for span in self.concept_spans]
+        return self.concept_spans.identifiers
 
     def __repr__(self) -> str:
         return f"Document(id={self.id}, title={self.title}, n_pages={len(self.pages)})"
@@ -158,7 +295,73 @@ class Document(BaseModel):
     @model_validator(mode="after")
     def validate_spans(self) -> Self:
         """Ensures that all spans are within the bounds of the document text"""
-        for span in self.page_spans + self.concept_spans + self.sentence_spans:
-            if span.start_index < 0 or span.end_index > len(self.text):
-                raise ValueError(f"Span {span} is out of bounds of the text")
+        for spans in (self.page_spans, self.concept_spans):
+            spans.validate_bounds(len(self.text))
         return self
+
+
+def iter_documents(
+    directory: Union[str, Path],
+    raw: bool = False,
+    parse_sentences: bool = True,
+    limit: Optional[int] = None,
+    trusted: bool = False,
+) -> Iterator[Document]:
+    """Lazily loads the documents in a directory, one at a time
+
+    Only one document is held in memory at a time (unless the caller keeps them), so
+    the corpus can be processed with flat memory usage, regardless of its size.
+
+    :param Union[str, Path] directory: The directory containing the json files
+    :param bool raw: Whether the files contain raw text (see Document.load_raw) rather
+    than pre-structured document data (see Document.load)
+    :param bool parse_sentences: Whether to split the document text into sentences
+    when they're first accessed
+    :param Optional[int] limit: The maximum number of documents to load
+    :param bool trusted: Whether the files were written by Document.save, in which
+    case they're loaded without being validated. Ignored for raw files.
+    :return Iterator[Document]: The documents
+    """
+    load = Document.load_raw if raw else partial(Document.load, trusted=trusted)
+    # list the files before loading any, so that documents which are saved back into
+    # the same directory while iterating aren't picked up again
+    files = sorted(Path(directory).glob("*.json"))[:limit]
+    for file in files:
+        yield load(file, parse_sentences=parse_sentences)
+
+
+def segment_sentences(
+    documents: Iterable[Document], batch_size: int = 64, n_process: int = 1
+) -> Iterator[Document]:
+    """Splits many documents into sentences at once, using spacy's nlp.pipe
+
+    This is much faster than letting each document split its own text when its
+    sentences are first accessed. Documents are yielded in the order they were given,
+    with their sentence spans set. Documents which already have sentence spans are
+    passed through untouched.
+
+    :param Iterable[Document] documents: The documents to segment
+    :param int batch_size: The number of documents to send through the pipeline at once
+    :param int n_process: The number of processes to segment documents with
+    :return Iterator[Document]: The segmented documents
+    """
+    # documents are queued here in the order they were read, so that each result from
+    # nlp.pipe can be matched up with its document. Only the texts are sent to spacy,
+    # because anything passed along with them is copied to every process.
+    queue = deque()
+
+    def texts() -> Iterator[str]:
+        for document in documents:
+            is_segmented = document._sentence_spans is not None
+            queue.append((document, is_segmented))
+            if not is_segmented:
+                yield document.text
+
+    for doc in nlp.pipe(texts(), batch_size=batch_size, n_process=n_process):
+        while queue[0][1]:
+            yield queue.popleft()[0]
+        document, _ = queue.popleft()
+        document.sentence_spans = _spans_from_sentences(doc)
+        yield document
+    while queue:
+        yield queue.popleft()[0]
@@ -0,0 +1,313 @@
+import fcntl
+import hashlib
+import json
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer, PreTrainedModel, PreTrainedTokenizer
+
+
+@lru_cache(maxsize=None)
+def load_backbone(model_name: str) -> Tuple[PreTrainedTokenizer, PreTrainedModel]:
+    """
+    Load a tokenizer and transformer model, once per process.
+
+    :param str model_name: The name of the model to load
+    :return Tuple[PreTrainedTokenizer, PreTrainedModel]: The tokenizer and model
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    return tokenizer, model
+
+
+class EmbeddingStore:
+    """
+    An on-disk store of text embeddings for a single model.
+
+    Embeddings are appended to a flat binary matrix which is memory-mapped for
+    reading, and each row is keyed by a hash of the model name and the embedded
+    text. Texts which have been embedded before can be looked up without running the
+    model again. Several processes can safely add to the same store.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        model_name: str,
+        dimensions: int,
+        dtype: str = "float16",
+    ):
+        """
+        :param Union[str, Path] directory: The directory to keep stores in. Each model
+        gets its own subdirectory.
+        :param str model_name: The name of the model which produced the embeddings
+        :param int dimensions: The number of dimensions in each embedding
+        :param str dtype: The numpy dtype used to store embeddings on disk
+        :raises ValueError: If an existing store doesn't match the given parameters
+        """
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self.directory = Path(directory) / model_name.replace("/", "--")
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.metadata_path = self.directory / "metadata.json"
+        self.keys_path = self.directory / "keys.txt"
+        self.embeddings_path = self.directory / "embeddings.bin"
+        self.lock_path = self.directory / ".lock"
+
+        metadata = {
+            "model_name": model_name,
+            "dimensions": dimensions,
+            "dtype": self.dtype.name,
+        }
+        with self._lock():
+            if self.metadata_path.exists():
+                existing_metadata = json.loads(self.metadata_path.read_text())
+                if existing_metadata != metadata:
+                    raise ValueError(
+                        f"Embedding store at {self.directory} was created with "
+                        f"{existing_metadata}, which doesn't match {metadata}"
+                    )
+            else:
+                self.metadata_path.write_text(json.dumps(metadata))
+            self.keys_path.touch()
+            self.embeddings_path.touch()
+
+        self.index: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._embeddings: Optional[np.memmap] = None
+        self._refresh()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.directory}, n={len(self)})"
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, text: str) -> bool:
+        return self.key(text) in self.index
+
+    @property
+    def row_size(self) -> int:
+        return self.dimensions * self.dtype.itemsize
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode()).hexdigest()
+
+    @contextmanager
+    def _lock(self):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up any keys and embeddings which have been added since the last read"""
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            new_keys = f.read()
+        # only consume complete lines, in case another process is mid-write
+        complete = new_keys[: new_keys.rfind(b"\n") + 1]
+        self._keys_offset += len(complete)
+        for key in complete.decode("ascii").splitlines():
+            self.index[key] = len(self.index)
+
+        if len(self.index) == 0:
+            self._embeddings = None
+        elif self._embeddings is None or len(self._embeddings) != len(self.index):
+            self._embeddings = np.memmap(
+                self.embeddings_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(len(self.index), self.dimensions),
+            )
+
+    def get(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Look up the stored embeddings for a list of texts.
+
+        :param List[str] texts: The texts to look up
+        :return Tuple[np.ndarray, List[int]]: A (len(texts), dimensions) float32 matrix
+        of embeddings, and the indices of the texts which weren't found in the store.
+        The rows for missing texts are left as zeros.
+        """
+        self._refresh()
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        found_indices, found_rows, missing_indices = [], [], []
+        for i, text in enumerate(texts):
+            row = self.index.get(self.key(text))
+            if row is None:
+                missing_indices.append(i)
+            else:
+                found_indices.append(i)
+                found_rows.append(row)
+        if found_rows:
+            embeddings[found_indices] = self._embeddings[found_rows]
+        return embeddings, missing_indices
+
+    def add(self, texts: List[str], embeddings: np.ndarray):
+        """
+        Add embeddings for a list of texts to the store.
+
+        Texts which are already in the store are skipped.
+
+        :param List[str] texts: The texts which were embedded
+        :param np.ndarray embeddings: A (len(texts), dimensions) matrix of embeddings
+        """
+        if len(texts) != len(embeddings):
+            raise ValueError(f"Got {len(texts)} texts but {len(embeddings)} embeddings")
+        with self._lock():
+            self._refresh()
+            new_keys, new_rows = {}, []
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key not in self.index and key not in new_keys:
+                    new_keys[key] = len(new_rows)
+                    new_rows.append(embedding)
+            if not new_keys:
+                return
+
+            # embeddings are written before their keys, so a key never points at a
+            # missing row. Drop any rows, or part of a key, left over from an
+            # interrupted write first.
+            with open(self.embeddings_path, "r+b") as f:
+                f.truncate(len(self.index) * self.row_size)
+                f.seek(0, 2)
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+            with open(self.keys_path, "r+b") as f:
+                f.truncate(self._keys_offset)
+                f.seek(0, 2)
+                f.write("".join(f"{key}\n" for key in new_keys).encode("ascii"))
+            self._refresh()
+
+
+class SentenceEncoder:
+    """
+    Embeds text using a transformer model.
+
+    Encoders which use the same model share a single copy of its weights, and the
+    weights are not included when an encoder is pickled. Anything which holds an
+    encoder (eg a classifier) can be saved to disk without taking a copy of the model
+    along with it, and the model will be loaded (once) when it is unpickled.
+
+    If an EmbeddingStore is attached, normalised embeddings are read from the store
+    where possible, and only texts which haven't been seen before are run through
+    the model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        batch_size: int = 32,
+        n_threads: Optional[int] = None,
+        store: Optional[EmbeddingStore] = None,
+    ):
+        """
+        :param str model_name: The name of the transformer model used to embed text
+        :param int batch_size: The number of texts to embed in each forward pass
+        :param Optional[int] n_threads: The number of threads torch should use for
+        inference, defaults to torch's own default
+        :param Optional[EmbeddingStore] store: A store of previously computed
+        embeddings. Stores are not kept when the encoder is pickled.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.n_threads = n_threads
+        self.store = store
+        self.tokenizer, self.model = load_backbone(model_name)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.model_name})"
+
+    def __getstate__(self) -> dict:
+        return {
+            "model_name": self.model_name,
+            "batch_size": self.batch_size,
+            "n_threads": self.n_threads,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    @property
+    def dimensions(self) -> int:
+        return self.model.config.hidden_size
+
+    def use_store(self, directory: Union[str, Path]) -> EmbeddingStore:
+        """
+        Attach an embedding store for this encoder's model.
+
+        :param Union[str, Path] directory: The directory to keep stores in
+        :return EmbeddingStore: The attached store
+        """
+        self.store = EmbeddingStore(directory, self.model_name, self.dimensions)
+        return self.store
+
+    def encode(self, texts: List[str], normalize: bool = True) -> torch.Tensor:
+        """
+        Embed a list of texts, reading from the attached store where possible.
+
+        :param List[str] texts: The texts to embed
+        :param bool normalize: Whether to L2-normalise the embeddings. Only normalised
+        embeddings are stored.
+        :return torch.Tensor: A (len(texts), dimensions) matrix of embeddings, in the
+        same order as the input texts
+        """
+        if self.store is None or not normalize:
+            return self._encode(texts, normalize=normalize)
+
+        embeddings, missing_indices = self.store.get(texts)
+        if missing_indices:
+            missing_texts = [texts[i] for i in missing_indices]
+            new_embeddings = self._encode(missing_texts).numpy()
+            self.store.add(missing_texts, new_embeddings)
+            # round-trip through the store's dtype, so that results don't depend on
+            # whether a text was already in the store
+            embeddings[missing_indices] = new_embeddings.astype(self.store.dtype)
+        return torch.from_numpy(embeddings)
+
+    def _encode(self, texts: List[str], normalize: bool = True) -> torch.Tensor:
+        """
+        Embed a list of texts in padded batches, without tracking gradients.
+
+        Texts are sorted by length before batching so that each batch contains texts
+        of a similar length, which keeps the amount of padding to a minimum.
+
+        :param List[str] texts: The texts to embed
+        :param bool normalize: Whether to L2-normalise the embeddings
+        :return torch.Tensor: A (len(texts), dimensions) matrix of embeddings, in the
+        same order as the input texts
+        """
+        if self.n_threads:
+            torch.set_num_threads(self.n_threads)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = torch.empty(len(texts), self.dimensions)
+        with torch.inference_mode():
+            for batch_start in range(0, len(order), self.batch_size):
+                batch_indices = order[batch_start : batch_start + self.batch_size]
+                inputs = self.tokenizer(
+                    [texts[i] for i in batch_indices],
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt",
+                )
+                outputs = self.model(**inputs)
+
+                # mean pool over the real tokens in each text, ignoring padding
+                mask = inputs["attention_mask"].unsqueeze(-1).to(torch.float32)
+                summed = (outputs.last_hidden_state * mask).sum(dim=1)
+                counts = mask.sum(dim=1).clamp(min=1e-9)
+                embeddings[batch_indices] = summed / counts
+
+        if normalize:
+            embeddings = torch.nn.functional.normalize(embeddings, dim=1)
+        return embeddings
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Iterable, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 from pydantic import BaseModel
 from rich.progress import track
@@ -12,7 +12,10 @@ Item = Union[Concept, Document]
 
 class SearchResponse(BaseModel):
     total: int
-    results: List[Item]
+    # results are dicts when only some of the fields of each item were requested
+    results: List[Union[Dict[str, Any], Item]]
+    # the cursor for the next page, when paging through results with a cursor
+    next_cursor: Optional[str] = None
 
 
 class SearchEngine(ABC):
@@ -0,0 +1,179 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Hashable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+def new_generation() -> str:
+    """
+    Generate a fresh stamp for an index's contents.
+
+    An index's generation is stored in its mapping's _meta, and is replaced whenever
+    the contents of the index change. Stamps are timestamps, so they never repeat,
+    even across indices which are rebuilt behind an alias.
+
+    :return str: The generation stamp
+    """
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+
+
+def normalise_search_terms(search_terms: Optional[str]) -> Optional[str]:
+    """
+    Normalise search terms for use in a cache key.
+
+    Whitespace doesn't change how terms are analysed, so "covid  19 " and "covid 19"
+    share a key.
+
+    :param Optional[str] search_terms: The search terms
+    :return Optional[str]: The normalised search terms, or None if there aren't any
+    """
+    if not search_terms:
+        return None
+    return " ".join(search_terms.split()) or None
+
+
+def normalise_list(values: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    """
+    Normalise an unordered list of values (eg concept ids or fields) for use in a
+    cache key.
+
+    :param Optional[List[str]] values: The values
+    :return Optional[Tuple[str, ...]]: The sorted, deduplicated values, or None
+    """
+    if values is None:
+        return None
+    return tuple(sorted(set(values)))
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    size: int
+    max_size: int
+    n_bytes: int
+    max_bytes: int
+    ttl: float
+    generation: Optional[str]
+
+
+class QueryCache:
+    """
+    An in-process LRU cache of search results, whose entries expire after a TTL.
+
+    Keys include the generation of the index which the results came from, so when an
+    index is synced, reindexed or written to, its old results stop being served
+    without the cache having to be cleared (they're evicted as they age out). Reading
+    the generation is itself a round trip to elasticsearch, so it's only checked
+    every generation_ttl seconds. After an index changes, its old results can be
+    served for up to that long.
+
+    The cache is bounded by the approximate size of its values in bytes, as well as
+    by their number, because a single page of results can be large. Each value's
+    size is given when it's cached (eg the length of its serialised json).
+
+    Cached values are shared between callers, so they mustn't be modified.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 300,
+        generation_ttl: float = 5,
+    ):
+        """
+        :param int max_size: The maximum number of results to keep
+        :param int max_bytes: The maximum total size of the results to keep
+        :param float ttl: The number of seconds for which results are served
+        :param float generation_ttl: The number of seconds between checks of the
+        index's generation
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.ttl = ttl
+        self.generation_ttl = generation_ttl
+        self.generation: Optional[str] = None
+        self.generation_checked_at = -float("inf")
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Tuple[float, int, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation_is_stale(self) -> bool:
+        return time.monotonic() - self.generation_checked_at > self.generation_ttl
+
+    def set_generation(self, generation: Optional[str]):
+        self.generation = generation
+        self.generation_checked_at = time.monotonic()
+
+    def key(self, *parts: Hashable) -> Tuple:
+        """
+        Build a cache key for a query from the current generation and the query's
+        (already normalised) parameters
+        """
+        return (self.generation, *parts)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Fetch a cached value, counting a hit or a miss.
+
+        :param Hashable key: The key, from QueryCache.key
+        :return Optional[Any]: The value, or None if it isn't cached or has expired
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, size: int = 0):
+        """
+        Cache a value, evicting the least recently used values to make room for it.
+
+        :param Hashable key: The key, from QueryCache.key
+        :param Any value: The value
+        :param int size: The approximate size of the value in bytes. Values which are
+        bigger than max_bytes aren't cached
+        """
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.n_bytes += size
+        while len(self._entries) > self.max_size or self.n_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self.n_bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.n_bytes = 0
+
+    def stats(self) -> CacheStats:
+        n_lookups = self.hits + self.misses
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / n_lookups if n_lookups else 0.0,
+            size=len(self._entries),
+            max_size=self.max_size,
+            n_bytes=self.n_bytes,
+            max_bytes=self.max_bytes,
+            ttl=self.ttl,
+            generation=self.generation,
+        )
@@ -1,17 +1,608 @@
+import base64
+import binascii
 import json
-from typing import List, Optional
+from contextlib import suppress
+from functools import partial
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from elasticsearch import Elasticsearch
+from elasticsearch import (
+    AsyncElasticsearch,
+    BadRequestError,
+    Elasticsearch,
+    NotFoundError,
+    helpers,
+)
+from pydantic import BaseModel
+from rich.progress import track
 
 from src.concept import Concept
+from src.corpus import Corpus
 from src.document import Document
-from src.search import SearchEngine, SearchResponse
+from src.identifiers import pretty_hash
+from src.logging import get_logger
+from src.search import Item, SearchEngine, SearchResponse
+from src.search.cache import (
+    QueryCache,
+    new_generation,
+    normalise_list,
+    normalise_search_terms,
+)
 
+logger = get_logger(__name__)
 
-class DocumentSearchEngine(SearchEngine):
-    def __init__(self, elasticsearch: Elasticsearch, index_name: str = "documents"):
+# the fields of a serialised document, which can be requested from a search
+document_fields = list(Document.model_fields) + list(Document.model_computed_fields)
+
+
+class BulkResponse(BaseModel):
+    n_succeeded: int
+    errors: List[dict]
+
+
+def bulk_index(
+    elasticsearch: Elasticsearch,
+    actions: Iterable[dict],
+    chunk_size: int = 500,
+    max_chunk_bytes: int = 100 * 1024 * 1024,
+    max_retries: int = 3,
+    initial_backoff: float = 2,
+    max_backoff: float = 600,
+    thread_count: int = 1,
+    progress_bar: Optional[bool] = False,
+) -> BulkResponse:
+    """
+    Send a stream of actions to elasticsearch in bulk requests.
+
+    Failed items are logged and returned, rather than stopping the whole load.
+
+    :param Elasticsearch elasticsearch: The elasticsearch client
+    :param Iterable[dict] actions: The bulk actions to send, eg
+    {"_index": "documents", "_id": "abc", "_source": {...}}
+    :param int chunk_size: The maximum number of actions in each bulk request
+    :param int max_chunk_bytes: The maximum size of each bulk request in bytes
+    :param int max_retries: The number of times to retry items which were rejected
+    because elasticsearch was overloaded (HTTP 429). Only used when thread_count is 1
+    :param float initial_backoff: Seconds to wait before the first retry. The wait
+    doubles with each subsequent retry
+    :param float max_backoff: The maximum number of seconds to wait between retries
+    :param int thread_count: The number of threads to send requests with. If more
+    than 1, requests are sent in parallel, without retries
+    :param Optional[bool] progress_bar: Whether to show a progress bar
+    :return BulkResponse: The number of successful items, and details of any errors
+    """
+    if thread_count > 1:
+        results = helpers.parallel_bulk(
+            elasticsearch,
+            actions,
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+    else:
+        results = helpers.streaming_bulk(
+            elasticsearch,
+            actions,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            max_retries=max_retries,
+            initial_backoff=initial_backoff,
+            max_backoff=max_backoff,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+    if progress_bar:
+        results = track(results, description="Indexing items")
+
+    n_succeeded = 0
+    errors = []
+    for ok, info in results:
+        if ok:
+            n_succeeded += 1
+        else:
+            logger.error(f"Failed to index item: {info}")
+            errors.append(info)
+    return BulkResponse(n_succeeded=n_succeeded, errors=errors)
+
+
+class ReindexError(Exception):
+    """Raised when an index can't be rebuilt. The existing index is left untouched"""
+
+    def __init__(self, message: str, response: Optional[BulkResponse] = None):
+        super().__init__(message)
+        self.response = response
+
+
+class SyncResponse(BulkResponse):
+    n_indexed: int
+    n_deleted: int
+    n_unchanged: int
+
+
+# an item to sync into an index: its id, its fingerprint, and a function which builds
+# its source. Sources are only built for the items which have changed.
+SyncItem = Tuple[str, str, Callable[[], dict]]
+
+
+def fingerprint(source: dict) -> str:
+    """
+    Hash the complete contents of an item, so that changes can be detected.
+
+    Item ids don't necessarily capture everything about an item (eg a document's id
+    doesn't change when new concepts are found in it), so each indexed item is stored
+    with a fingerprint of its full source. Items which can be fingerprinted more
+    cheaply than by serialising them (eg documents, see Document.fingerprint) don't
+    need to use this.
+
+    :param dict source: The item's source, as it will be indexed
+    :return str: The fingerprint
+    """
+    return pretty_hash({k: v for k, v in source.items() if k != "fingerprint"})
+
+
+def sync_index(
+    elasticsearch: Elasticsearch,
+    index_name: str,
+    items: Iterable[SyncItem],
+    progress_bar: Optional[bool] = False,
+    **kwargs,
+) -> SyncResponse:
+    """
+    Bring an index in line with a complete stream of items, sending only the changes.
+
+    The ids and fingerprints of everything already in the index are fetched first,
+    and compared with the ids and fingerprints in the stream. Sources are only built
+    for items which are new or whose fingerprint has changed, and those items are
+    (re)indexed. Anything in the index which doesn't appear in the stream is deleted.
+    NB the stream must contain the full set of items which should be in the index!
+
+    :param Elasticsearch elasticsearch: The elasticsearch client
+    :param str index_name: The index (or alias) to sync
+    :param Iterable[SyncItem] items: The id, fingerprint and a function which builds
+    the source of every item which should be in the index
+    :param Optional[bool] progress_bar: Whether to show a progress bar
+    :param kwargs: Passed to bulk_index, eg chunk_size, max_retries, thread_count
+    :return SyncResponse: Counts of indexed, deleted and unchanged items, and details
+    of any errors
+    """
+    existing_fingerprints = {
+        hit["_id"]: hit.get("_source", {}).get("fingerprint")
+        for hit in helpers.scan(
+            elasticsearch, index=index_name, _source=["fingerprint"], size=5000
+        )
+    }
+    logger.info(f"Found {len(existing_fingerprints)} items in {index_name}")
+
+    counts = {"n_indexed": 0, "n_deleted": 0, "n_unchanged": 0}
+
+    def changed_actions():
+        seen_ids = set()
+        for item_id, item_fingerprint, build_source in items:
+            seen_ids.add(item_id)
+            if existing_fingerprints.get(item_id) == item_fingerprint:
+                counts["n_unchanged"] += 1
+                continue
+            counts["n_indexed"] += 1
+            source = build_source()
+            source["fingerprint"] = item_fingerprint
+            yield {"_index": index_name, "_id": item_id, "_source": source}
+
+        for removed_id in existing_fingerprints.keys() - seen_ids:
+            counts["n_deleted"] += 1
+            yield {"_op_type": "delete", "_index": index_name, "_id": removed_id}
+
+    response = bulk_index(
+        elasticsearch, changed_actions(), progress_bar=progress_bar, **kwargs
+    )
+    return SyncResponse(**response.model_dump(), **counts)
+
+
+def _generation(mappings: dict) -> Optional[str]:
+    # an alias can point at several indices, so take the latest of their generations
+    generations = [
+        mapping["mappings"].get("_meta", {}).get("generation")
+        for mapping in mappings.values()
+    ]
+    return max((g for g in generations if g), default=None)
+
+
+def encode_cursor(point_in_time_id: str, search_after: list) -> str:
+    """
+    Pack a point in time and a position in it into an opaque, url-safe cursor.
+
+    :param str point_in_time_id: The id of the point in time which is being paged
+    through
+    :param list search_after: The sort values of the last hit on the current page
+    :return str: The cursor
+    """
+    data = json.dumps({"pit": point_in_time_id, "after": search_after}).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, list]:
+    """
+    Unpack a cursor made by encode_cursor.
+
+    :param str cursor: The cursor
+    :raises ValueError: If the cursor isn't valid
+    :return Tuple[str, list]: The point in time id, and the sort values to search
+    after
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        point_in_time_id, search_after = data["pit"], data["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(point_in_time_id, str) or not isinstance(search_after, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return point_in_time_id, search_after
+
+
+class ElasticsearchSearchEngine(SearchEngine):
+    """Shared behaviour for search engines which are backed by an elasticsearch index"""
+
+    elasticsearch: Elasticsearch
+    index_name: str
+
+    settings: dict
+    mappings: dict
+
+    # the type of item stored in the index, and whether hits should be validated when
+    # they're read back out of it
+    item_type: type
+    validate_hits: bool = False
+
+    # recent search results. Keyed by the index's generation, which changes whenever
+    # the engine writes to the index
+    cache: Optional[QueryCache] = None
+
+    def generation(self) -> Optional[str]:
+        """
+        Get the index's generation stamp, from its mapping's _meta.
+
+        :return Optional[str]: The generation, or None if the index has never been
+        written to by a search engine
+        """
+        return _generation(
+            self.elasticsearch.indices.get_mapping(index=self.index_name)
+        )
+
+    def _bump_generation(self):
+        """
+        Stamp the index with a new generation, so that cached results are dropped.
+
+        The index is refreshed first, so that the changes are searchable before any
+        new results can be cached against the new generation.
+        """
+        self.elasticsearch.indices.refresh(index=self.index_name)
+        self.elasticsearch.indices.put_mapping(
+            index=self.index_name, meta={"generation": new_generation()}
+        )
+
+    def _cached_search(
+        self,
+        key: Optional[Tuple],
+        request: dict,
+        parse: Callable[[dict], SearchResponse],
+    ) -> SearchResponse:
+        """
+        Run a search, serving its results from the cache if possible.
+
+        :param Optional[Tuple] key: The search's normalised parameters, or None if the
+        search's results shouldn't be cached
+        :param dict request: The search request, passed to elasticsearch.search
+        :param Callable[[dict], SearchResponse] parse: Builds the search response
+        from the raw elasticsearch response
+        :return SearchResponse: The search response
+        """
+        if self.cache is None or key is None:
+            return parse(self.elasticsearch.search(**request))
+        if self.cache.generation_is_stale:
+            self.cache.set_generation(self.generation())
+        key = self.cache.key(*key)
+        response = self.cache.get(key)
+        if response is None:
+            response = parse(self.elasticsearch.search(**request))
+            self.cache.set(key, response, size=len(response.model_dump_json()))
+        return response
+
+    def _from_source(self, source: dict) -> Item:
+        """
+        Build an item from the source of an elasticsearch hit.
+
+        Sources are serialised items which were validated before they were indexed,
+        so by default they're trusted rather than validated again (see
+        Document.from_trusted). Set validate_hits to validate them anyway.
+
+        :param dict source: The hit's _source
+        :return Item: The item
+        """
+        if self.validate_hits:
+            return self.item_type.model_validate(source)
+        return self.item_type.from_trusted(source)
+
+    def get_items(
+        self, ids: List[str], fields: Optional[List[str]] = None
+    ) -> List[Union[Dict, Item]]:
+        """
+        Fetch several items by id in a single request.
+
+        :param List[str] ids: The ids of the items
+        :param Optional[List[str]] fields: Only fetch these fields of each item, which
+        are returned as dicts rather than items
+        :return List[Union[Dict, Item]]: The items which exist, in the order of their
+        ids. Missing ids are skipped, and repeated ids are only returned once
+        """
+        if not ids:
+            return []
+        response = self.elasticsearch.mget(**self._mget_request(ids, fields))
+        return self._mget_results(response, fields)
+
+    def _mget_request(self, ids: List[str], fields: Optional[List[str]]) -> dict:
+        return {
+            "index": self.index_name,
+            "ids": list(dict.fromkeys(ids)),
+            "source_includes": fields,
+        }
+
+    def _mget_results(
+        self, response: dict, fields: Optional[List[str]] = None
+    ) -> List[Union[Dict, Item]]:
+        sources = [doc["_source"] for doc in response["docs"] if doc.get("found")]
+        if fields is not None:
+            return sources
+        return [self._from_source(source) for source in sources]
+
+    def ensure_index(self):
+        """Create the index with the engine's settings and mappings if it's missing"""
+        self.index_exists = self.elasticsearch.indices.exists(index=self.index_name)
+        if not self.index_exists:
+            self.elasticsearch.indices.create(
+                index=self.index_name, settings=self.settings, mappings=self.mappings
+            )
+
+    def _fingerprint(self, item: Item) -> str:
+        return fingerprint(item.model_dump())
+
+    def _to_source(self, item: Item) -> dict:
+        source = item.model_dump()
+        source["fingerprint"] = fingerprint(source)
+        return source
+
+    def _sync_items(self, items: Iterable[Item]) -> Iterator[SyncItem]:
+        for item in items:
+            yield item.id, self._fingerprint(item), partial(self._to_source, item)
+
+    def _to_action(self, item: Item, index: Optional[str] = None) -> dict:
+        return {
+            "_index": index or self.index_name,
+            "_id": item.id,
+            "_source": self._to_source(item),
+        }
+
+    def insert_item(self, item: Item):
+        self.elasticsearch.index(
+            index=self.index_name, id=item.id, document=self._to_source(item)
+        )
+        self._bump_generation()
+
+    def insert_items(
+        self, items: Iterable[Item], progress_bar: Optional[bool] = False, **kwargs
+    ) -> BulkResponse:
+        """
+        Index a stream of items using elasticsearch's bulk API.
+
+        :param Iterable[Item] items: The items to index
+        :param Optional[bool] progress_bar: Whether to show a progress bar
+        :param kwargs: Passed to bulk_index, eg chunk_size, max_retries, thread_count
+        :return BulkResponse: The number of indexed items, and details of any errors
+        """
+        actions = (self._to_action(item) for item in items)
+        response = bulk_index(
+            self.elasticsearch, actions, progress_bar=progress_bar, **kwargs
+        )
+        if response.n_succeeded:
+            self._bump_generation()
+        return response
+
+    def sync(
+        self, items: Iterable[Item], progress_bar: Optional[bool] = False, **kwargs
+    ) -> SyncResponse:
+        """
+        Incrementally update the index to match a complete set of items.
+
+        Only new or changed items are serialised and sent to elasticsearch, and items
+        which are no longer present are deleted. See sync_index for details.
+
+        :param Iterable[Item] items: The complete set of items which should be indexed
+        :param Optional[bool] progress_bar: Whether to show a progress bar
+        :param kwargs: Passed to bulk_index, eg chunk_size, max_retries, thread_count
+        :return SyncResponse: Counts of indexed, deleted and unchanged items, and
+        details of any errors
+        """
+        response = sync_index(
+            self.elasticsearch,
+            self.index_name,
+            self._sync_items(items),
+            progress_bar=progress_bar,
+            **kwargs,
+        )
+        if response.n_indexed or response.n_deleted:
+            self._bump_generation()
+        return response
+
+    def reindex(
+        self,
+        items: Iterable[Item],
+        progress_bar: Optional[bool] = False,
+        number_of_replicas: Optional[int] = None,
+        delete_old_indices: bool = True,
+        **kwargs,
+    ) -> BulkResponse:
+        """
+        Rebuild the index from scratch without interrupting searches.
+
+        The items are loaded into a new, timestamped index with refreshes and replicas
+        disabled, which makes bulk loading much cheaper. Once the load is complete, the
+        index is refreshed and force-merged, and only then are its settings restored,
+        so that replicas copy the merged segments rather than merging their own. The
+        engine's index_name is then atomically switched over to point at the new index
+        as an alias. Searches are served by the old index until the switch.
+
+        If any item fails to index, or any step of the rebuild fails, the new index
+        is deleted and the alias is left pointing at the old one.
+
+        :param Iterable[Item] items: The complete set of items to index
+        :param Optional[bool] progress_bar: Whether to show a progress bar
+        :param Optional[int] number_of_replicas: The number of replicas to restore
+        after loading. By default, this is taken from the engine's settings, or
+        else from the index which is being replaced
+        :param bool delete_old_indices: Whether to delete the indices which previously
+        served the alias. If False, they're kept (detached from the alias) so that a
+        rebuild can be rolled back
+        :param kwargs: Passed to bulk_index, eg chunk_size, max_retries, thread_count
+        :raises ReindexError: If any items failed to index
+        :return BulkResponse: The number of indexed items
+        """
+        if number_of_replicas is None:
+            number_of_replicas = self._number_of_replicas()
+        # the new index starts at a new generation, so switching over to it drops any
+        # cached results from the old one
+        generation = new_generation()
+        new_index = f"{self.index_name}-{generation}"
+        self.elasticsearch.indices.create(
+            index=new_index,
+            settings={
+                **self.settings,
+                "index": {
+                    **self.settings.get("index", {}),
+                    "refresh_interval": "-1",
+                    "number_of_replicas": 0,
+                },
+            },
+            mappings={**self.mappings, "_meta": {"generation": generation}},
+        )
+        logger.info(f"Created {new_index} for reindexing {self.index_name}")
+
+        try:
+            actions = (self._to_action(item, index=new_index) for item in items)
+            response = bulk_index(
+                self.elasticsearch, actions, progress_bar=progress_bar, **kwargs
+            )
+            if response.errors:
+                raise ReindexError(
+                    f"Failed to index {len(response.errors)} items into {new_index}",
+                    response,
+                )
+
+            self.elasticsearch.indices.refresh(index=new_index)
+            # merging can take a while for a large index
+            self.elasticsearch.options(request_timeout=3600).indices.forcemerge(
+                index=new_index, max_num_segments=1
+            )
+            self.elasticsearch.indices.put_settings(
+                index=new_index,
+                settings={
+                    "index": {
+                        "refresh_interval": None,
+                        "number_of_replicas": number_of_replicas,
+                    }
+                },
+            )
+
+            self._swap_alias(new_index, delete_old_indices=delete_old_indices)
+        except BaseException:
+            # the alias is only switched once everything else has succeeded, and the
+            # switch is atomic, so the incomplete index was never served
+            logger.error(f"Rebuild of {self.index_name} failed, deleting {new_index}")
+            self.elasticsearch.indices.delete(index=new_index, ignore_unavailable=True)
+            raise
+        return response
+
+    def _number_of_replicas(self) -> int:
+        """
+        Find the number of replicas which a rebuilt index should have: the number in
+        the engine's settings if it's set, or else the number which the current index
+        has, or else elasticsearch's default of 1
+        """
+        index_settings = self.settings.get("index", {})
+        if "number_of_replicas" in index_settings:
+            return int(index_settings["number_of_replicas"])
+        if "index.number_of_replicas" in self.settings:
+            return int(self.settings["index.number_of_replicas"])
+        if self.elasticsearch.indices.exists(index=self.index_name):
+            current = self.elasticsearch.indices.get_settings(
+                index=self.index_name, name="index.number_of_replicas"
+            )
+            replicas = [
+                int(index["settings"]["index"]["number_of_replicas"])
+                for index in current.values()
+            ]
+            if replicas:
+                return max(replicas)
+        return 1
+
+    def _swap_alias(self, new_index: str, delete_old_indices: bool = True):
+        """
+        Atomically point the engine's index_name alias at a new index.
+
+        :param str new_index: The index which the alias should point to
+        :param bool delete_old_indices: Whether to delete the indices which previously
+        served the alias
+        """
+        actions = [{"add": {"index": new_index, "alias": self.index_name}}]
+        if self.elasticsearch.indices.exists_alias(name=self.index_name):
+            old_indices = self.elasticsearch.indices.get_alias(name=self.index_name)
+            for old_index in old_indices:
+                if delete_old_indices:
+                    actions.append({"remove_index": {"index": old_index}})
+                else:
+                    actions.append(
+                        {"remove": {"index": old_index, "alias": self.index_name}}
+                    )
+        elif self.elasticsearch.indices.exists(index=self.index_name):
+            # a concrete index can't share a name with an alias, so it has to go
+            actions.append({"remove_index": {"index": self.index_name}})
+
+        self.elasticsearch.indices.update_aliases(actions=actions)
+        logger.info(f"Pointed {self.index_name} at {new_index}")
+
+
+class DocumentSearchEngine(ElasticsearchSearchEngine):
+    item_type = Document
+
+    # how long a point in time is kept open between the pages of a cursor traversal
+    point_in_time_keep_alive = "1m"
+    # ties between scores are broken by each hit's position in the point in time, so
+    # every hit has a fixed place in the order and cursors never skip or repeat hits
+    cursor_sort = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+    # exports don't need to be ordered by relevance, so they're read in index order,
+    # which is the cheapest order to search a point in time in
+    export_sort = [{"_shard_doc": "asc"}]
+
+    def __init__(
+        self,
+        elasticsearch: Elasticsearch,
+        index_name: str = "documents",
+        validate_hits: bool = False,
+        create_index: bool = True,
+        cache: Optional[QueryCache] = None,
+    ):
         self.elasticsearch = elasticsearch
         self.index_name = index_name
+        self.validate_hits = validate_hits
+        self.cache = cache
 
         self.settings = {
             "analysis": {
@@ -56,6 +647,7 @@ class DocumentSearchEngine(SearchEngine):
                 "text": {"type": "text", "analyzer": "english_analyzer"},
                 "summary": {"type": "text", "analyzer": "english_analyzer"},
                 "concepts": {"type": "keyword"},
+                "fingerprint": {"type": "keyword"},
             }
         }
         self.query = {
@@ -65,65 +657,339 @@ class DocumentSearchEngine(SearchEngine):
             }
         }
 
-        self.index_exists = self.elasticsearch.indices.exists(index=self.index_name)
-        if not self.index_exists:
-            self.elasticsearch.indices.create(
-                index=self.index_name, settings=self.settings, mappings=self.mappings
-            )
+        if create_index:
+            self.ensure_index()
 
     def _build_query(self, search_terms: Optional[str], concepts: List[str] = []):
-        core_query = self.query if search_terms else {"match_all": {}}
-        query = query = {
+        if search_terms:
+            # substitute the search terms as a json string, so that quotes etc in the
+            # terms can't break the query
+            core_query = json.loads(
+                json.dumps(self.query).replace(
+                    '"{{search_terms}}"', json.dumps(search_terms)
+                )
+            )
+        else:
+            core_query = {"match_all": {}}
+        query = {
             "bool": {
-                "should": [core_query],
+                "must": [core_query],
                 "filter": [],
             }
         }
-        if search_terms:
-            query = json.loads(
-                json.dumps(self.query).replace("{{search_terms}}", search_terms)
-            )
 
         if concepts:
             query["bool"]["filter"].append({"terms": {"concepts": concepts}})
 
         return query
 
-    def insert_item(self, item: Document):
-        self.elasticsearch.index(
-            index=self.index_name, id=item.id, document=item.model_dump()
-        )
-
     def search(
         self,
         search_terms: Optional[str],
         page: int = 1,
         page_size: int = 10,
         concepts: List[str] = [],
+        fields: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
     ) -> SearchResponse:
-        query = self._build_query(search_terms, concepts)
-        response = self.elasticsearch.search(
-            index=self.index_name,
-            query=query,
-            from_=(page - 1) * page_size,
-            size=page_size,
+        """
+        Search for documents.
+
+        Results can be paged through by page number, or with a cursor. The cost of a
+        page number grows with its depth (elasticsearch has to collect and discard
+        every preceding hit), and pages beyond the index's max_result_window can't
+        be fetched at all. Cursors search a point in time of the index after the
+        last hit of the previous page, so every page costs the same, and results
+        don't shift between pages if the index changes mid-traversal.
+
+        :param Optional[str] search_terms: Search terms for full-text search
+        :param int page: The page of results to return. Ignored if a cursor is set
+        :param int page_size: The number of results on each page
+        :param List[str] concepts: Only return documents which mention any of these
+        concept ids
+        :param Optional[List[str]] fields: Only fetch these fields of each document,
+        eg ["id", "title"]. If set, results are returned as dicts of the requested
+        fields rather than as Documents. By default, full documents are returned.
+        :param Optional[str] cursor: Pass "*" to start paging through the results
+        with a cursor, then pass each response's next_cursor to fetch the page after
+        it. Cursors expire if they're not used within point_in_time_keep_alive
+        :raises ValueError: If any of the fields aren't fields of a document, or if
+        the cursor is invalid or has expired
+        :return SearchResponse: The total number of matching documents, and the
+        results for the requested page
+        """
+        if cursor is not None:
+            return self._search_with_cursor(
+                search_terms, page_size, concepts, fields, cursor
+            )
+        return self._cached_search(
+            self._cache_key(search_terms, page, page_size, concepts, fields),
+            self._search_request(search_terms, page, page_size, concepts, fields),
+            lambda response: self._search_response(response, fields),
+        )
+
+    def _cache_key(
+        self,
+        search_terms: Optional[str],
+        page: int,
+        page_size: int,
+        concepts: List[str],
+        fields: Optional[List[str]],
+    ) -> Optional[Tuple]:
+        # full documents include their whole text and every span, so a page of them
+        # is too big to be worth caching
+        if fields is None:
+            return None
+        return (
+            normalise_search_terms(search_terms),
+            normalise_list(concepts),
+            page,
+            page_size,
+            normalise_list(fields),
         )
 
+    def _fingerprint(self, item: Document) -> str:
+        return item.fingerprint
+
+    def _to_source(self, item: Document) -> dict:
+        source = item.model_dump()
+        source["fingerprint"] = item.fingerprint
+        return source
+
+    def _sync_items(self, items: Iterable[Document]) -> Iterator[SyncItem]:
+        if not isinstance(items, Corpus):
+            yield from super()._sync_items(items)
+            return
+        # a corpus stores every document's fingerprint, so documents only need to be
+        # loaded from it if they've changed
+        for view in items.views():
+            yield (
+                view.id,
+                view.fingerprint,
+                lambda view=view: self._to_source(view.to_document()),
+            )
+
+    def _from_source(self, source: dict) -> Document:
+        document = super()._from_source(source)
+        # hits are built while serving requests, which shouldn't run spacy to split the
+        # text into sentences if the indexed document didn't include them
+        document._parse_sentences = False
+        return document
+
+    def _check_fields(self, fields: Optional[List[str]]):
+        if fields is not None:
+            unknown_fields = set(fields) - set(document_fields)
+            if unknown_fields:
+                raise ValueError(f"Unknown document fields: {sorted(unknown_fields)}")
+
+    def _search_request(
+        self,
+        search_terms: Optional[str],
+        page: int,
+        page_size: int,
+        concepts: List[str],
+        fields: Optional[List[str]],
+    ) -> dict:
+        self._check_fields(fields)
+        return {
+            "index": self.index_name,
+            "query": self._build_query(search_terms, concepts),
+            "from_": (page - 1) * page_size,
+            "size": page_size,
+            "source_includes": fields,
+        }
+
+    def _search_response(
+        self, response: dict, fields: Optional[List[str]]
+    ) -> SearchResponse:
         return SearchResponse(
             total=response["hits"]["total"]["value"],
-            results=[Document(**hit["_source"]) for hit in response["hits"]["hits"]],
+            results=self._results(response["hits"]["hits"], fields),
         )
 
+    def _results(
+        self, hits: List[dict], fields: Optional[List[str]]
+    ) -> List[Union[Dict, Document]]:
+        if fields is None:
+            return [self._from_source(hit["_source"]) for hit in hits]
+        return [hit["_source"] for hit in hits]
+
+    def _search_with_cursor(
+        self,
+        search_terms: Optional[str],
+        page_size: int,
+        concepts: List[str],
+        fields: Optional[List[str]],
+        cursor: str,
+    ) -> SearchResponse:
+        request = self._search_request(search_terms, 1, page_size, concepts, fields)
+        if cursor == "*":
+            point_in_time_id = self.elasticsearch.open_point_in_time(
+                index=self.index_name, keep_alive=self.point_in_time_keep_alive
+            )["id"]
+            search_after = None
+        else:
+            point_in_time_id, search_after = decode_cursor(cursor)
+        try:
+            response = self.elasticsearch.search(
+                **self._cursor_request(request, point_in_time_id, search_after)
+            )
+        except BaseException as e:
+            if cursor == "*":
+                # nothing else knows about the point in time which was just opened
+                with suppress(Exception):
+                    self.elasticsearch.close_point_in_time(id=point_in_time_id)
+            error = self._cursor_error(e, cursor)
+            if error is None:
+                raise
+            raise error from e
+
+        search_response = self._cursor_response(response, page_size, fields)
+        if search_response.next_cursor is None:
+            self.elasticsearch.close_point_in_time(id=response["pit_id"])
+        return search_response
+
+    def _cursor_error(self, error: BaseException, cursor: str) -> Optional[ValueError]:
+        """
+        Translate an error from a cursor search. Expired cursors, and cursors whose
+        point in time id is malformed, are the caller's fault, so they become
+        ValueErrors. Anything else is raised as it is
+        """
+        if isinstance(error, NotFoundError):
+            return ValueError("The cursor has expired")
+        if isinstance(error, BadRequestError) and cursor != "*":
+            return ValueError(f"Invalid cursor: {cursor}")
+        return None
+
+    def _cursor_request(
+        self,
+        request: dict,
+        point_in_time_id: str,
+        search_after: Optional[list],
+        sort: Optional[List[dict]] = None,
+    ) -> dict:
+        # searches of a point in time can't name an index or skip hits with from_
+        request = {k: v for k, v in request.items() if k not in ("index", "from_")}
+        request["pit"] = {
+            "id": point_in_time_id,
+            "keep_alive": self.point_in_time_keep_alive,
+        }
+        request["sort"] = sort or self.cursor_sort
+        if search_after is not None:
+            request["search_after"] = search_after
+        return request
+
+    def _cursor_response(
+        self, response: dict, page_size: int, fields: Optional[List[str]]
+    ) -> SearchResponse:
+        search_response = self._search_response(response, fields)
+        hits = response["hits"]["hits"]
+        # a short page means the traversal is complete
+        if len(hits) == page_size:
+            search_response.next_cursor = encode_cursor(
+                response["pit_id"], hits[-1]["sort"]
+            )
+        return search_response
+
+    def export(
+        self,
+        search_terms: Optional[str] = None,
+        concepts: List[str] = [],
+        fields: Optional[List[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Union[Dict, Document]]:
+        """
+        Stream every document which matches a search.
+
+        The matching documents are read from a point in time of the index in
+        batches, so memory use is bounded by the batch size however many documents
+        match, and the results are consistent even if the index changes while
+        they're being read.
+
+        :param Optional[str] search_terms: Search terms for full-text search
+        :param List[str] concepts: Only return documents which mention any of these
+        concept ids
+        :param Optional[List[str]] fields: Only fetch these fields of each document.
+        See DocumentSearchEngine.search
+        :param int batch_size: The number of documents to fetch in each request
+        :raises ValueError: If any of the fields aren't fields of a document. Raised
+        immediately, rather than when the iterator is first advanced
+        :return Iterator[Union[Dict, Document]]: The matching documents, in no
+        particular order
+        """
+        request = self._export_request(search_terms, concepts, fields, batch_size)
+        return self._export(request, fields)
+
+    def _export_request(
+        self,
+        search_terms: Optional[str],
+        concepts: List[str],
+        fields: Optional[List[str]],
+        batch_size: int,
+    ) -> dict:
+        request = self._search_request(search_terms, 1, batch_size, concepts, fields)
+        request["track_total_hits"] = False
+        return request
+
+    def _export(
+        self, request: dict, fields: Optional[List[str]]
+    ) -> Iterator[Union[Dict, Document]]:
+        point_in_time_id = self.elasticsearch.open_point_in_time(
+            index=self.index_name, keep_alive=self.point_in_time_keep_alive
+        )["id"]
+        search_after = None
+        try:
+            while True:
+                response = self.elasticsearch.search(
+                    **self._cursor_request(
+                        request, point_in_time_id, search_after, sort=self.export_sort
+                    )
+                )
+                point_in_time_id = response["pit_id"]
+                hits = response["hits"]["hits"]
+                yield from self._results(hits, fields)
+                if len(hits) < request["size"]:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            self.elasticsearch.close_point_in_time(id=point_in_time_id)
+
     def get_item(self, id: str) -> Document:
         response = self.elasticsearch.get(index=self.index_name, id=id)
-        document = Document(**response["_source"])
-        return document
+        return self._from_source(response["_source"])
+
+    def get_items(
+        self, ids: List[str], fields: Optional[List[str]] = None
+    ) -> List[Union[Dict, Document]]:
+        """
+        Fetch several documents by id in a single request.
+
+        :param List[str] ids: The ids of the documents
+        :param Optional[List[str]] fields: Only fetch these fields of each document.
+        See DocumentSearchEngine.search
+        :raises ValueError: If any of the fields aren't fields of a document
+        :return List[Union[Dict, Document]]: The documents which exist, in the order
+        of their ids. Missing ids are skipped, and repeated ids are only returned once
+        """
+        self._check_fields(fields)
+        return super().get_items(ids, fields)
+
 
+class ConceptSearchEngine(ElasticsearchSearchEngine):
+    item_type = Concept
 
-class ConceptSearchEngine(SearchEngine):
-    def __init__(self, elasticsearch: Elasticsearch, index_name: str = "concepts"):
+    def __init__(
+        self,
+        elasticsearch: Elasticsearch,
+        index_name: str = "concepts",
+        validate_hits: bool = False,
+        create_index: bool = True,
+        cache: Optional[QueryCache] = None,
+    ):
         self.elasticsearch = elasticsearch
         self.index_name = index_name
+        self.validate_hits = validate_hits
+        self.cache = cache
 
         self.settings = {
             "analysis": {
@@ -167,6 +1033,7 @@ class ConceptSearchEngine(SearchEngine):
                 "preferred_label": {"type": "text", "analyzer": "english_analyzer"},
                 "description": {"type": "text", "analyzer": "english_analyzer"},
                 "alternative_labels": {"type": "text", "analyzer": "english_analyzer"},
+                "fingerprint": {"type": "keyword"},
             }
         }
         self.query = {
@@ -181,11 +1048,8 @@ class ConceptSearchEngine(SearchEngine):
             }
         }
 
-        self.index_exists = self.elasticsearch.indices.exists(index=self.index_name)
-        if not self.index_exists:
-            self.elasticsearch.indices.create(
-                index=self.index_name, settings=self.settings, mappings=self.mappings
-            )
+        if create_index:
+            self.ensure_index()
 
     def _build_query(self, search_terms: Optional[str]):
         core_query = self.query if search_terms else {"match_all": {}}
@@ -198,36 +1062,299 @@ class ConceptSearchEngine(SearchEngine):
 
         if search_terms:
             query = json.loads(
-                json.dumps(self.query).replace("{{search_terms}}", search_terms)
+                json.dumps(self.query).replace(
+                    '"{{search_terms}}"', json.dumps(search_terms)
+                )
             )
 
         return query
 
-    def insert_item(self, item: Concept):
-        self.elasticsearch.index(
-            index=self.index_name, id=item.id, document=item.model_dump()
-        )
-
     def search(
         self,
         search_terms: Optional[str],
         page: int = 1,
         page_size: int = 10,
     ) -> SearchResponse:
-        query = self._build_query(search_terms)
-        response = self.elasticsearch.search(
-            index=self.index_name,
-            query=query,
-            from_=(page - 1) * page_size,
-            size=page_size,
+        return self._cached_search(
+            self._cache_key(search_terms, page, page_size),
+            self._search_request(search_terms, page, page_size),
+            self._search_response,
         )
 
+    def _cache_key(
+        self, search_terms: Optional[str], page: int, page_size: int
+    ) -> Tuple:
+        return (normalise_search_terms(search_terms), page, page_size)
+
+    def _search_request(
+        self, search_terms: Optional[str], page: int, page_size: int
+    ) -> dict:
+        return {
+            "index": self.index_name,
+            "query": self._build_query(search_terms),
+            "from_": (page - 1) * page_size,
+            "size": page_size,
+        }
+
+    def _search_response(self, response: dict) -> SearchResponse:
         return SearchResponse(
             total=response["hits"]["total"]["value"],
-            results=[Concept(**hit["_source"]) for hit in response["hits"]["hits"]],
+            results=[
+                self._from_source(hit["_source"]) for hit in response["hits"]["hits"]
+            ],
         )
 
     def get_item(self, id: str) -> Concept:
         response = self.elasticsearch.get(index=self.index_name, id=id)
-        concept = Concept(**response["_source"])
-        return concept
+        return self._from_source(response["_source"])
+
+
+def _sync_only(method_name: str) -> Callable:
+    """Build a method which refuses to write through an async search engine"""
+
+    def method(self, *args, **kwargs):
+        raise TypeError(
+            f"{type(self).__name__} can only read from its index, so it doesn't "
+            f"support {method_name}. Use a {type(self).__name__.removeprefix('Async')} "
+            "with a synchronous Elasticsearch client to write to the index"
+        )
+
+    method.__name__ = method_name
+    return method
+
+
+class AsyncElasticsearchSearchEngine(ElasticsearchSearchEngine):
+    """
+    Shared behaviour for search engines which read from an elasticsearch index
+    through an AsyncElasticsearch client.
+
+    Searches are awaited rather than blocking the caller, so an async app (like the
+    API) can serve many searches at once from a single worker, limited by the
+    client's connection pool rather than by the number of workers. The async engines
+    only read from the index; use the synchronous engines to write to it.
+    """
+
+    elasticsearch: AsyncElasticsearch
+
+    # the synchronous engines' writes would call the async client without awaiting
+    # it, so they raise a TypeError rather than being inherited
+    insert_item = _sync_only("insert_item")
+    insert_items = _sync_only("insert_items")
+    sync = _sync_only("sync")
+    reindex = _sync_only("reindex")
+    _bump_generation = _sync_only("_bump_generation")
+    _number_of_replicas = _sync_only("_number_of_replicas")
+    _swap_alias = _sync_only("_swap_alias")
+
+    async def ensure_index(self):
+        """Create the index with the engine's settings and mappings if it's missing"""
+        self.index_exists = await self.elasticsearch.indices.exists(
+            index=self.index_name
+        )
+        if not self.index_exists:
+            await self.elasticsearch.indices.create(
+                index=self.index_name, settings=self.settings, mappings=self.mappings
+            )
+
+    async def get_items(
+        self, ids: List[str], fields: Optional[List[str]] = None
+    ) -> List[Union[Dict, Item]]:
+        """See ElasticsearchSearchEngine.get_items"""
+        if not ids:
+            return []
+        response = await self.elasticsearch.mget(**self._mget_request(ids, fields))
+        return self._mget_results(response, fields)
+
+    async def generation(self) -> Optional[str]:
+        """See ElasticsearchSearchEngine.generation"""
+        return _generation(
+            await self.elasticsearch.indices.get_mapping(index=self.index_name)
+        )
+
+    async def _cached_search(
+        self,
+        key: Optional[Tuple],
+        request: dict,
+        parse: Callable[[dict], SearchResponse],
+    ) -> SearchResponse:
+        """See ElasticsearchSearchEngine._cached_search"""
+        if self.cache is None or key is None:
+            return parse(await self.elasticsearch.search(**request))
+        if self.cache.generation_is_stale:
+            self.cache.set_generation(await self.generation())
+        key = self.cache.key(*key)
+        response = self.cache.get(key)
+        if response is None:
+            response = parse(await self.elasticsearch.search(**request))
+            self.cache.set(key, response, size=len(response.model_dump_json()))
+        return response
+
+
+class AsyncDocumentSearchEngine(AsyncElasticsearchSearchEngine, DocumentSearchEngine):
+    def __init__(
+        self,
+        elasticsearch: AsyncElasticsearch,
+        index_name: str = "documents",
+        validate_hits: bool = False,
+        cache: Optional[QueryCache] = None,
+    ):
+        # the index can't be created while the engine is being constructed, because
+        # that has to be awaited. Await ensure_index() before searching instead
+        super().__init__(
+            elasticsearch=elasticsearch,
+            index_name=index_name,
+            validate_hits=validate_hits,
+            create_index=False,
+            cache=cache,
+        )
+
+    async def search(
+        self,
+        search_terms: Optional[str],
+        page: int = 1,
+        page_size: int = 10,
+        concepts: List[str] = [],
+        fields: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
+    ) -> SearchResponse:
+        """
+        Search for documents. See DocumentSearchEngine.search for details.
+
+        :raises ValueError: If any of the fields aren't fields of a document, or if
+        the cursor is invalid or has expired
+        """
+        if cursor is not None:
+            return await self._search_with_cursor(
+                search_terms, page_size, concepts, fields, cursor
+            )
+        return await self._cached_search(
+            self._cache_key(search_terms, page, page_size, concepts, fields),
+            self._search_request(search_terms, page, page_size, concepts, fields),
+            lambda response: self._search_response(response, fields),
+        )
+
+    async def _search_with_cursor(
+        self,
+        search_terms: Optional[str],
+        page_size: int,
+        concepts: List[str],
+        fields: Optional[List[str]],
+        cursor: str,
+    ) -> SearchResponse:
+        """See DocumentSearchEngine._search_with_cursor"""
+        request = self._search_request(search_terms, 1, page_size, concepts, fields)
+        if cursor == "*":
+            response = await self.elasticsearch.open_point_in_time(
+                index=self.index_name, keep_alive=self.point_in_time_keep_alive
+            )
+            point_in_time_id, search_after = response["id"], None
+        else:
+            point_in_time_id, search_after = decode_cursor(cursor)
+        try:
+            response = await self.elasticsearch.search(
+                **self._cursor_request(request, point_in_time_id, search_after)
+            )
+        except BaseException as e:
+            if cursor == "*":
+                with suppress(Exception):
+                    await self.elasticsearch.close_point_in_time(id=point_in_time_id)
+            error = self._cursor_error(e, cursor)
+            if error is None:
+                raise
+            raise error from e
+
+        search_response = self._cursor_response(response, page_size, fields)
+        if search_response.next_cursor is None:
+            await self.elasticsearch.close_point_in_time(id=response["pit_id"])
+        return search_response
+
+    def export(
+        self,
+        search_terms: Optional[str] = None,
+        concepts: List[str] = [],
+        fields: Optional[List[str]] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Union[Dict, Document]]:
+        """
+        Stream every document which matches a search. See DocumentSearchEngine.export
+        for details.
+
+        :raises ValueError: If any of the fields aren't fields of a document. Raised
+        immediately, rather than when the iterator is first advanced
+        """
+        request = self._export_request(search_terms, concepts, fields, batch_size)
+        return self._export(request, fields)
+
+    async def _export(
+        self, request: dict, fields: Optional[List[str]]
+    ) -> AsyncIterator[Union[Dict, Document]]:
+        response = await self.elasticsearch.open_point_in_time(
+            index=self.index_name, keep_alive=self.point_in_time_keep_alive
+        )
+        point_in_time_id = response["id"]
+        search_after = None
+        try:
+            while True:
+                response = await self.elasticsearch.search(
+                    **self._cursor_request(
+                        request, point_in_time_id, search_after, sort=self.export_sort
+                    )
+                )
+                point_in_time_id = response["pit_id"]
+                hits = response["hits"]["hits"]
+                for result in self._results(hits, fields):
+                    yield result
+                if len(hits) < request["size"]:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            await self.elasticsearch.close_point_in_time(id=point_in_time_id)
+
+    async def get_item(self, id: str) -> Document:
+        response = await self.elasticsearch.get(index=self.index_name, id=id)
+        return self._from_source(response["_source"])
+
+    async def get_items(
+        self, ids: List[str], fields: Optional[List[str]] = None
+    ) -> List[Union[Dict, Document]]:
+        """
+        See DocumentSearchEngine.get_items
+
+        :raises ValueError: If any of the fields aren't fields of a document
+        """
+        self._check_fields(fields)
+        return await super().get_items(ids, fields)
+
+
+class AsyncConceptSearchEngine(AsyncElasticsearchSearchEngine, ConceptSearchEngine):
+    def __init__(
+        self,
+        elasticsearch: AsyncElasticsearch,
+        index_name: str = "concepts",
+        validate_hits: bool = False,
+        cache: Optional[QueryCache] = None,
+    ):
+        # see AsyncDocumentSearchEngine.__init__
+        super().__init__(
+            elasticsearch=elasticsearch,
+            index_name=index_name,
+            validate_hits=validate_hits,
+            create_index=False,
+            cache=cache,
+        )
+
+    async def search(
+        self,
+        search_terms: Optional[str],
+        page: int = 1,
+        page_size: int = 10,
+    ) -> SearchResponse:
+        return await self._cached_search(
+            self._cache_key(search_terms, page, page_size),
+            self._search_request(search_terms, page, page_size),
+            self._search_response,
+        )
+
+    async def get_item(self, id: str) -> Concept:
+        response = await self.elasticsearch.get(index=self.index_name, id=id)
+        return self._from_source(response["_source"])
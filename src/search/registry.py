@@ -0,0 +1,278 @@
+import asyncio
+import os
+import re
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from elasticsearch import helpers
+
+from src.concept import Concept
+from src.logging import get_logger
+from src.search import SearchResponse
+from src.search.core import AsyncConceptSearchEngine
+
+logger = get_logger(__name__)
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.casefold())
+
+
+def _normalise(text: str) -> str:
+    return " ".join(_words(text))
+
+
+def _prefix_ids(keys: List[str], ids: List[str], prefix: str) -> Set[str]:
+    """Find the ids of every key which starts with a prefix, in a sorted index"""
+    matches = set()
+    for i in range(bisect_left(keys, prefix), len(keys)):
+        if not keys[i].startswith(prefix):
+            break
+        matches.add(ids[i])
+    return matches
+
+
+def _index(pairs: Iterable[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+    """Sort (key, id) pairs into parallel lists which can be searched with bisect"""
+    pairs = sorted(set(pairs))
+    return [key for key, _ in pairs], [id for _, id in pairs]
+
+
+class ConceptRegistry:
+    """
+    An in-memory copy of every concept, for serving concepts without elasticsearch.
+
+    The concept set is small and rarely changes, so rather than asking elasticsearch
+    for every lookup, the registry holds all of the concepts in memory. They're looked
+    up by id in a dict, and searched with sorted indices of their labels and words.
+
+    Concepts are loaded from one of two sources: a directory of processed concept
+    files (see scripts/process_concepts.py), or a snapshot of a concepts index in
+    elasticsearch. Call refresh() to load them, and run watch() in the background to
+    pick up changes. The source is checked for changes every check_interval seconds:
+    a directory changes when any of its files are modified, and an index changes
+    when its generation does (see QueryCache). Reads never touch the source, so the
+    registry keeps serving its last snapshot if the source becomes unavailable.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        search_engine: Optional[AsyncConceptSearchEngine] = None,
+        check_interval: float = 5,
+    ):
+        """
+        :param Optional[Union[str, Path]] directory: A directory of concept files to
+        load the concepts from
+        :param Optional[AsyncConceptSearchEngine] search_engine: A search engine whose
+        index the concepts should be loaded from, if there's no directory
+        :param float check_interval: The number of seconds between checks of the
+        source for changes
+        :raises ValueError: If neither or both of directory and search_engine are set
+        """
+        if (directory is None) == (search_engine is None):
+            raise ValueError("Exactly one of directory and search_engine must be set")
+        self.directory = Path(directory) if directory is not None else None
+        self.search_engine = search_engine
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = -float("inf")
+        self._load([])
+
+    def __len__(self) -> int:
+        return len(self._concepts)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._concepts
+
+    def __repr__(self) -> str:
+        source = self.directory or self.search_engine.index_name
+        return f"ConceptRegistry({len(self)} concepts from {source})"
+
+    def _load(self, concepts: Iterable[Concept]):
+        concepts = {concept.id: concept for concept in concepts}
+        labels = _index(
+            (_normalise(label), id)
+            for id, concept in concepts.items()
+            for label in concept.all_labels
+        )
+        label_words = _index(
+            (word, id)
+            for id, concept in concepts.items()
+            for label in concept.all_labels
+            for word in _words(label)
+        )
+        description_words = _index(
+            (word, id)
+            for id, concept in concepts.items()
+            for word in _words(concept.description or "")
+        )
+        # swap everything in at once, so searches never see a half-built registry
+        (
+            self._concepts,
+            self._labels,
+            self._label_words,
+            self._description_words,
+        ) = (concepts, labels, label_words, description_words)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the concepts if their source has changed since they were loaded.
+
+        :param bool force: Reload the concepts without checking whether they've
+        changed
+        :return bool: Whether the concepts were reloaded
+        """
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.check_interval:
+            return False
+        # set before the source is read, so that concurrent calls don't reload too
+        self.checked_at = now
+        version = await self._source_version()
+        if not force and version == self.version:
+            return False
+        self._load(await self._read_source())
+        self.version = version
+        logger.info(f"Loaded {len(self)} concepts into {self}")
+        return True
+
+    async def watch(self):
+        """
+        Refresh the registry every check_interval seconds, until cancelled.
+
+        Failures are logged rather than raised, so that the last snapshot of the
+        concepts keeps being served while the source is unavailable.
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception(f"Failed to refresh {self}")
+
+    async def _source_version(self) -> Optional[Union[int, str, Tuple[int, ...]]]:
+        if self.directory is not None:
+            # a directory's mtime changes when files are added or removed, but not
+            # when existing files are rewritten
+            return max(
+                [os.stat(self.directory).st_mtime_ns]
+                + [file.stat().st_mtime_ns for file in self.directory.glob("*.json")]
+            )
+        generation = await self.search_engine.generation()
+        if generation is not None:
+            return generation
+        # indices which weren't written by a search engine don't have a generation, so
+        # fall back to their document count and write counters. The counters reset
+        # when nodes restart, which only causes an unnecessary reload
+        stats = await self.search_engine.elasticsearch.indices.stats(
+            index=self.search_engine.index_name, metric=["docs", "indexing"]
+        )
+        primaries = stats["_all"]["primaries"]
+        return (
+            primaries["docs"]["count"],
+            primaries["indexing"]["index_total"],
+            primaries["indexing"]["delete_total"],
+        )
+
+    async def _read_source(self) -> List[Concept]:
+        if self.directory is not None:
+            return [Concept.load(file) for file in self.directory.glob("*.json")]
+        return [
+            Concept.from_trusted(hit["_source"])
+            async for hit in helpers.async_scan(
+                self.search_engine.elasticsearch,
+                index=self.search_engine.index_name,
+                query={"query": {"match_all": {}}},
+            )
+        ]
+
+    def get_item(self, id: str) -> Concept:
+        """
+        :raises KeyError: If there's no concept with the id
+        """
+        return self._concepts[id]
+
+    def get_items(self, ids: List[str]) -> List[Concept]:
+        """
+        Fetch several concepts by id.
+
+        :param List[str] ids: The ids of the concepts
+        :return List[Concept]: The concepts which exist, in the order of their ids.
+        Missing ids are skipped, and repeated ids are only returned once
+        """
+        return [self._concepts[id] for id in dict.fromkeys(ids) if id in self._concepts]
+
+    def _ranks(self, search_terms: str) -> Dict[str, int]:
+        """
+        Rank the concepts which match a search, from 0 (best) to 3.
+
+        0: the terms are a concept's id, or one of its labels
+        1: one of the concept's labels starts with the terms
+        2: every term is the start of a word in the concept's labels
+        3: every term is the start of a word in the concept's labels or description
+        """
+        query = _normalise(search_terms)
+        terms = _words(search_terms)
+        ranks = {}
+
+        def add(ids: Iterable[str], rank: int):
+            for id in ids:
+                ranks.setdefault(id, rank)
+
+        if search_terms.strip() in self._concepts:
+            add([search_terms.strip()], 0)
+        label_keys, label_ids = self._labels
+        i = bisect_left(label_keys, query)
+        while i < len(label_keys) and label_keys[i] == query:
+            add([label_ids[i]], 0)
+            i += 1
+        add(_prefix_ids(label_keys, label_ids, query), 1)
+
+        for rank, indices in [
+            (2, [self._label_words]),
+            (3, [self._label_words, self._description_words]),
+        ]:
+            matching_ids = None
+            for term in terms:
+                term_ids = set().union(
+                    *(_prefix_ids(keys, ids, term) for keys, ids in indices)
+                )
+                matching_ids = (
+                    term_ids if matching_ids is None else matching_ids & term_ids
+                )
+            add(matching_ids or [], rank)
+        return ranks
+
+    def search(
+        self, search_terms: Optional[str], page: int = 1, page_size: int = 10
+    ) -> SearchResponse:
+        """
+        Search the concepts' ids, labels and descriptions.
+
+        Results are ranked by how closely they match (see _ranks), and then sorted by
+        their preferred labels. Without any search terms, every concept is returned.
+
+        :param Optional[str] search_terms: Search terms, which are matched as
+        case-insensitive prefixes
+        :param int page: The page of results to return
+        :param int page_size: The number of results on each page
+        :return SearchResponse: The total number of matching concepts, and the
+        results for the requested page
+        """
+        if search_terms and _words(search_terms):
+            ranks = self._ranks(search_terms)
+        else:
+            ranks = dict.fromkeys(self._concepts, 0)
+        ranked_ids = sorted(
+            ranks,
+            key=lambda id: (ranks[id], self._concepts[id].preferred_label.casefold()),
+        )
+        start = (page - 1) * page_size
+        return SearchResponse(
+            total=len(ranked_ids),
+            results=[
+                self._concepts[id] for id in ranked_ids[start : start + page_size]
+            ],
+        )
@@ -1,6 +1,28 @@
-from typing import Literal, Optional
+import sys
+from array import array
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+    get_args,
+)
 
-from pydantic import BaseModel, Field, model_validator
+import numpy as np
+from pydantic import (
+    BaseModel,
+    Field,
+    GetCoreSchemaHandler,
+    GetJsonSchemaHandler,
+    model_validator,
+)
+from pydantic.json_schema import JsonSchemaValue
+from pydantic_core import core_schema
 from typing_extensions import Self
 
 SpanType = Literal["page", "concept", "sentence"]
@@ -40,3 +62,336 @@ class Span(BaseModel):
         if self.type == "concept" and not self.identifier:
             raise ValueError("Concept spans must have identifiers")
         return self
+
+
+span_types = (None,) + get_args(SpanType)
+span_type_codes = {span_type: code for code, span_type in enumerate(span_types)}
+
+
+class SpanList:
+    """
+    A compact list of spans, backed by arrays of start and end indices
+
+    Storing spans as individual pydantic models is expensive when there are thousands
+    of them per document. A SpanList keeps the indices in typed arrays, stores each
+    distinct identifier once, and validates spans in bulk. Iterating over or indexing
+    into a SpanList produces Span objects on the fly, and it serialises to the same
+    list of span dicts as a list of Spans.
+    """
+
+    def __init__(self, spans: Iterable[Union[Span, dict]] = ()):
+        """
+        :param Iterable[Union[Span, dict]] spans: The spans to store, as Span objects or
+        dicts with the same fields
+        :raises ValueError: If any of the spans are invalid
+        """
+        self.start_indices = array("q")
+        self.end_indices = array("q")
+        self.type_codes = array("b")
+        self.identifier_codes = array("i")
+        self.identifier_vocabulary: List[str] = []
+        self._identifier_lookup: Dict[str, int] = {}
+        self.extend(spans)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        start_indices: Sequence[int],
+        end_indices: Sequence[int],
+        type: Optional[SpanType] = None,
+        identifiers: Optional[Sequence[Optional[str]]] = None,
+    ) -> "SpanList":
+        """
+        Build a SpanList directly from sequences of indices, without creating a dict or
+        Span for each span
+
+        :param Sequence[int] start_indices: The start index of each span
+        :param Sequence[int] end_indices: The end index of each span
+        :param Optional[SpanType] type: The type of every span in the list
+        :param Optional[Sequence[Optional[str]]] identifiers: The identifier of each
+        span, if any
+        :raises ValueError: If any of the spans are invalid
+        :return SpanList: The spans
+        """
+        if len(start_indices) != len(end_indices):
+            raise ValueError("start_indices and end_indices must be the same length")
+        if identifiers is not None and len(identifiers) != len(start_indices):
+            raise ValueError("identifiers must be the same length as start_indices")
+        if type not in span_type_codes:
+            raise ValueError(f"Unknown span type: {type}")
+
+        span_list = cls()
+        span_list.start_indices.extend(start_indices)
+        span_list.end_indices.extend(end_indices)
+        span_list.type_codes.extend([span_type_codes[type]] * len(start_indices))
+        if identifiers is None:
+            span_list.identifier_codes.extend([-1] * len(start_indices))
+        else:
+            span_list.identifier_codes.extend(
+                span_list._identifier_code(identifier) for identifier in identifiers
+            )
+        span_list._validate(0)
+        return span_list
+
+    @classmethod
+    def from_columns(
+        cls,
+        start_indices: np.ndarray,
+        end_indices: np.ndarray,
+        type_codes: np.ndarray,
+        identifier_codes: np.ndarray,
+        identifier_vocabulary: Sequence[str],
+    ) -> "SpanList":
+        """
+        Build a SpanList from columns of the same shape as its own storage, eg when
+        reading spans back from a columnar file
+
+        :param np.ndarray start_indices: The start index of each span
+        :param np.ndarray end_indices: The end index of each span
+        :param np.ndarray type_codes: The position of each span's type in span_types
+        :param np.ndarray identifier_codes: The position of each span's identifier in
+        identifier_vocabulary, or -1 for spans without an identifier
+        :param Sequence[str] identifier_vocabulary: The distinct identifiers
+        :raises ValueError: If any of the spans are invalid
+        :return SpanList: The spans
+        """
+        lengths = {len(start_indices), len(end_indices), len(type_codes)}
+        if len(lengths | {len(identifier_codes)}) != 1:
+            raise ValueError("All columns must be the same length")
+        type_codes = np.asarray(type_codes, dtype=np.int8)
+        if type_codes.size and (
+            type_codes.min() < 0 or type_codes.max() >= len(span_types)
+        ):
+            raise ValueError("Unknown span type code")
+
+        # only keep the identifiers which are actually used by these spans
+        identifier_codes = np.asarray(identifier_codes, dtype=np.int32)
+        has_identifier = identifier_codes >= 0
+        used_codes, new_codes = np.unique(
+            identifier_codes[has_identifier], return_inverse=True
+        )
+        identifier_codes = identifier_codes.copy()
+        identifier_codes[has_identifier] = new_codes
+
+        span_list = cls()
+        span_list.start_indices.frombytes(np.asarray(start_indices, np.int64).tobytes())
+        span_list.end_indices.frombytes(np.asarray(end_indices, np.int64).tobytes())
+        span_list.type_codes.frombytes(type_codes.tobytes())
+        span_list.identifier_codes.frombytes(identifier_codes.tobytes())
+        for code in used_codes.tolist():
+            span_list._identifier_code(identifier_vocabulary[code])
+        span_list._validate(0)
+        return span_list
+
+    def _identifier_code(self, identifier: Optional[str]) -> int:
+        if identifier is None:
+            return -1
+        code = self._identifier_lookup.get(identifier)
+        if code is None:
+            code = len(self.identifier_vocabulary)
+            self.identifier_vocabulary.append(sys.intern(identifier))
+            self._identifier_lookup[identifier] = code
+        return code
+
+    def append(self, span: Union[Span, dict]):
+        self.extend([span])
+
+    def extend(self, spans: Iterable[Union[Span, dict]]):
+        """
+        Add spans to the end of the list
+
+        :param Iterable[Union[Span, dict]] spans: The spans to add
+        :raises ValueError: If any of the new spans are invalid. The list is left
+        unchanged if so.
+        """
+        if isinstance(spans, SpanList):
+            spans = list(spans)
+        n_existing = len(self)
+        append_start_index = self.start_indices.append
+        append_end_index = self.end_indices.append
+        append_type_code = self.type_codes.append
+        append_identifier_code = self.identifier_codes.append
+        try:
+            for span in spans:
+                # dicts are checked for first, because isinstance checks against
+                # pydantic models are comparatively slow
+                if isinstance(span, dict):
+                    start_index, end_index = span["start_index"], span["end_index"]
+                    identifier, span_type = span.get("identifier"), span.get("type")
+                elif isinstance(span, Span):
+                    start_index, end_index = span.start_index, span.end_index
+                    identifier, span_type = span.identifier, span.type
+                else:
+                    raise TypeError(f"Expected a Span or dict, got {type(span)}")
+                type_code = span_type_codes.get(span_type)
+                if type_code is None:
+                    raise ValueError(f"Unknown span type: {span_type}")
+                append_start_index(start_index)
+                append_end_index(end_index)
+                append_type_code(type_code)
+                append_identifier_code(
+                    -1 if identifier is None else self._identifier_code(identifier)
+                )
+            self._validate(n_existing)
+        except (ValueError, TypeError, KeyError):
+            self._truncate(n_existing)
+            raise
+
+    def _truncate(self, length: int):
+        for values in (
+            self.start_indices,
+            self.end_indices,
+            self.type_codes,
+            self.identifier_codes,
+        ):
+            del values[length:]
+
+    def _validate(self, start: int = 0):
+        """
+        Check the spans from position `start` onwards, all at once
+
+        :param int start: The position of the first span to check
+        :raises ValueError: If any of the spans are invalid
+        """
+        start_indices = np.asarray(self.start_indices[start:], dtype=np.int64)
+        end_indices = np.asarray(self.end_indices[start:], dtype=np.int64)
+        invalid = np.flatnonzero(start_indices > end_indices)
+        if invalid.size:
+            span = self[start + int(invalid[0])]
+            raise ValueError(
+                "The start index must be less than the end index."
+                f"(got start_index={span.start_index}, end_index={span.end_index})"
+            )
+
+        type_codes = np.asarray(self.type_codes[start:], dtype=np.int8)
+        identifier_codes = np.asarray(self.identifier_codes[start:], dtype=np.int32)
+        missing_identifiers = (type_codes == span_type_codes["concept"]) & (
+            identifier_codes < 0
+        )
+        if missing_identifiers.any():
+            raise ValueError("Concept spans must have identifiers")
+
+    def validate_bounds(self, text_length: int):
+        """
+        Check that all of the spans fall within a text of the given length
+
+        :param int text_length: The length of the text
+        :raises ValueError: If any of the spans are out of bounds
+        """
+        start_indices = np.asarray(self.start_indices, dtype=np.int64)
+        end_indices = np.asarray(self.end_indices, dtype=np.int64)
+        out_of_bounds = np.flatnonzero(
+            (start_indices < 0) | (end_indices > text_length)
+        )
+        if out_of_bounds.size:
+            span = self[int(out_of_bounds[0])]
+            raise ValueError(f"Span {span} is out of bounds of the text")
+
+    @property
+    def identifiers(self) -> List[Optional[str]]:
+        vocabulary = self.identifier_vocabulary
+        return [
+            vocabulary[code] if code >= 0 else None for code in self.identifier_codes
+        ]
+
+    @property
+    def types(self) -> List[Optional[SpanType]]:
+        return [span_types[code] for code in self.type_codes]
+
+    def __len__(self) -> int:
+        return len(self.start_indices)
+
+    def _span(self, i: int) -> Span:
+        identifier_code = self.identifier_codes[i]
+        return Span.model_construct(
+            start_index=self.start_indices[i],
+            end_index=self.end_indices[i],
+            identifier=(
+                self.identifier_vocabulary[identifier_code]
+                if identifier_code >= 0
+                else None
+            ),
+            type=span_types[self.type_codes[i]],
+        )
+
+    def __iter__(self) -> Iterator[Span]:
+        for i in range(len(self)):
+            yield self._span(i)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Span, "SpanList"]:
+        if isinstance(key, slice):
+            span_list = SpanList()
+            span_list.start_indices = self.start_indices[key]
+            span_list.end_indices = self.end_indices[key]
+            span_list.type_codes = self.type_codes[key]
+            span_list.identifier_codes = self.identifier_codes[key]
+            span_list.identifier_vocabulary = list(self.identifier_vocabulary)
+            span_list._identifier_lookup = dict(self._identifier_lookup)
+            return span_list
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("SpanList index out of range")
+        return self._span(key)
+
+    def __add__(self, other: Iterable[Union[Span, dict]]) -> "SpanList":
+        span_list = self[:]
+        span_list.extend(other)
+        return span_list
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (SpanList, list, tuple)):
+            return len(self) == len(other) and all(
+                a == (Span(**b) if isinstance(b, dict) else b)
+                for a, b in zip(self, other)
+            )
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"SpanList({list(self)})"
+
+    def to_list(self) -> List[dict]:
+        """
+        Serialise the spans as a list of dicts
+
+        :return List[dict]: The spans, in the same format as Span.model_dump()
+        """
+        identifiers = self.identifiers
+        types = self.types
+        return [
+            {
+                "start_index": start_index,
+                "end_index": end_index,
+                "identifier": identifier,
+                "type": span_type,
+            }
+            for start_index, end_index, identifier, span_type in zip(
+                self.start_indices, self.end_indices, identifiers, types
+            )
+        ]
+
+    @classmethod
+    def coerce(cls, value: Any) -> "SpanList":
+        """Builds a SpanList from a list of spans, or returns an existing SpanList"""
+        if isinstance(value, SpanList):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(value)
+        raise ValueError(f"Expected a list of spans, got {type(value).__name__}")
+
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source_type: Any, handler: GetCoreSchemaHandler
+    ) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.coerce,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda span_list: span_list.to_list()
+            ),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(
+        cls, schema: core_schema.CoreSchema, handler: GetJsonSchemaHandler
+    ) -> JsonSchemaValue:
+        return {"type": "array", "items": Span.model_json_schema()}
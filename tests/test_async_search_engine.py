@@ -0,0 +1,32 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.document import Document
+from src.search.core import AsyncConceptSearchEngine, AsyncDocumentSearchEngine
+
+document = Document(title="test", text="Equal pay for equal work.")
+
+
+@pytest.mark.parametrize(
+    "engine_type", [AsyncDocumentSearchEngine, AsyncConceptSearchEngine]
+)
+@pytest.mark.parametrize(
+    "write",
+    [
+        lambda engine: engine.insert_item(document),
+        lambda engine: engine.insert_items([document]),
+        lambda engine: engine.sync([document]),
+        lambda engine: engine.reindex([document]),
+        lambda engine: engine._bump_generation(),
+        lambda engine: engine._number_of_replicas(),
+        lambda engine: engine._swap_alias("documents-new"),
+    ],
+)
+def test_async_engines_refuse_to_write(engine_type, write):
+    elasticsearch = MagicMock()
+    engine = engine_type(elasticsearch)
+
+    with pytest.raises(TypeError, match="can only read from its index"):
+        write(engine)
+    assert elasticsearch.mock_calls == []
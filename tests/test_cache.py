@@ -0,0 +1,136 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+import src.search.cache
+from src.search.cache import QueryCache, normalise_list, normalise_search_terms
+from src.search.core import DocumentSearchEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(src.search.cache, "time", clock)
+    return clock
+
+
+def test_values_expire_after_the_ttl(clock):
+    cache = QueryCache(ttl=10)
+    cache.set("key", "value")
+
+    clock.now = 9
+    assert cache.get("key") == "value"
+    clock.now = 10
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_the_least_recently_used_value(clock):
+    cache = QueryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_is_bounded_by_bytes(clock):
+    cache = QueryCache(max_bytes=100)
+    cache.set("a", 1, size=40)
+    cache.set("b", 2, size=40)
+    cache.set("c", 3, size=40)
+
+    assert cache.get("a") is None
+    assert cache.n_bytes == 80
+
+    # replacing a value replaces its size too
+    cache.set("b", 2, size=10)
+    assert cache.n_bytes == 50
+
+    # values which could never fit aren't cached, and don't evict anything
+    cache.set("d", 4, size=101)
+    assert cache.get("d") is None
+    assert cache.n_bytes == 50
+    assert len(cache) == 2
+
+
+def test_keys_include_the_generation(clock):
+    cache = QueryCache(generation_ttl=5)
+    cache.set_generation("1")
+    cache.set(cache.key("query"), "old results")
+
+    assert not cache.generation_is_stale
+    clock.now = 6
+    assert cache.generation_is_stale
+    cache.set_generation("2")
+    assert cache.get(cache.key("query")) is None
+
+
+def test_stats(clock):
+    cache = QueryCache(max_size=10, max_bytes=1000, ttl=60)
+    cache.set("a", 1, size=10)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats.hit_rate == 0.5
+    assert (stats.size, stats.n_bytes) == (1, 10)
+
+
+def test_normalisation():
+    assert normalise_search_terms(" covid   19 ") == "covid 19"
+    assert normalise_search_terms("  ") is None
+    assert normalise_list(["b", "a", "b"]) == ("a", "b")
+    assert normalise_list(None) is None
+
+
+@pytest.fixture
+def elasticsearch():
+    elasticsearch = MagicMock()
+    elasticsearch.indices.get_mapping.return_value = {
+        "documents": {"mappings": {"_meta": {"generation": "1"}}}
+    }
+    elasticsearch.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}}
+    return elasticsearch
+
+
+def test_search_engine_caches_projected_results(clock, elasticsearch):
+    search_engine = DocumentSearchEngine(elasticsearch, cache=QueryCache())
+
+    search_engine.search("covid 19", concepts=["b", "a"], fields=["id"])
+    search_engine.search(" covid  19", concepts=["a", "b"], fields=["id"])
+
+    assert elasticsearch.search.call_count == 1
+    assert search_engine.cache.hits == 1
+
+
+def test_search_engine_does_not_cache_full_documents(clock, elasticsearch):
+    search_engine = DocumentSearchEngine(elasticsearch, cache=QueryCache())
+
+    search_engine.search("covid 19")
+    search_engine.search("covid 19")
+
+    assert elasticsearch.search.call_count == 2
+    assert len(search_engine.cache) == 0
+
+
+def test_writes_change_the_generation(clock, elasticsearch):
+    search_engine = DocumentSearchEngine(elasticsearch, cache=QueryCache())
+
+    search_engine._bump_generation()
+
+    elasticsearch.indices.refresh.assert_called_once_with(index="documents")
+    generation = elasticsearch.indices.put_mapping.call_args.kwargs["meta"]
+    assert generation["generation"] != "1"
@@ -0,0 +1,114 @@
+import json
+import pickle
+
+import pytest
+
+from src.corpus import Corpus
+from src.document import Document
+
+
+@pytest.fixture
+def documents():
+    return [
+        Document(
+            title="ascii",
+            text="Equal pay. Unfair dismissal.",
+            summary="A summary",
+            page_spans=[{"start_index": 0, "end_index": 28, "type": "page"}],
+            concept_spans=[
+                {"start_index": 0, "end_index": 9, "identifier": "a", "type": "concept"}
+            ],
+        ),
+        Document(
+            title="unicode",
+            text="Café — naïve résumé. 😀 emoji.",
+            page_spans=[
+                {"start_index": 0, "end_index": 21, "type": "page"},
+                {"start_index": 21, "end_index": 29, "type": "page"},
+            ],
+            concept_spans=[
+                {
+                    "start_index": 7,
+                    "end_index": 12,
+                    "identifier": "b",
+                    "type": "concept",
+                },
+                {
+                    "start_index": 0,
+                    "end_index": 4,
+                    "identifier": "a",
+                    "type": "concept",
+                },
+            ],
+        ),
+        Document(title="empty", text=""),
+    ]
+
+
+def test_round_trips_documents(tmp_path, documents):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+
+    assert len(corpus) == len(documents)
+    for document, loaded in zip(documents, corpus):
+        assert loaded.model_dump() == document.model_dump()
+        assert corpus[document.id].id == document.id
+    assert [document.id for document in documents] == corpus.ids
+
+
+def test_views_slice_text_by_character(tmp_path, documents):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+
+    for document in documents:
+        view = corpus.view(document.id)
+        assert view.text == document.text
+        assert list(view.pages) == document.pages
+        assert list(view.sentences) == document.sentences
+        assert view.concepts == document.concepts
+        assert view.to_document().model_dump() == document.model_dump()
+
+
+def test_rewriting_replaces_the_corpus(tmp_path, documents):
+    Corpus.write(documents, tmp_path / "corpus")
+    corpus = Corpus.write(documents[:1], tmp_path / "corpus")
+
+    assert corpus.ids == [documents[0].id]
+    assert not (tmp_path / "corpus.tmp").exists()
+
+
+def test_pickles_by_reference(tmp_path, documents):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+
+    unpickled = pickle.loads(pickle.dumps(corpus))
+
+    assert unpickled.directory == corpus.directory
+    assert unpickled[documents[1].id].text == documents[1].text
+
+
+def test_missing_corpus(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Corpus(tmp_path)
+
+
+def test_stores_fingerprints(tmp_path, documents):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+
+    assert corpus.fingerprints == [document.fingerprint for document in documents]
+    for document, loaded in zip(documents, corpus):
+        # identifier codes are renumbered in the corpus, which mustn't change it
+        assert loaded.fingerprint == document.fingerprint
+        assert corpus.view(document.id).fingerprint == document.fingerprint
+
+
+def test_fingerprints_corpora_written_without_them(tmp_path, documents):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+    metadata_path = tmp_path / "corpus" / "documents.json"
+    metadata = json.loads(metadata_path.read_text())
+    del metadata["fingerprints"]
+    metadata_path.write_text(json.dumps(metadata))
+
+    corpus = Corpus(tmp_path / "corpus")
+
+    assert corpus.fingerprints is None
+    assert [view.fingerprint for view in corpus.views()] == [
+        document.fingerprint for document in documents
+    ]
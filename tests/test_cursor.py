@@ -0,0 +1,97 @@
+from unittest.mock import MagicMock
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import BadRequestError, NotFoundError
+
+from src.search.core import DocumentSearchEngine, decode_cursor, encode_cursor
+
+
+def api_error(error_type, status: int):
+    meta = ApiResponseMeta(
+        status=status,
+        http_version="1.1",
+        headers=HttpHeaders(),
+        duration=0.0,
+        node=NodeConfig("http", "localhost", 9200),
+    )
+    return error_type(message=error_type.__name__, meta=meta, body={})
+
+
+def hits(*sorts):
+    return [{"_source": {"id": str(sort[0])}, "sort": list(sort)} for sort in sorts]
+
+
+@pytest.fixture
+def elasticsearch():
+    elasticsearch = MagicMock()
+    elasticsearch.open_point_in_time.return_value = {"id": "pit"}
+    return elasticsearch
+
+
+@pytest.fixture
+def search_engine(elasticsearch):
+    return DocumentSearchEngine(elasticsearch)
+
+
+@pytest.mark.parametrize(
+    "point_in_time_id, search_after",
+    [("pit", [1.5, 3]), ("a/b+c==", ["text", None]), ("pit", [])],
+)
+def test_cursors_round_trip(point_in_time_id, search_after):
+    cursor = encode_cursor(point_in_time_id, search_after)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (point_in_time_id, search_after)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["", "not a cursor", encode_cursor("pit", [1])[:-3], "eyJwaXQiOiAxfQ", "W10"],
+)
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_pages_through_a_point_in_time(elasticsearch, search_engine):
+    elasticsearch.search.side_effect = [
+        {"pit_id": "pit-1", "hits": {"total": {"value": 3}, "hits": hits([1, 0])}},
+        {"pit_id": "pit-2", "hits": {"total": {"value": 3}, "hits": hits([2, 1])}},
+    ]
+
+    first_page = search_engine.search(None, page_size=1, fields=["id"], cursor="*")
+    assert first_page.results == [{"id": "1"}]
+    assert decode_cursor(first_page.next_cursor) == ("pit-1", [1, 0])
+
+    search_engine.search(
+        None, page_size=2, fields=["id"], cursor=first_page.next_cursor
+    )
+    request = elasticsearch.search.call_args.kwargs
+    assert request["pit"]["id"] == "pit-1"
+    assert request["search_after"] == [1, 0]
+    # a short page is the last one, so the point in time is closed
+    elasticsearch.close_point_in_time.assert_called_once_with(id="pit-2")
+
+
+def test_expired_cursors_raise_value_errors(elasticsearch, search_engine):
+    elasticsearch.search.side_effect = api_error(NotFoundError, 404)
+
+    with pytest.raises(ValueError, match="expired"):
+        search_engine.search(None, cursor=encode_cursor("pit", [1]))
+
+
+def test_rejected_cursors_raise_value_errors(elasticsearch, search_engine):
+    elasticsearch.search.side_effect = api_error(BadRequestError, 400)
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        search_engine.search(None, cursor=encode_cursor("garbage", [1]))
+    elasticsearch.close_point_in_time.assert_not_called()
+
+
+def test_failed_first_pages_close_their_point_in_time(elasticsearch, search_engine):
+    elasticsearch.search.side_effect = api_error(BadRequestError, 400)
+
+    with pytest.raises(BadRequestError):
+        search_engine.search(None, cursor="*")
+    elasticsearch.close_point_in_time.assert_called_once_with(id="pit")
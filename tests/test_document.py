@@ -0,0 +1,52 @@
+import src.document
+from src.document import Document
+from src.identifiers import pretty_hash
+
+
+def test_id_is_a_hash_of_the_title_text_and_number_of_pages():
+    document = Document(title="test", text="Equal pay for equal work.")
+
+    assert document.id == pretty_hash(
+        {"title": "test", "text": "Equal pay for equal work.", "n_pages": 0}
+    )
+
+
+def test_id_is_only_computed_once(monkeypatch):
+    calls = []
+
+    def counting_hash(data):
+        calls.append(data)
+        return pretty_hash(data)
+
+    monkeypatch.setattr(src.document, "pretty_hash", counting_hash)
+    document = Document(title="test", text="Equal pay for equal work.")
+
+    assert document.id == document.id
+    assert len(calls) == 1
+
+
+def test_id_changes_with_the_document():
+    document = Document(title="test", text="Equal pay for equal work.")
+    original_id = document.id
+
+    document.title = "another test"
+    assert document.id != original_id
+    retitled_id = document.id
+
+    document.text = "Equal pay for equal work!"
+    assert document.id != retitled_id
+    rewritten_id = document.id
+
+    document.page_spans.append({"start_index": 0, "end_index": 25, "type": "page"})
+    assert document.id != rewritten_id
+
+
+def test_trusted_documents_keep_their_id():
+    data = {"id": "stored-id", "title": "test", "text": "Equal pay."}
+
+    document = Document.from_trusted(data)
+    assert document.id == "stored-id"
+
+    # until they're changed
+    document.text = "Equal pay for equal work."
+    assert document.id == Document(title="test", text=document.text).id
@@ -0,0 +1,79 @@
+import pickle
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+import src.embeddings
+from src.classifiers import (
+    EmbeddingClassifier,
+    MultiConceptEmbeddingClassifier,
+    combine_classifiers,
+)
+from src.concept import Concept
+
+
+@pytest.fixture(autouse=True)
+def backbone(monkeypatch):
+    # the encoder only needs the model's name to be unpickled, so nothing is loaded
+    monkeypatch.setattr(
+        src.embeddings,
+        "load_backbone",
+        lambda model_name: ("tokenizer", SimpleNamespace(name_or_path=model_name)),
+    )
+
+
+def legacy_classifier(label: str, concept_embedding: torch.Tensor) -> bytes:
+    """Pickle a classifier with the attributes it had before the encoder was shared"""
+    classifier = EmbeddingClassifier.__new__(EmbeddingClassifier)
+    classifier.__dict__.update(
+        concept=Concept(preferred_label=label),
+        batch_size=8,
+        n_threads=2,
+        tokenizer="tokenizer",
+        model=SimpleNamespace(name_or_path="sentence-transformers/test"),
+        concept_embedding=concept_embedding,
+    )
+    return pickle.dumps(classifier)
+
+
+def test_unpickles_legacy_classifiers_with_a_shared_encoder():
+    classifier = pickle.loads(legacy_classifier("pay", torch.ones(1, 4)))
+
+    assert classifier.encoder.model_name == "sentence-transformers/test"
+    assert classifier.encoder.batch_size == 8
+    assert classifier.encoder.n_threads == 2
+    assert not hasattr(classifier, "model")
+    assert not hasattr(classifier, "tokenizer")
+
+
+def test_normalises_legacy_concept_embeddings():
+    concept_embedding = torch.tensor([3.0, 0.0, 4.0, 0.0], requires_grad=True)
+    classifier = pickle.loads(legacy_classifier("pay", concept_embedding))
+
+    assert classifier.concept_embedding.shape == (1, 4)
+    assert not classifier.concept_embedding.requires_grad
+    assert torch.allclose(
+        classifier.concept_embedding, torch.tensor([[0.6, 0.0, 0.8, 0.0]])
+    )
+
+
+def test_combines_legacy_classifiers():
+    classifiers = [
+        pickle.loads(legacy_classifier("pay", torch.full((1, 4), 2.0))),
+        pickle.loads(legacy_classifier("dismissal", torch.tensor([[0.0, 5, 0, 0]]))),
+    ]
+
+    [combined] = combine_classifiers(classifiers)
+
+    assert isinstance(combined, MultiConceptEmbeddingClassifier)
+    assert torch.allclose(combined.concept_embeddings.norm(dim=1), torch.ones(2))
+
+
+def test_current_classifiers_are_unpickled_unchanged():
+    classifier = pickle.loads(legacy_classifier("pay", torch.ones(1, 4)))
+
+    unpickled = pickle.loads(pickle.dumps(classifier))
+
+    assert unpickled.encoder.model_name == classifier.encoder.model_name
+    assert torch.equal(unpickled.concept_embedding, classifier.concept_embedding)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.embeddings import EmbeddingStore
+
+
+def embeddings(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(tmp_path, "org/model", dimensions=2)
+
+
+def test_looks_up_hits_and_misses(store):
+    store.add(["a", "b"], embeddings([1, 0], [0, 1]))
+
+    found, missing_indices = store.get(["b", "c", "a"])
+
+    assert missing_indices == [1]
+    assert np.array_equal(found, embeddings([0, 1], [0, 0], [1, 0]))
+    assert "a" in store and "c" not in store
+    assert store.directory.name == "org--model"
+
+
+def test_stores_repeated_texts_once(store):
+    store.add(["a", "a", "b"], embeddings([1, 0], [0, 1], [0.5, 0.5]))
+    store.add(["b"], embeddings([9, 9]))
+
+    found, missing_indices = store.get(["a", "b"])
+
+    assert len(store) == 2
+    assert missing_indices == []
+    # the first embedding of a text wins
+    assert np.array_equal(found, embeddings([1, 0], [0.5, 0.5]))
+    assert store.embeddings_path.stat().st_size == 2 * store.row_size
+
+
+def test_picks_up_rows_added_by_another_store(tmp_path, store):
+    other_store = EmbeddingStore(tmp_path, "org/model", dimensions=2)
+    store.get(["a"])
+
+    other_store.add(["a"], embeddings([1, 0]))
+    store.add(["b"], embeddings([0, 1]))
+
+    for reader in (store, other_store):
+        found, missing_indices = reader.get(["a", "b"])
+        assert missing_indices == []
+        assert np.array_equal(found, embeddings([1, 0], [0, 1]))
+
+
+def test_rejects_a_store_with_different_metadata(tmp_path, store):
+    with pytest.raises(ValueError):
+        EmbeddingStore(tmp_path, "org/model", dimensions=3)
+    with pytest.raises(ValueError):
+        EmbeddingStore(tmp_path, "org/model", dimensions=2, dtype="float32")
+
+
+def test_recovers_from_an_interrupted_write(tmp_path, store):
+    store.add(["a"], embeddings([1, 0]))
+    # a write which was interrupted after its rows, but before its keys (or after
+    # part of a key), leaves rows with no key
+    with open(store.embeddings_path, "ab") as f:
+        f.write(embeddings([7, 7], [8, 8]).astype(store.dtype).tobytes())
+    with open(store.keys_path, "a") as f:
+        f.write(store.key("x")[:10])
+
+    store = EmbeddingStore(tmp_path, "org/model", dimensions=2)
+    assert len(store) == 1
+
+    store.add(["b"], embeddings([0, 1]))
+
+    found, missing_indices = store.get(["a", "b", "x"])
+    assert missing_indices == [2]
+    assert np.array_equal(found, embeddings([1, 0], [0, 1], [0, 0]))
+    assert store.embeddings_path.stat().st_size == 2 * store.row_size
+    assert store.keys_path.read_text() == f"{store.key('a')}\n{store.key('b')}\n"
+
+
+def test_rejects_mismatched_texts_and_embeddings(store):
+    with pytest.raises(ValueError):
+        store.add(["a", "b"], embeddings([1, 0]))
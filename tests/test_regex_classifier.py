@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from src.classifiers import MultiConceptRegexClassifier, RegexClassifier
+from src.concept import Concept
+from src.document import Document
+
+words = ["un", "unfair", "union", "dismissal", "pay", "equal", "covid-19", "a", "n/a"]
+
+
+def span_tuples(spans):
+    return sorted(
+        {
+            (span.start_index, span.end_index, span.identifier, span.type)
+            for span in spans
+        }
+    )
+
+
+def per_concept_spans(concepts, document):
+    return [
+        span
+        for concept in concepts
+        for span in RegexClassifier(concept).predict(document)
+    ]
+
+
+def random_phrase(rng: random.Random) -> str:
+    phrase = " ".join(rng.choices(words, k=rng.randint(1, 3)))
+    return phrase.upper() if rng.random() < 0.2 else phrase
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_per_concept_classifiers(seed):
+    rng = random.Random(seed)
+    concepts = [
+        Concept(
+            preferred_label=random_phrase(rng),
+            alternative_labels=[random_phrase(rng) for _ in range(rng.randint(0, 3))],
+        )
+        for _ in range(rng.randint(1, 8))
+    ]
+    separators = [" ", " ", ", ", ". ", "-", "\n", "x"]
+    text = "".join(
+        rng.choice(words) + rng.choice(separators) for _ in range(rng.randint(0, 60))
+    )
+    document = Document(title="test", text=text)
+
+    spans = MultiConceptRegexClassifier(concepts).predict(document)
+
+    assert span_tuples(spans) == span_tuples(per_concept_spans(concepts, document))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_per_concept_classifiers_with_repeated_words(seed):
+    # with only a couple of words, labels often overlap their own next match
+    rng = random.Random(seed)
+    concepts = [
+        Concept(
+            preferred_label=" ".join(rng.choices(["aa", "b"], k=rng.randint(1, 3))),
+            alternative_labels=["aa aa"],
+        )
+        for _ in range(rng.randint(1, 4))
+    ]
+    text = " ".join(rng.choices(["aa", "b", "aa"], k=rng.randint(0, 30)))
+    document = Document(title="test", text=text)
+
+    spans = MultiConceptRegexClassifier(concepts).predict(document)
+
+    assert span_tuples(spans) == span_tuples(per_concept_spans(concepts, document))
+
+
+def test_a_label_does_not_overlap_its_own_matches():
+    concepts = [Concept(preferred_label="aa aa")]
+    document = Document(title="test", text="aa aa aa aa aa")
+
+    spans = MultiConceptRegexClassifier(concepts).predict(document)
+
+    assert span_tuples(spans) == [
+        (0, 5, concepts[0].id, "concept"),
+        (6, 11, concepts[0].id, "concept"),
+    ]
+    assert span_tuples(spans) == span_tuples(per_concept_spans(concepts, document))
+
+
+def test_finds_overlapping_and_nested_labels():
+    concepts = [
+        Concept(preferred_label="unfair dismissal"),
+        Concept(preferred_label="unfair", alternative_labels=["Unfair"]),
+        Concept(preferred_label="dismissal"),
+    ]
+    document = Document(title="test", text="It was an unfair dismissal.")
+
+    spans = MultiConceptRegexClassifier(concepts).predict(document)
+
+    assert span_tuples(spans) == [
+        (10, 16, concepts[1].id, "concept"),
+        (10, 26, concepts[0].id, "concept"),
+        (17, 26, concepts[2].id, "concept"),
+    ]
+
+
+def test_only_matches_whole_words():
+    concepts = [Concept(preferred_label="pay")]
+    document = Document(title="test", text="payment, repay, pay")
+
+    spans = MultiConceptRegexClassifier(concepts).predict(document)
+
+    assert span_tuples(spans) == [(16, 19, concepts[0].id, "concept")]
+
+
+def test_labels_which_differ_by_case_are_matched_once():
+    concept = Concept(preferred_label="pay", alternative_labels=["PAY", "Pay"])
+    document = Document(title="test", text="equal pay")
+
+    spans = MultiConceptRegexClassifier([concept]).predict(document)
+
+    assert len(spans) == 1
+
+
+def test_without_concepts():
+    document = Document(title="test", text="unfair dismissal")
+
+    assert MultiConceptRegexClassifier([]).predict(document) == []
@@ -0,0 +1,166 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+import src.search.registry
+from src.concept import Concept
+from src.search.registry import ConceptRegistry
+
+concepts = [
+    Concept(preferred_label="Unfair dismissal", alternative_labels=["Sacking"]),
+    Concept(preferred_label="Unfair", description="Not based on equal treatment"),
+    Concept(preferred_label="Equal pay", description="Pay for work of equal value"),
+    Concept(preferred_label="Redundancy pay", alternative_labels=["Severance"]),
+    Concept(preferred_label="Disability discrimination"),
+]
+
+
+def save_concepts(directory, concepts):
+    for concept in concepts:
+        concept.save(directory / f"{concept.id}.json")
+
+
+@pytest.fixture
+def registry(tmp_path):
+    save_concepts(tmp_path, concepts)
+    registry = ConceptRegistry(directory=tmp_path)
+    asyncio.run(registry.refresh(force=True))
+    return registry
+
+
+def labels(search_response):
+    return [concept.preferred_label for concept in search_response.results]
+
+
+def test_loads_every_concept(registry):
+    assert len(registry) == len(concepts)
+    assert concepts[0].id in registry
+    assert registry.get_item(concepts[0].id).preferred_label == "Unfair dismissal"
+    with pytest.raises(KeyError):
+        registry.get_item("missing")
+    assert registry.get_items([concepts[1].id, "missing", concepts[1].id]) == [
+        concepts[1]
+    ]
+
+
+@pytest.mark.parametrize(
+    "search_terms, expected_labels",
+    [
+        # exact labels first, then labels which start with the terms
+        ("unfair", ["Unfair", "Unfair dismissal"]),
+        ("UNFAIR  dismissal", ["Unfair dismissal"]),
+        ("sacking", ["Unfair dismissal"]),
+        # then labels with words which start with every term
+        ("pay", ["Equal pay", "Redundancy pay"]),
+        ("dis", ["Disability discrimination", "Unfair dismissal"]),
+        # then descriptions
+        ("equal", ["Equal pay", "Unfair"]),
+        ("treat", ["Unfair"]),
+        ("nothing matches", []),
+    ],
+)
+def test_ranks_matches(registry, search_terms, expected_labels):
+    assert labels(registry.search(search_terms)) == expected_labels
+
+
+def test_finds_concepts_by_id(registry):
+    assert labels(registry.search(concepts[2].id)) == ["Equal pay"]
+
+
+def test_pages_through_every_concept_without_search_terms(registry):
+    first_page = registry.search(None, page=1, page_size=2)
+    second_page = registry.search("  ", page=2, page_size=2)
+
+    assert first_page.total == second_page.total == len(concepts)
+    assert labels(first_page) + labels(second_page) == [
+        "Disability discrimination",
+        "Equal pay",
+        "Redundancy pay",
+        "Unfair",
+    ]
+
+
+def test_refreshes_when_the_directory_changes(tmp_path, registry):
+    assert not asyncio.run(registry.refresh(force=False))
+
+    new_concept = Concept(preferred_label="Whistleblowing")
+    save_concepts(tmp_path, [new_concept])
+    # make sure the change is visible, however coarse the filesystem's timestamps
+    os.utime(tmp_path, ns=(0, 2**62))
+    registry.checked_at = -float("inf")
+
+    assert asyncio.run(registry.refresh())
+    assert new_concept.id in registry
+
+
+def snapshot_engine(monkeypatch, sources, generation=None, stats=None):
+    async def async_scan(elasticsearch, index, query):
+        for source in sources:
+            yield {"_source": source}
+
+    monkeypatch.setattr(src.search.registry.helpers, "async_scan", async_scan)
+    elasticsearch = SimpleNamespace(indices=SimpleNamespace(stats=AsyncMock()))
+    elasticsearch.indices.stats.return_value = stats
+    return SimpleNamespace(
+        elasticsearch=elasticsearch,
+        index_name="concepts",
+        generation=AsyncMock(return_value=generation),
+    )
+
+
+def test_loads_a_snapshot_of_an_index(monkeypatch):
+    sources = [concept.model_dump() for concept in concepts]
+    search_engine = snapshot_engine(monkeypatch, sources, generation="1")
+    registry = ConceptRegistry(search_engine=search_engine, check_interval=0)
+
+    assert asyncio.run(registry.refresh())
+    assert len(registry) == len(concepts)
+    assert not asyncio.run(registry.refresh())
+
+    search_engine.generation.return_value = "2"
+    assert asyncio.run(registry.refresh())
+
+
+def test_falls_back_to_index_stats_without_a_generation(monkeypatch):
+    stats = {
+        "_all": {
+            "primaries": {
+                "docs": {"count": 5},
+                "indexing": {"index_total": 5, "delete_total": 0},
+            }
+        }
+    }
+    search_engine = snapshot_engine(monkeypatch, [], stats=stats)
+    registry = ConceptRegistry(search_engine=search_engine, check_interval=0)
+
+    assert asyncio.run(registry.refresh())
+    assert not asyncio.run(registry.refresh())
+
+    stats["_all"]["primaries"]["indexing"]["index_total"] = 6
+    assert asyncio.run(registry.refresh())
+
+
+def test_keeps_serving_when_the_source_fails(monkeypatch, registry):
+    registry.check_interval = 0
+    monkeypatch.setattr(
+        registry, "_source_version", AsyncMock(side_effect=ConnectionError)
+    )
+
+    async def watch_briefly():
+        watcher = asyncio.create_task(registry.watch())
+        await asyncio.sleep(0.01)
+        watcher.cancel()
+
+    asyncio.run(watch_briefly())
+    assert registry._source_version.await_count > 0
+    assert len(registry) == len(concepts)
+
+
+def test_needs_exactly_one_source(tmp_path):
+    with pytest.raises(ValueError):
+        ConceptRegistry()
+    with pytest.raises(ValueError):
+        ConceptRegistry(directory=tmp_path, search_engine=object())
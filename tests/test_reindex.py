@@ -0,0 +1,128 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+import src.search.core
+from src.document import Document
+from src.search.core import BulkResponse, DocumentSearchEngine, ReindexError
+
+documents = [Document(title="test", text=f"Document {i}") for i in range(3)]
+
+
+@pytest.fixture
+def elasticsearch():
+    elasticsearch = MagicMock()
+    # forcemerge is called through options(), on what is really the same client
+    elasticsearch.options.return_value = elasticsearch
+    elasticsearch.indices.exists_alias.return_value = True
+    elasticsearch.indices.get_alias.return_value = {"documents-old": {}}
+    elasticsearch.indices.get_settings.return_value = {
+        "documents-old": {"settings": {"index": {"number_of_replicas": "2"}}}
+    }
+    return elasticsearch
+
+
+@pytest.fixture
+def bulk_index(monkeypatch):
+    bulk_index = MagicMock(return_value=BulkResponse(n_succeeded=3, errors=[]))
+    monkeypatch.setattr(src.search.core, "bulk_index", bulk_index)
+    return bulk_index
+
+
+@pytest.fixture
+def search_engine(elasticsearch):
+    return DocumentSearchEngine(elasticsearch, create_index=False)
+
+
+def new_index(elasticsearch) -> str:
+    return elasticsearch.indices.create.call_args.kwargs["index"]
+
+
+def indices_calls(elasticsearch):
+    return [
+        name.removeprefix("indices.")
+        for name, _, _ in elasticsearch.mock_calls
+        if name.startswith("indices.")
+    ]
+
+
+def test_loads_without_replicas_then_merges_before_restoring_them(
+    elasticsearch, bulk_index, search_engine
+):
+    response = search_engine.reindex(documents)
+
+    assert response.n_succeeded == 3
+    index = new_index(elasticsearch)
+    settings = elasticsearch.indices.create.call_args.kwargs["settings"]["index"]
+    assert settings["number_of_replicas"] == 0
+    assert settings["refresh_interval"] == "-1"
+    assert all(action["_index"] == index for action in bulk_index.call_args.args[1])
+
+    calls = indices_calls(elasticsearch)
+    assert calls.index("forcemerge") < calls.index("put_settings")
+    assert calls.index("refresh") < calls.index("put_settings")
+    restored = elasticsearch.indices.put_settings.call_args.kwargs["settings"]
+    # the replicas of the index being replaced are kept
+    assert restored["index"]["number_of_replicas"] == 2
+    elasticsearch.indices.update_aliases.assert_called_once_with(
+        actions=[
+            {"add": {"index": index, "alias": "documents"}},
+            {"remove_index": {"index": "documents-old"}},
+        ]
+    )
+    elasticsearch.indices.delete.assert_not_called()
+
+
+def test_bulk_errors_leave_the_alias_alone(elasticsearch, bulk_index, search_engine):
+    bulk_index.return_value = BulkResponse(n_succeeded=2, errors=[{"index": {}}])
+
+    with pytest.raises(ReindexError) as error:
+        search_engine.reindex(documents)
+
+    assert error.value.response.n_succeeded == 2
+    elasticsearch.indices.update_aliases.assert_not_called()
+    elasticsearch.indices.forcemerge.assert_not_called()
+    elasticsearch.indices.delete.assert_called_once_with(
+        index=new_index(elasticsearch), ignore_unavailable=True
+    )
+
+
+@pytest.mark.parametrize("failing_call", ["forcemerge", "update_aliases"])
+def test_failures_delete_the_new_index(
+    elasticsearch, bulk_index, search_engine, failing_call
+):
+    getattr(elasticsearch.indices, failing_call).side_effect = ConnectionError
+
+    with pytest.raises(ConnectionError):
+        search_engine.reindex(documents)
+
+    elasticsearch.indices.delete.assert_called_once_with(
+        index=new_index(elasticsearch), ignore_unavailable=True
+    )
+
+
+def test_can_keep_the_old_indices(elasticsearch, bulk_index, search_engine):
+    search_engine.reindex(documents, delete_old_indices=False, number_of_replicas=1)
+
+    actions = elasticsearch.indices.update_aliases.call_args.kwargs["actions"]
+    assert actions[1] == {"remove": {"index": "documents-old", "alias": "documents"}}
+    restored = elasticsearch.indices.put_settings.call_args.kwargs["settings"]
+    assert restored["index"]["number_of_replicas"] == 1
+
+
+def test_first_rebuild_replaces_a_concrete_index_atomically(
+    elasticsearch, bulk_index, search_engine
+):
+    # before the first rebuild, index_name is a concrete index rather than an alias
+    elasticsearch.indices.exists_alias.return_value = False
+    elasticsearch.indices.exists.return_value = True
+
+    search_engine.reindex(documents)
+
+    elasticsearch.indices.update_aliases.assert_called_once_with(
+        actions=[
+            {"add": {"index": new_index(elasticsearch), "alias": "documents"}},
+            {"remove_index": {"index": "documents"}},
+        ]
+    )
+    elasticsearch.indices.delete.assert_not_called()
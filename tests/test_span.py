@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from src.document import Document
+from src.span import Span, SpanList
+
+spans = [
+    Span(start_index=0, end_index=5, type="page"),
+    Span(start_index=2, end_index=4, identifier="abc", type="concept"),
+    Span(start_index=3, end_index=9, identifier="def", type="concept"),
+    Span(start_index=6, end_index=9),
+]
+
+
+def test_round_trips_spans():
+    span_list = SpanList(spans)
+
+    assert len(span_list) == len(spans)
+    assert list(span_list) == spans
+    assert span_list[1] == spans[1]
+    assert span_list[-1] == spans[-1]
+    assert span_list.to_list() == [span.model_dump() for span in spans]
+    assert SpanList(span_list.to_list()) == span_list
+
+
+def test_stores_each_identifier_once():
+    span_list = SpanList(spans + spans)
+
+    assert span_list.identifier_vocabulary == ["abc", "def"]
+    assert span_list.identifiers == [None, "abc", "def", None] * 2
+
+
+def test_slicing_and_adding():
+    span_list = SpanList(spans)
+
+    assert span_list[1:3] == spans[1:3]
+    assert span_list[:2] + spans[2:] == span_list
+    # slices are copies, so extending one doesn't change the original
+    sliced = span_list[:1]
+    sliced.append(spans[3])
+    assert len(span_list) == len(spans)
+
+
+def test_from_arrays():
+    span_list = SpanList.from_arrays([0, 4], [3, 8], type="concept", identifiers="ab")
+
+    assert span_list == [
+        Span(start_index=0, end_index=3, identifier="a", type="concept"),
+        Span(start_index=4, end_index=8, identifier="b", type="concept"),
+    ]
+
+
+def test_from_columns_keeps_only_the_identifiers_it_uses():
+    span_list = SpanList.from_columns(
+        start_indices=np.array([0, 4]),
+        end_indices=np.array([3, 8]),
+        type_codes=np.array([2, 0]),
+        identifier_codes=np.array([2, -1]),
+        identifier_vocabulary=["a", "b", "c"],
+    )
+
+    assert span_list.identifier_vocabulary == ["c"]
+    assert span_list == [
+        Span(start_index=0, end_index=3, identifier="c", type="concept"),
+        Span(start_index=4, end_index=8),
+    ]
+
+
+@pytest.mark.parametrize(
+    "invalid_span",
+    [
+        {"start_index": 5, "end_index": 2},
+        {"start_index": 0, "end_index": 2, "type": "concept"},
+        {"start_index": 0, "end_index": 2, "type": "chapter"},
+        {"start_index": 0},
+    ],
+)
+def test_rejects_invalid_spans_without_changing_the_list(invalid_span):
+    span_list = SpanList(spans)
+
+    with pytest.raises((ValueError, KeyError)):
+        span_list.extend([spans[0], invalid_span])
+    assert span_list == spans
+
+
+def test_validate_bounds():
+    span_list = SpanList(spans)
+
+    span_list.validate_bounds(9)
+    with pytest.raises(ValueError):
+        span_list.validate_bounds(8)
+
+
+def test_serialises_like_a_list_of_spans():
+    text = "Equal pay for equal work."
+    document = Document(
+        title="test",
+        text=text,
+        concept_spans=[{"start_index": 6, "end_index": 9, "identifier": "abc"}],
+    )
+
+    assert isinstance(document.concept_spans, SpanList)
+    data = document.model_dump()
+    assert data["concept_spans"] == [
+        {"start_index": 6, "end_index": 9, "identifier": "abc", "type": None}
+    ]
+    loaded = Document.model_validate_json(document.model_dump_json())
+    assert loaded.concept_spans == document.concept_spans
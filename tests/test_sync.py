@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+import src.search.core
+from src.corpus import Corpus
+from src.document import Document
+from src.search.core import BulkResponse, DocumentSearchEngine
+
+
+def make_document(i: int, **kwargs) -> Document:
+    return Document(title="test", text=f"Document {i}. It has two sentences.", **kwargs)
+
+
+documents = [make_document(i) for i in range(3)]
+
+
+@pytest.fixture
+def sent_actions(monkeypatch):
+    sent_actions = []
+
+    def bulk_index(elasticsearch, actions, **kwargs):
+        sent_actions.extend(actions)
+        return BulkResponse(n_succeeded=len(sent_actions), errors=[])
+
+    monkeypatch.setattr(src.search.core, "bulk_index", bulk_index)
+    return sent_actions
+
+
+@pytest.fixture
+def index_fingerprints(monkeypatch):
+    index_fingerprints = {}
+
+    def scan(elasticsearch, **kwargs):
+        for id, fingerprint in index_fingerprints.items():
+            yield {"_id": id, "_source": {"fingerprint": fingerprint}}
+
+    monkeypatch.setattr(src.search.core.helpers, "scan", scan)
+    return index_fingerprints
+
+
+@pytest.fixture
+def search_engine():
+    return DocumentSearchEngine(MagicMock(), create_index=False)
+
+
+def test_fingerprint_changes_with_summary_and_concepts():
+    concept_span = {"start_index": 0, "end_index": 8, "type": "concept"}
+
+    assert make_document(0).fingerprint == documents[0].fingerprint
+    assert make_document(0, summary="new").fingerprint != documents[0].fingerprint
+    assert (
+        make_document(
+            0, concept_spans=[{**concept_span, "identifier": "a"}]
+        ).fingerprint
+        != make_document(
+            0, concept_spans=[{**concept_span, "identifier": "b"}]
+        ).fingerprint
+    )
+
+
+def test_only_loads_changed_documents_from_a_corpus(
+    tmp_path, monkeypatch, sent_actions, index_fingerprints, search_engine
+):
+    corpus = Corpus.write(documents, tmp_path / "corpus")
+    index_fingerprints[documents[0].id] = documents[0].fingerprint
+    index_fingerprints[documents[1].id] = "stale"
+    index_fingerprints["removed"] = "removed"
+    loaded_positions = []
+    load = Corpus.load
+    monkeypatch.setattr(
+        Corpus, "load", lambda self, i: loaded_positions.append(i) or load(self, i)
+    )
+
+    response = search_engine.sync(corpus)
+
+    assert loaded_positions == [1, 2]
+    assert (response.n_indexed, response.n_deleted, response.n_unchanged) == (2, 1, 1)
+    indexed = [action for action in sent_actions if "_source" in action]
+    assert [action["_id"] for action in indexed] == [documents[1].id, documents[2].id]
+    assert [action["_source"]["fingerprint"] for action in indexed] == [
+        documents[1].fingerprint,
+        documents[2].fingerprint,
+    ]
+    assert {"_op_type": "delete", "_index": "documents", "_id": "removed"} in (
+        sent_actions
+    )
+    search_engine.elasticsearch.indices.put_mapping.assert_called_once()
+
+
+def test_documents_and_corpora_sync_the_same_fingerprints(
+    tmp_path, sent_actions, index_fingerprints, search_engine
+):
+    search_engine.sync(documents)
+    index_fingerprints.update(
+        {action["_id"]: action["_source"]["fingerprint"] for action in sent_actions}
+    )
+
+    response = search_engine.sync(Corpus.write(documents, tmp_path / "corpus"))
+
+    assert (response.n_indexed, response.n_deleted, response.n_unchanged) == (0, 0, 3)
+    search_engine.elasticsearch.indices.put_mapping.assert_called_once()